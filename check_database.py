@@ -6,6 +6,7 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'terminal_connect.settings')
 django.setup()
 
+from django.db.models import F
 from terminal.models import TerminalLinks, Transaction
 
 print("=" * 60)
@@ -13,7 +14,7 @@ print("TERMINAL LINKS")
 print("=" * 60)
 terminals = TerminalLinks.objects.all()
 print(f"Total: {terminals.count()}\n")
-for term in terminals:
+for term in terminals.iterator(chunk_size=2000):
     print(f"Shop: {term.shop_domain}")
     print(f"  Terminal ID: {term.terminal_id}")
     print(f"  Location: {term.location_id or 'N/A'}")
@@ -23,9 +24,11 @@ for term in terminals:
 print("=" * 60)
 print("TRANSACTIONS")
 print("=" * 60)
-transactions = Transaction.objects.all().order_by('-created_at')
+transactions = Transaction.objects.select_related('location_ref').annotate(
+    receipt_size=F('receipt_record__size')
+).order_by('-created_at')
 print(f"Total: {transactions.count()}\n")
-for txn in transactions:
+for txn in transactions.iterator(chunk_size=2000):
     print(f"Transaction ID: {txn.transaction_id}")
     print(f"  Amount: €{txn.amount / 100:.2f}")
     print(f"  Status: {txn.status}")
@@ -34,6 +37,6 @@ for txn in transactions:
     print(f"  Created: {txn.created_at}")
     if txn.error_msg:
         print(f"  Error: {txn.error_msg}")
-    if txn.receipt:
-        print(f"  Receipt: Yes ({len(txn.receipt)} chars)")
+    if txn.receipt_size:
+        print(f"  Receipt: Yes ({txn.receipt_size} bytes)")
     print()
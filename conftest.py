@@ -14,3 +14,16 @@ def django_db_setup():
 def enable_db_access_for_all_tests(db):
     """Enable database access for all tests"""
     pass
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_memory():
+    """Poll buckets, completion sketches, change versions, open transactions and admission counts live
+    in host shared memory, and cached rows outlive the rolled-back test data: start every test empty"""
+    from terminal import admission, cache, notify, open_transactions, polling, throttle
+    admission.reset()
+    cache.reset()
+    open_transactions.reset()
+    throttle.reset()
+    polling.reset()
+    notify.reset()
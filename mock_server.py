@@ -9,12 +9,22 @@ Usage:
     python mock_server.py --port 8888 --scenario fail
     python mock_server.py --port 8888 --scenario instant
     python mock_server.py --port 8888 --scenario timeout
+
+Callbacks: when a start request carries a CallbackUrl, the final result is
+also pushed there after --callback-delay seconds, signed with
+--callback-secret (default: $TERMINAL_CALLBACK_SECRET).
 """
 
 import argparse
+import hashlib
+import hmac
+import json
+import os
+import threading
 import time
 from datetime import datetime
 from flask import Flask, request, jsonify
+import requests
 
 app = Flask(__name__)
 
@@ -25,6 +35,10 @@ transactions = {}
 scenario = 'success'
 poll_count = {}
 
+# Callback settings
+callback_secret = os.getenv('TERMINAL_CALLBACK_SECRET', '')
+callback_delay = 5.0
+
 
 @app.route('/V2/instore/transactions/start', methods=['POST'])
 def start_transaction():
@@ -54,6 +68,11 @@ def start_transaction():
 
     print(f"[START] Transaction {transaction_id} started on terminal {terminal_id}, amount {amount}, scenario: {scenario}")
 
+    callback_url = request.form.get('CallbackUrl')
+    if callback_url and scenario != 'timeout':
+        delay = 0 if scenario == 'instant' else callback_delay
+        threading.Timer(delay, send_callback, args=(callback_url, transaction_id)).start()
+
     return jsonify({
         'transactionId': transaction_id,
         'status': 'started',
@@ -189,18 +208,51 @@ Thank you for your payment!
 """
 
 
+def send_callback(callback_url, transaction_id):
+    """Push the final result of a transaction, signed like the real service expects"""
+    txn = transactions[transaction_id]
+    if txn.get('scenario') == 'fail':
+        txn['status'] = 'failed'
+        txn['errorMsg'] = 'External Equipment Cancellation'
+    else:
+        txn['status'] = 'success'
+        txn['receipt'] = generate_receipt(transaction_id, txn['amount'])
+
+    body = json.dumps({
+        'transactionId': transaction_id,
+        'status': txn['status'],
+        'amount': txn['amount'],
+        'terminal': txn['terminal'],
+        'errorMsg': txn.get('errorMsg'),
+        'receipt': txn.get('receipt')
+    }).encode('utf-8')
+    timestamp = str(int(time.time()))
+    signature = hmac.new(callback_secret.encode('utf-8'), f'{timestamp}.'.encode('utf-8') + body, hashlib.sha256)
+
+    try:
+        response = requests.post(callback_url, data=body, timeout=10, headers={
+            'Content-Type': 'application/json',
+            'X-Callback-Timestamp': timestamp,
+            'X-Callback-Signature': f'sha256={signature.hexdigest()}'
+        })
+        print(f"[CALLBACK] Transaction {transaction_id} -> {callback_url}: {response.status_code}")
+    except requests.RequestException as e:
+        print(f"[CALLBACK] Transaction {transaction_id} -> {callback_url} failed: {e}")
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'scenario': scenario,
-        'transactions': len(transactions)
+        'transactions': len(transactions),
+        'poll_counts': len(poll_count)
     }), 200
 
 
 def main():
-    global scenario
+    global scenario, callback_secret, callback_delay
 
     parser = argparse.ArgumentParser(description='Mock Pin Vandaag Server')
     parser.add_argument('--port', type=int, default=8888,
@@ -209,8 +261,15 @@ def main():
                         choices=['success', 'fail', 'instant', 'timeout'],
                         help='Test scenario to simulate (default: success)')
 
+    parser.add_argument('--callback-secret', type=str, default=callback_secret,
+                        help='Secret to sign callbacks with (default: $TERMINAL_CALLBACK_SECRET)')
+    parser.add_argument('--callback-delay', type=float, default=callback_delay,
+                        help='Seconds until the result is pushed to CallbackUrl (default: 5)')
+
     args = parser.parse_args()
     scenario = args.scenario
+    callback_secret = args.callback_secret
+    callback_delay = args.callback_delay
 
     print(f"""
 =====================================
@@ -218,6 +277,7 @@ def main():
 =====================================
 Port: {args.port}
 Scenario: {args.scenario}
+Callbacks: pushed {args.callback_delay}s after start when CallbackUrl is sent{'' if callback_secret else ' (unsigned, no secret set)'}
 
 Scenarios:
   success  - Returns started, then success after 3 polls
@@ -1,10 +1,85 @@
 from django.contrib import admin
-from .models import TerminalLinks, Transaction
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import ValidationError
+from django.db.models import OuterRef, Subquery
+from .models import TerminalHealthCheck, TerminalLinks, Transaction, TransactionArchive
+from .shards import shard_aliases, shard_scope
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """Shard selector of the change lists; only shown with TERMINAL_SHARD_URLS set"""
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        aliases = shard_aliases()
+        return [(alias, alias) for alias in aliases] if len(aliases) > 1 else []
+
+    def queryset(self, request, queryset):
+        if self.value() in shard_aliases():
+            return queryset.using(self.value())
+        return queryset
+
+    def choices(self, changelist):
+        # One shard at a time: there is no "All", and no shard picked means 'default'
+        current = self.value() or 'default'
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': current == alias,
+                'query_string': changelist.get_query_string({self.parameter_name: alias}),
+                'display': title,
+            }
+
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    """
+    Admin of a sharded model
+
+    The change list reads the shard picked with ShardListFilter, the object
+    pages the shard holding the object (ids are unique across shards). Each
+    view runs and renders inside that shard's scope, so related-object
+    choices and the list filters come from the same shard.
+    """
+
+    def get_list_filter(self, request):
+        return (ShardListFilter, *super().get_list_filter(request))
+
+    def object_shard(self, object_id):
+        """Shard holding the object with primary key `object_id`, 'default' if none"""
+        for alias in shard_aliases():
+            try:
+                if self.model._default_manager.using(alias).filter(pk=unquote(object_id)).exists():
+                    return alias
+            except (ValidationError, ValueError):
+                break
+        return 'default'
+
+    def in_shard(self, alias, view, *args, **kwargs):
+        with shard_scope(alias):
+            response = view(*args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+    def changelist_view(self, request, extra_context=None):
+        alias = request.GET.get(ShardListFilter.parameter_name)
+        alias = alias if alias in shard_aliases() else None
+        return self.in_shard(alias, super().changelist_view, request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        alias = self.object_shard(object_id) if object_id else None
+        return self.in_shard(alias, super().changeform_view, request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        return self.in_shard(self.object_shard(object_id), super().delete_view, request, object_id, extra_context)
+
+    def history_view(self, request, object_id, extra_context=None):
+        return self.in_shard(self.object_shard(object_id), super().history_view, request, object_id, extra_context)
 
 
 @admin.register(TerminalLinks)
-class TerminalLinksAdmin(admin.ModelAdmin):
-    list_display = ('shop_domain', 'terminal_id', 'location_id', 'staff_member_id', 'created_at')
+class TerminalLinksAdmin(ShardedModelAdmin):
+    list_display = ('shop_domain', 'terminal_id', 'location_id', 'staff_member_id', 'health', 'created_at')
     list_filter = ('shop_domain', 'created_at')
     search_fields = ('shop_domain', 'terminal_id', 'location_id', 'staff_member_id', 'user_id', 'shop_id')
     readonly_fields = ('created_at', 'updated_at')
@@ -20,13 +95,43 @@ class TerminalLinksAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        latest = TerminalHealthCheck.objects.filter(terminal_link=OuterRef('pk')).order_by('-checked_at')
+        return super().get_queryset(request).annotate(
+            last_reachable=Subquery(latest.values('reachable')[:1]),
+            last_latency_ms=Subquery(latest.values('latency_ms')[:1]),
+        )
+
+    @admin.display(description='Health')
+    def health(self, obj):
+        if obj.is_demo or obj.last_reachable is None:
+            return '-'
+        if not obj.last_reachable:
+            return 'offline'
+        return f"online ({obj.last_latency_ms} ms)"
+
+
+@admin.register(TerminalHealthCheck)
+class TerminalHealthCheckAdmin(ShardedModelAdmin):
+    list_display = ('terminal_link', 'checked_at', 'reachable', 'latency_ms', 'error')
+    list_filter = ('reachable', 'checked_at')
+    search_fields = ('terminal_link__terminal_id', 'terminal_link__shop_domain')
+    date_hierarchy = 'checked_at'
+    list_select_related = ('terminal_link',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(ShardedModelAdmin):
     list_display = ('transaction_id', 'status', 'amount', 'shop_domain', 'location_id', 'created_at')
     list_filter = ('status', 'shop_domain', 'created_at')
-    search_fields = ('transaction_id', 'shop_domain', 'location_id', 'staff_member_id')
-    readonly_fields = ('created_at', 'updated_at')
+    search_fields = ('transaction_id', 'shop_domain', 'location_ref__value', 'staff_ref__value')
+    readonly_fields = ('location_id', 'staff_member_id', 'receipt', 'created_at', 'updated_at')
     fieldsets = (
         ('Transaction Information', {
             'fields': ('transaction_id', 'status', 'amount', 'terminal_link')
@@ -44,4 +149,19 @@ class TransactionAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related('terminal_link')
+        return qs.select_related('terminal_link', 'location_ref', 'staff_ref')
+
+
+@admin.register(TransactionArchive)
+class TransactionArchiveAdmin(ShardedModelAdmin):
+    list_display = ('transaction_id', 'status', 'amount', 'shop_domain', 'location_id', 'created_at', 'archived_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('transaction_id', 'shop_domain')
+    readonly_fields = ('receipt',)
+    exclude = ('receipt_compressed',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
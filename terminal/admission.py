@@ -0,0 +1,149 @@
+"""
+Priority admission control
+
+Requests are classed by path: payment (POS start/status, receipts, Pin
+Vandaag callbacks), low (dashboard, exports, admin) and normal (everything
+else). In-flight requests are counted per class across all workers on the
+host; when the total reaches a class's share of TERMINAL_ADMISSION_CAPACITY
+new requests of that class get a 503 with Retry-After. Payments are never
+shed, so the capacity above the low and normal shares stays reserved for
+them during spikes.
+
+Each worker owns one record of a small memory-mapped file (claimed with an
+fcntl lock that the kernel drops when the worker dies) and only ever writes
+that record, so counting needs no cross-process locking and the counts of a
+killed worker are cleared by whichever worker claims its record next.
+"""
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+
+from terminal import metrics
+
+logger = logging.getLogger(__name__)
+
+PAYMENT = 0
+NORMAL = 1
+LOW = 2
+PRIORITY_NAMES = ('payment', 'normal', 'low')
+
+PAYMENT_PATHS = ('/api/terminal/start', '/api/terminal/status', '/api/terminal/receipt/', '/api/terminal/callback')
+LOW_PRIORITY_PATHS = ('/admin/', '/api/terminal/app/', '/api/terminal/transactions/', '/api/terminal/stats')
+
+
+def classify(path):
+    """Priority of a request path"""
+    if path.startswith(PAYMENT_PATHS):
+        return PAYMENT
+    if path.startswith(LOW_PRIORITY_PATHS):
+        return LOW
+    return NORMAL
+
+
+class InFlightCounters:
+    """
+    Per-worker in-flight counts (one int32 per priority) in a shared file
+
+    Args:
+        path: File holding one record per worker
+        workers: Maximum number of workers on the host
+    """
+
+    record = struct.Struct('<iii')
+
+    def __init__(self, path, workers):
+        self.path = path
+        self.workers = workers
+        self._pid = None
+        self._map = None
+        self._slot = None
+        self._thread_lock = threading.Lock()
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.workers * self.record.size
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._map = mmap.mmap(fd, size)
+        self._slot = None
+        for index in range(self.workers):
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, self.record.size, index * self.record.size, os.SEEK_SET)
+            except OSError:
+                continue
+            # Whatever is left here belonged to a worker that died mid-request
+            self.record.pack_into(self._map, index * self.record.size, 0, 0, 0)
+            self._slot = index
+            break
+        else:
+            logger.warning(f"All {self.workers} admission records are taken, requests of pid {os.getpid()} are not counted")
+        self._pid = os.getpid()
+
+    def totals(self):
+        """In-flight requests per priority, summed over all workers"""
+        self._open()
+        totals = [0, 0, 0]
+        for counts in self.record.iter_unpack(self._map):
+            for priority, count in enumerate(counts):
+                totals[priority] += count
+        return totals
+
+    def add(self, priority, amount):
+        self._open()
+        if self._slot is None:
+            return
+        offset = self._slot * self.record.size
+        with self._thread_lock:
+            counts = list(self.record.unpack_from(self._map, offset))
+            counts[priority] += amount
+            self.record.pack_into(self._map, offset, *counts)
+
+    def clear(self):
+        self._open()
+        self._map[:] = bytes(len(self._map))
+
+
+in_flight = InFlightCounters(
+    os.path.join(settings.TERMINAL_SHARED_MEMORY_DIR, 'admission.bin'),
+    workers=settings.TERMINAL_ADMISSION_MAX_WORKERS,
+)
+
+
+def limit_for(priority):
+    """Total in-flight requests at which `priority` is shed (None: never)"""
+    if priority == PAYMENT:
+        return None
+    share = settings.TERMINAL_ADMISSION_LOW_SHARE if priority == LOW else settings.TERMINAL_ADMISSION_NORMAL_SHARE
+    return settings.TERMINAL_ADMISSION_CAPACITY * share
+
+
+def enter(priority):
+    """
+    Admit a request and count it as in flight
+
+    Returns:
+        bool: False if the request must be shed; only admitted requests must
+        call leave()
+    """
+    limit = limit_for(priority)
+    if limit is not None and sum(in_flight.totals()) >= limit:
+        metrics.increment('terminal_admission_shed_total', priority=PRIORITY_NAMES[priority])
+        return False
+    in_flight.add(priority, 1)
+    return True
+
+
+def leave(priority):
+    in_flight.add(priority, -1)
+
+
+def reset():
+    in_flight.clear()
@@ -1,5 +1,20 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
+
+
+def _reserve_shard_ids(sender, using, **kwargs):
+    from terminal.shards import reserve_id_ranges, shard_aliases
+
+    if using in shard_aliases():
+        reserve_id_ranges(using)
 
 
 class TerminalConfig(AppConfig):
     name = 'terminal'
+
+    def ready(self):
+        from terminal.idempotency import check_idempotency_backend
+
+        post_migrate.connect(_reserve_shard_ids, sender=self)
+        checks.register(check_idempotency_backend)
@@ -0,0 +1,121 @@
+"""
+Upstream concurrency bulkheads per shop and per API key
+
+Every Pin Vandaag call holds one slot of its shop and one slot of its API
+key. A slot is an exclusive flock on a small file in TERMINAL_BULKHEAD_DIR,
+so the limit is shared by all workers on the host and a slot is freed by the
+kernel when a worker dies. A request that finds all slots taken polls for up
+to TERMINAL_BULKHEAD_QUEUE_SECONDS and then fails with BulkheadFull, so a
+single shop can never hold every worker inside slow upstream calls.
+
+Health probes hold probe slots of their shop instead (probe_bulkhead), so a
+probe run never takes a slot a payment could have used.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.02
+
+
+class BulkheadFull(Exception):
+    """All upstream slots of a shop or API key stayed taken for the queue time"""
+
+    def __init__(self, kind, name):
+        super().__init__(f"All upstream slots for {kind} {name} are in use")
+        self.kind = kind
+        self.name = name
+
+
+def _slot_paths(kind, name, slots):
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]
+    return [os.path.join(settings.TERMINAL_BULKHEAD_DIR, f"{kind}-{digest}-{i}.lock") for i in range(slots)]
+
+
+def _try_lock(path):
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+@contextmanager
+def _slot(kind, name, slots, deadline):
+    paths = _slot_paths(kind, name, slots)
+    while True:
+        # Random order spreads workers over the slots instead of all racing for slot 0
+        for path in random.sample(paths, len(paths)):
+            fd = _try_lock(path)
+            if fd is not None:
+                break
+        else:
+            if time.monotonic() >= deadline:
+                # Shops are named in logs, API keys are not
+                logger.warning(f"Bulkhead full for {kind} {name if kind == 'shop' else '***'}")
+                raise BulkheadFull(kind, name if kind == 'shop' else '***')
+            time.sleep(POLL_INTERVAL * (0.5 + random.random()))
+            continue
+        break
+    try:
+        yield
+    finally:
+        # Closing the descriptor releases the flock
+        os.close(fd)
+
+
+@contextmanager
+def bulkhead(shop_domain=None, api_key=None):
+    """
+    Hold an upstream slot for the shop and for the API key
+
+    Args:
+        shop_domain: Shop making the call (optional)
+        api_key: Pin Vandaag API key used for the call (optional)
+
+    Raises:
+        BulkheadFull: If no slot frees up within TERMINAL_BULKHEAD_QUEUE_SECONDS
+    """
+    if not settings.TERMINAL_BULKHEAD_ENABLED:
+        yield
+        return
+
+    os.makedirs(settings.TERMINAL_BULKHEAD_DIR, exist_ok=True)
+    deadline = time.monotonic() + settings.TERMINAL_BULKHEAD_QUEUE_SECONDS
+    with ExitStack() as stack:
+        if shop_domain:
+            stack.enter_context(_slot('shop', shop_domain, settings.TERMINAL_BULKHEAD_SHOP_SLOTS, deadline))
+        if api_key:
+            stack.enter_context(_slot('key', api_key, settings.TERMINAL_BULKHEAD_KEY_SLOTS, deadline))
+        yield
+
+
+@contextmanager
+def probe_bulkhead(shop_domain):
+    """
+    Hold one of the shop's probe slots
+
+    Probes have TERMINAL_BULKHEAD_PROBE_SLOTS slots per shop of their own and
+    wait at most TERMINAL_PROBE_TIMEOUT for one; payment slots are left alone.
+
+    Raises:
+        BulkheadFull: If no probe slot frees up in time
+    """
+    if not settings.TERMINAL_BULKHEAD_ENABLED:
+        yield
+        return
+
+    os.makedirs(settings.TERMINAL_BULKHEAD_DIR, exist_ok=True)
+    deadline = time.monotonic() + settings.TERMINAL_PROBE_TIMEOUT
+    with _slot('probe', shop_domain or '', settings.TERMINAL_BULKHEAD_PROBE_SLOTS, deadline):
+        yield
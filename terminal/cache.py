@@ -0,0 +1,317 @@
+"""
+Cache layer for routing, terminal links and idempotency
+
+One setting, TERMINAL_CACHE_BACKEND, picks where cached values live:
+
+    'local'   Per-process LRU (default). Nothing is shared between workers.
+    'sqlite'  SQLite file at TERMINAL_CACHE_PATH, shared by all workers on
+              the host without any external service.
+    'django'  The Django cache TERMINAL_CACHE_ALIAS, e.g. Redis or Memcached
+              configured in CACHES, shared across hosts.
+
+Every user gets its own namespace from `get_cache`. Values must be picklable
+and are treated as immutable.
+
+`Cache.get_or_compute` protects expensive values from stampedes: entries
+are recomputed a little before they expire, with a probability that grows
+as expiry nears and with the time the value took to compute (XFetch), and
+only the worker holding the key's lock recomputes while the others keep
+serving the old value or wait briefly for the new one.
+"""
+import math
+import os
+import pickle
+import random
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from terminal.diagnostics import register_store
+
+LOCK_POLL_INTERVAL = 0.02
+# SQLite culls expired and surplus entries once per this many writes
+CULL_EVERY = 200
+
+_caches = []
+
+
+class Cache(ABC):
+    """
+    Interface of a cache backend
+
+    Backends implement get, set, add, delete and clear; TTLs are seconds.
+    """
+
+    @abstractmethod
+    def get(self, key, default=None):
+        pass
+
+    @abstractmethod
+    def set(self, key, value, ttl):
+        pass
+
+    @abstractmethod
+    def add(self, key, value, ttl):
+        """Set `key` only if it is absent; returns True if it was set"""
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    def get_or_compute(self, key, compute, ttl, beta=1.0):
+        """
+        Cached value of `key`, computed by `compute()` when missing or due
+
+        Args:
+            key: Cache key
+            compute: Callable returning the value (may return None)
+            ttl: Seconds the value stays valid
+            beta: Eagerness of early recomputes (1.0 is the XFetch default)
+        """
+        entry = self.get(key)
+        now = time.time()
+        if entry is not None:
+            value, delta, expires_at = entry
+            # -log(u) is exponentially distributed, so recomputes cluster just before expiry
+            if now - delta * beta * math.log(1.0 - random.random()) < expires_at:
+                return value
+            if not self.add(f'lock:{key}', 1, settings.TERMINAL_CACHE_LOCK_SECONDS):
+                return value
+        elif not self.add(f'lock:{key}', 1, settings.TERMINAL_CACHE_LOCK_SECONDS):
+            # Someone else is computing it; wait for their result, then give up waiting
+            deadline = now + settings.TERMINAL_CACHE_LOCK_SECONDS
+            while time.time() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                entry = self.get(key)
+                if entry is not None:
+                    return entry[0]
+            return compute()
+
+        try:
+            start = time.time()
+            value = compute()
+            delta = time.time() - start
+            self.set(key, (value, delta, start + delta + ttl), ttl)
+            return value
+        finally:
+            self.delete(f'lock:{key}')
+
+
+class LocalCache(Cache):
+    """Thread-safe per-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def approx_bytes(self):
+        with self._lock:
+            return sum(sys.getsizeof(key) + sys.getsizeof(entry[1]) for key, entry in self._entries.items())
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry and entry[0] <= now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _store(self, key, value, ttl, now):
+        self._entries[key] = (now + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._store(key, value, ttl, time.time())
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._store(key, value, ttl, now)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(Cache):
+    """
+    Cache in a SQLite file, shared by every worker on the host
+
+    Args:
+        path: Database file (created on first use)
+        namespace: Key prefix of this cache within the file
+        max_entries: Entries kept per namespace when culling
+    """
+
+    def __init__(self, path, namespace, max_entries):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _key(self, key):
+        return f'{self.namespace}:{key}'
+
+    def __len__(self):
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM cache WHERE key >= ? AND key < ? AND expires_at > ?',
+            (f'{self.namespace}:', f'{self.namespace};', time.time())
+        ).fetchone()[0]
+
+    def get(self, key, default=None):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (self._key(key), time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (self._key(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + ttl)
+        )
+        self._maybe_cull()
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM cache WHERE key = ? AND expires_at <= ?', (self._key(key), now))
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (self._key(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + ttl)
+            ).rowcount == 1
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return added
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (self._key(key),))
+
+    def clear(self):
+        self._connection().execute(
+            'DELETE FROM cache WHERE key >= ? AND key < ?', (f'{self.namespace}:', f'{self.namespace};')
+        )
+
+    def _maybe_cull(self):
+        self._writes += 1
+        if self._writes % CULL_EVERY:
+            return
+        connection = self._connection()
+        connection.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+        # Keys sort by namespace, ';' follows ':' so the range covers exactly this namespace
+        connection.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache WHERE key >= ? AND key < ? '
+            'ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+            (f'{self.namespace}:', f'{self.namespace};', self.max_entries)
+        )
+
+
+class DjangoCache(Cache):
+    """
+    A Django cache (CACHES[alias]), e.g. Redis shared by several hosts
+
+    clear() clears the whole Django cache, not just this namespace.
+    """
+
+    def __init__(self, alias, namespace):
+        from django.core.cache import caches
+
+        self._cache = caches[alias]
+        self.namespace = namespace
+
+    def _key(self, key):
+        return f'terminal:{self.namespace}:{key}'
+
+    def get(self, key, default=None):
+        return self._cache.get(self._key(key), default)
+
+    def set(self, key, value, ttl):
+        self._cache.set(self._key(key), value, timeout=ttl)
+
+    def add(self, key, value, ttl):
+        return self._cache.add(self._key(key), value, timeout=ttl)
+
+    def delete(self, key):
+        self._cache.delete(self._key(key))
+
+    def clear(self):
+        self._cache.clear()
+
+
+def get_cache(namespace, max_entries):
+    """
+    Cache for one user (routing, terminal links, idempotency) on the configured backend
+
+    Args:
+        namespace: Short name, keeps keys of different users apart
+        max_entries: Bound for the local and SQLite backends
+
+    Raises:
+        ImproperlyConfigured: If TERMINAL_CACHE_BACKEND is not a known backend
+    """
+    backend = settings.TERMINAL_CACHE_BACKEND
+    if backend == 'local':
+        cache = LocalCache(max_entries)
+        register_store(f'cache.{namespace}', cache)
+    elif backend == 'sqlite':
+        cache = SQLiteCache(settings.TERMINAL_CACHE_PATH, namespace, max_entries)
+    elif backend == 'django':
+        cache = DjangoCache(settings.TERMINAL_CACHE_ALIAS, namespace)
+    else:
+        raise ImproperlyConfigured(f"Unknown TERMINAL_CACHE_BACKEND {backend!r}, expected 'local', 'sqlite' or 'django'")
+    _caches.append(cache)
+    return cache
+
+
+def reset():
+    for cache in _caches:
+        cache.clear()
@@ -0,0 +1,175 @@
+"""
+Pushed transaction results from Pin Vandaag
+
+Start requests carry TERMINAL_CALLBACK_URL as CallbackUrl, and the provider
+POSTs the result there when the payment completes. A callback must be signed
+with the shared secret:
+
+    X-Callback-Timestamp: <unix seconds>
+    X-Callback-Signature: sha256=<hex HMAC-SHA256 of "<timestamp>." + body>
+
+Callbacks older than TERMINAL_CALLBACK_MAX_SKEW_SECONDS are rejected, so a
+captured request cannot be replayed later.
+"""
+import hashlib
+import hmac
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from terminal.models import Transaction
+from terminal.notify import publish
+from terminal.services import apply_status_update, parse_status_response
+from terminal.shards import shard_aliases, shard_scope
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_HEADER = 'X-Callback-Timestamp'
+SIGNATURE_HEADER = 'X-Callback-Signature'
+
+
+class CallbackError(Exception):
+    """A callback that cannot be applied; carries the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sign_callback(body, timestamp, secret):
+    """
+    Signature header value for a callback body
+
+    Args:
+        body: Raw request body (bytes)
+        timestamp: Unix timestamp sent in X-Callback-Timestamp
+        secret: Shared callback secret
+    """
+    digest = hmac.new(secret.encode('utf-8'), f'{timestamp}.'.encode('utf-8') + body, hashlib.sha256)
+    return f'sha256={digest.hexdigest()}'
+
+
+def verify_callback(body, timestamp, signature, now=None):
+    """
+    Check a callback's signature and age
+
+    Returns:
+        bool: True if the callback is authentic and fresh
+    """
+    secret = settings.TERMINAL_CALLBACK_SECRET
+    if not secret or not timestamp or not signature:
+        return False
+    try:
+        age = abs((time.time() if now is None else now) - int(timestamp))
+    except ValueError:
+        return False
+    if age > settings.TERMINAL_CALLBACK_MAX_SKEW_SECONDS:
+        logger.warning(f"Callback rejected, timestamp is {age}s off")
+        return False
+    return hmac.compare_digest(sign_callback(body, timestamp, secret), signature)
+
+
+def callback_transaction_id(payload):
+    nested = payload.get('transaction') if isinstance(payload.get('transaction'), dict) else {}
+    return (payload.get('transactionId') or payload.get('transaction_id')
+            or nested.get('transactionId') or nested.get('transaction_id'))
+
+
+def matching_transactions(queryset, transaction_id, terminal_id):
+    """
+    Transactions a callback can refer to
+
+    Transaction ids are only unique per terminal, so a callback naming its
+    terminal only matches that terminal's rows (rows without a terminal link
+    always match).
+    """
+    queryset = queryset.filter(transaction_id=transaction_id)
+    if terminal_id:
+        queryset = queryset.filter(Q(terminal_link__isnull=True) | Q(terminal_link__terminal_id=str(terminal_id)))
+    return queryset
+
+
+def transaction_shard(transaction_id, terminal_id=None):
+    """
+    Shard holding a transaction; callbacks carry no shop domain to hash
+
+    Raises:
+        CallbackError: If the transaction is found on more than one shard
+    """
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+    found = [
+        alias for alias in aliases
+        if matching_transactions(Transaction.objects.using(alias), transaction_id, terminal_id).exists()
+    ]
+    if len(found) > 1:
+        raise CallbackError('Transaction is ambiguous', status=409)
+    return found[0] if found else None
+
+
+def apply_callback(payload):
+    """
+    Apply a pushed result with the same rules as a status poll
+
+    A result for a transaction that is already final is acknowledged but not
+    applied again, so redelivered callbacks are harmless. The one exception is
+    a 'timeout' the sweeper inferred locally: Pin Vandaag's own final result
+    replaces it.
+
+    Returns:
+        tuple: (transaction, applied)
+
+    Raises:
+        CallbackError: If the payload does not match exactly one transaction
+    """
+    transaction_id = callback_transaction_id(payload)
+    if not transaction_id:
+        raise CallbackError('transactionId is required')
+
+    payment_status, error_msg, receipt = parse_status_response(payload)
+    terminal_id = payload.get('terminal')
+    now = timezone.now()
+
+    alias = transaction_shard(str(transaction_id), terminal_id)
+    if alias is None:
+        raise CallbackError('Transaction not found', status=404)
+
+    with shard_scope(alias), db_transaction.atomic(using=alias):
+        transactions = list(
+            matching_transactions(
+                Transaction.objects.using(alias).select_for_update(of=('self',)).select_related('terminal_link'),
+                str(transaction_id), terminal_id
+            ).order_by('pk')[:2]
+        )
+        if not transactions:
+            if terminal_id and Transaction.objects.using(alias).filter(transaction_id=str(transaction_id)).exists():
+                raise CallbackError('Terminal does not match transaction')
+            raise CallbackError('Transaction not found', status=404)
+        if len(transactions) > 1:
+            raise CallbackError('Transaction is ambiguous', status=409)
+        transaction = transactions[0]
+
+        # Only a final push makes polls stop asking Pin Vandaag; after an
+        # intermediate one the final push may still be lost
+        final = payment_status in Transaction.FINAL_STATUSES
+        overrides_timeout = transaction.status == 'timeout' and final and payment_status != 'timeout'
+        if transaction.status in Transaction.FINAL_STATUSES and not overrides_timeout:
+            if final:
+                Transaction.objects.using(alias).filter(pk=transaction.pk).update(pushed_at=now)
+            applied = False
+        else:
+            if final:
+                transaction.pushed_at = now
+            if overrides_timeout:
+                logger.warning(f"Pushed {payment_status} replaces swept timeout of {transaction.transaction_id}")
+            apply_status_update(transaction, payment_status, error_msg, receipt)
+            applied = True
+
+    publish(transaction.transaction_id)
+    logger.info(f"Callback for {transaction.transaction_id}: {payment_status} (applied={applied})")
+    return transaction, applied
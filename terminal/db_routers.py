@@ -0,0 +1,63 @@
+"""
+Database routing for dashboard and admin reads
+
+With TERMINAL_DATABASE_MODE = 'replica', read-only dashboard, export, stats
+and admin requests (see ReplicaRoutingMiddleware) read from the 'replica'
+database; everything else, and every write, uses 'default'.
+
+Reads stay on the primary once the request has written (read-your-writes),
+and for TERMINAL_REPLICA_STICKY_SECONDS afterwards the client carries a
+cookie that keeps its following requests on the primary too, so a redirect
+after an admin save never shows the replica's older data.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+REPLICA = 'replica'
+
+
+class RoutingState:
+    """Routing decisions of one request or block of code"""
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+_state = ContextVar('terminal_db_routing', default=None)
+
+
+@contextmanager
+def replica_reads(use_replica=True):
+    """
+    Route reads inside the block to the replica until the block writes
+
+    Yields:
+        RoutingState: Tells afterwards whether the block wrote
+    """
+    state = RoutingState(use_replica)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    """Sends reads to the replica inside replica_reads(), all writes to the primary"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.use_replica and not state.wrote:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replica rows are copies of primary rows
+        return True
@@ -0,0 +1,142 @@
+"""
+In-process memory diagnostics for long-running workers
+
+Known in-process stores register themselves with `register_store` so their
+sizes show up in every report. tracemalloc is only started on request, so
+workers pay nothing until an operator asks for a snapshot.
+"""
+import gc
+import os
+import sys
+import threading
+import tracemalloc
+
+_stores = {}
+_snapshots = {}
+_lock = threading.Lock()
+
+IGNORED_TRACE_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>')
+
+
+def register_store(name, store):
+    """
+    Register an in-process cache or store for size reporting
+
+    Args:
+        name: Dotted name shown in reports (e.g. 'mock_views.MOCK_TRANSACTIONS')
+        store: A sized container, or a callable returning one
+    """
+    _stores[name] = store
+
+
+def _shallow_size(container):
+    """Size of a container plus its direct keys/values, in bytes"""
+    size = sys.getsizeof(container)
+    if isinstance(container, dict):
+        for key, value in list(container.items()):
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+    elif isinstance(container, (list, tuple, set, frozenset)):
+        for item in list(container):
+            size += sys.getsizeof(item)
+    return size
+
+
+def store_sizes():
+    """Entry counts and approximate sizes of all registered stores"""
+    sizes = {}
+    for name, store in sorted(_stores.items()):
+        if callable(store) and not hasattr(store, '__len__'):
+            store = store()
+        if hasattr(store, 'approx_bytes'):
+            approx_bytes = store.approx_bytes()
+        else:
+            approx_bytes = _shallow_size(store)
+        sizes[name] = {
+            'entries': len(store),
+            'approx_bytes': approx_bytes,
+        }
+    return sizes
+
+
+def _filter(snapshot):
+    return snapshot.filter_traces([
+        tracemalloc.Filter(False, filename) for filename in IGNORED_TRACE_FILES
+    ])
+
+
+def _format_stat(stat):
+    frame = stat.traceback[0]
+    entry = {
+        'location': f"{frame.filename}:{frame.lineno}",
+        'size_bytes': stat.size,
+        'count': stat.count,
+    }
+    if hasattr(stat, 'size_diff'):
+        entry['size_diff_bytes'] = stat.size_diff
+        entry['count_diff'] = stat.count_diff
+    return entry
+
+
+def start_tracing(frames=10):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop_tracing():
+    with _lock:
+        _snapshots.clear()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def memory_report(action='snapshot', top=20):
+    """
+    Build a memory report for the current process
+
+    Actions:
+        start:    begin tracing and take a baseline snapshot
+        snapshot: top allocation sites right now
+        diff:     allocation growth since the baseline snapshot
+        reset:    replace the baseline with a fresh snapshot
+        stop:     stop tracing and drop stored snapshots
+
+    Returns:
+        dict: JSON-serializable report
+    """
+    report = {
+        'pid': os.getpid(),
+        'action': action,
+        'tracing': tracemalloc.is_tracing(),
+        'stores': store_sizes(),
+        'gc_objects': len(gc.get_objects()),
+    }
+
+    if action == 'stop':
+        stop_tracing()
+        report['tracing'] = False
+        return report
+
+    if action == 'start':
+        start_tracing()
+
+    if not tracemalloc.is_tracing():
+        report['error'] = "tracemalloc is not running, use action=start first"
+        return report
+
+    report['tracing'] = True
+    current, peak = tracemalloc.get_traced_memory()
+    report['traced_bytes'] = current
+    report['traced_peak_bytes'] = peak
+
+    snapshot = _filter(tracemalloc.take_snapshot())
+    with _lock:
+        if action in ('start', 'reset') or 'baseline' not in _snapshots:
+            _snapshots['baseline'] = snapshot
+        baseline = _snapshots['baseline']
+
+    if action == 'diff':
+        stats = snapshot.compare_to(baseline, 'lineno')
+    else:
+        stats = snapshot.statistics('lineno')
+    report['top'] = [_format_stat(stat) for stat in stats[:top]]
+    return report
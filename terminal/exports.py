@@ -0,0 +1,84 @@
+"""Streaming transaction exports for reconciliation"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from terminal.models import Transaction
+
+EXPORT_COLUMNS = (
+    'transaction_id', 'amount', 'status', 'error_msg', 'shop_domain',
+    'location_ref__value', 'staff_ref__value', 'terminal_link__terminal_id', 'created_at', 'updated_at',
+)
+EXPORT_HEADER = [
+    'transaction_id', 'amount', 'status', 'error_msg', 'shop_domain',
+    'location_id', 'staff_member_id', 'terminal_id', 'created_at', 'updated_at',
+]
+EXPORT_FORMATS = ('csv', 'ndjson')
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def parse_day(value, end=False):
+    """
+    Parse a YYYY-MM-DD string into an aware datetime at the start of that day
+
+    With end=True the start of the following day is returned, so the range
+    created_at >= parse_day(from) and created_at < parse_day(to, end=True)
+    includes the whole `to` day.
+
+    Raises:
+        ValueError: If the value is not a valid date
+    """
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f"Invalid date: {value}")
+    if end:
+        day += timedelta(days=1)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_rows(shop_domain, start=None, end=None):
+    """
+    Iterate transactions of a shop as tuples of EXPORT_COLUMNS
+
+    Uses a server-side cursor (iterator with chunk_size) so memory stays
+    constant regardless of the number of rows.
+    """
+    queryset = Transaction.objects.for_shop(shop_domain)
+    if start:
+        queryset = queryset.filter(created_at__gte=start)
+    if end:
+        queryset = queryset.filter(created_at__lt=end)
+    return queryset.order_by('created_at').values_list(*EXPORT_COLUMNS).iterator(chunk_size=CHUNK_SIZE)
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        yield writer.writerow([
+            value.isoformat() if isinstance(value, datetime) else value for value in row
+        ])
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        record = dict(zip(EXPORT_HEADER, row))
+        record['created_at'] = record['created_at'].isoformat()
+        record['updated_at'] = record['updated_at'].isoformat()
+        yield json.dumps(record) + '\n'
+
+
+def iter_export(rows, export_format):
+    if export_format == 'ndjson':
+        return iter_ndjson(rows)
+    return iter_csv(rows)
@@ -0,0 +1,112 @@
+"""
+WSGI entry point with a lean pipeline for machine-to-machine endpoints
+
+The POS extension, Pin Vandaag callbacks and Shopify webhooks never use
+sessions, auth, messages, CSRF or clickjacking protection; `csrf_exempt` only
+skips the check, the middleware still runs. Paths that POS_URLCONF resolves
+are therefore dispatched to a second handler built from POS_MIDDLEWARE, and
+everything else (admin, embedded app) goes through the regular stack. The
+dispatcher's URL match is handed to the lean handler, so a POS path is
+resolved once.
+
+What the lean stack saves is the skipped middleware. CORS preflights are
+answered by CorsMiddleware before any of those in either stack, so they gain
+nothing and go to the regular stack without paying for the URL match (see
+`manage.py benchmark_pipeline`).
+"""
+import django
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIHandler, get_path_info
+from django.urls import Resolver404, get_resolver, set_urlconf
+from django.utils.module_loading import import_string
+
+# WSGI environ key carrying PosDispatcher's ResolverMatch to LeanWSGIHandler
+RESOLVER_MATCH = 'terminal.resolver_match'
+
+
+class LeanWSGIHandler(WSGIHandler):
+    """
+    WSGIHandler running POS_MIDDLEWARE against POS_URLCONF
+
+    The stack is synchronous only; the middleware in POS_MIDDLEWARE are all
+    sync capable.
+    """
+
+    def load_middleware(self, is_async=False):
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        handler = convert_exception_to_response(self._get_response)
+        for middleware_path in reversed(settings.POS_MIDDLEWARE):
+            try:
+                middleware = import_string(middleware_path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(middleware, 'process_view'):
+                self._view_middleware.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self._template_response_middleware.append(middleware.process_template_response)
+            if hasattr(middleware, 'process_exception'):
+                self._exception_middleware.append(middleware.process_exception)
+            handler = convert_exception_to_response(middleware)
+        self._middleware_chain = handler
+
+    def get_response(self, request):
+        request.urlconf = settings.POS_URLCONF
+        return super().get_response(request)
+
+    def resolve_request(self, request):
+        resolver_match = request.META.get(RESOLVER_MATCH)
+        if resolver_match is None:
+            return super().resolve_request(request)
+        set_urlconf(settings.POS_URLCONF)
+        request.resolver_match = resolver_match
+        return resolver_match
+
+
+class PosDispatcher:
+    """
+    WSGI application sending POS paths to the lean handler
+
+    Args:
+        default: Handler for everything else (full MIDDLEWARE stack)
+        lean: Handler for paths that POS_URLCONF resolves
+    """
+
+    def __init__(self, default, lean):
+        self.default = default
+        self.lean = lean
+        self.resolver = get_resolver(settings.POS_URLCONF)
+
+    def resolve(self, path):
+        """POS_URLCONF match of `path`, None if it is not a POS path"""
+        try:
+            return self.resolver.resolve(path)
+        except Resolver404:
+            return None
+
+    def handler_for(self, path):
+        return self.default if self.resolve(path) is None else self.lean
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] == 'OPTIONS' and 'HTTP_ACCESS_CONTROL_REQUEST_METHOD' in environ:
+            return self.default(environ, start_response)
+        resolver_match = self.resolve(get_path_info(environ))
+        if resolver_match is None:
+            return self.default(environ, start_response)
+        environ[RESOLVER_MATCH] = resolver_match
+        return self.lean(environ, start_response)
+
+
+def get_wsgi_application():
+    """
+    Like django.core.wsgi.get_wsgi_application, with the lean POS pipeline
+    unless TERMINAL_LEAN_POS_PIPELINE is off
+    """
+    django.setup(set_prefix=False)
+    if not settings.TERMINAL_LEAN_POS_PIPELINE:
+        return WSGIHandler()
+    return PosDispatcher(WSGIHandler(), LeanWSGIHandler())
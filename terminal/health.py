@@ -0,0 +1,195 @@
+"""
+Terminal health
+
+Two signals feed payment routing:
+
+- Recent upstream errors: every Pin Vandaag call made for a terminal reports
+  its outcome here. A terminal with TERMINAL_UNHEALTHY_ERRORS failures inside
+  the last TERMINAL_ERROR_WINDOW_SECONDS is considered unhealthy and is tried
+  last; a successful call clears its record.
+- Probes: `manage.py probe_terminals` periodically checks every terminal and
+  stores a TerminalHealthCheck. A terminal whose latest recent check failed
+  is offline and is not routed to at all. A shop's offline set is read from
+  the database at most every TERMINAL_HEALTH_CACHE_SECONDS per process.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from terminal.bulkheads import BulkheadFull
+from terminal.cache import LocalCache
+from terminal.diagnostics import register_store
+from terminal.models import TerminalHealthCheck
+from terminal.services import PinVandaagService, shop_terminal_links
+from terminal.shards import shard_aliases, shard_for
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamErrorTracker:
+    """Thread-safe sliding window of upstream failure times per terminal link"""
+
+    def __init__(self, threshold, window):
+        self.threshold = threshold
+        self.window = window
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._failures)
+
+    def record_failure(self, terminal_link_id):
+        now = time.monotonic()
+        with self._lock:
+            failures = self._failures.setdefault(terminal_link_id, deque(maxlen=self.threshold))
+            failures.append(now)
+
+    def record_success(self, terminal_link_id):
+        with self._lock:
+            self._failures.pop(terminal_link_id, None)
+
+    def recent_failures(self, terminal_link_id):
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            failures = self._failures.get(terminal_link_id)
+            if not failures:
+                return 0
+            while failures and failures[0] < cutoff:
+                failures.popleft()
+            if not failures:
+                del self._failures[terminal_link_id]
+                return 0
+            return len(failures)
+
+    def is_healthy(self, terminal_link_id):
+        return self.recent_failures(terminal_link_id) < self.threshold
+
+    def clear(self):
+        with self._lock:
+            self._failures.clear()
+
+
+tracker = UpstreamErrorTracker(
+    threshold=settings.TERMINAL_UNHEALTHY_ERRORS,
+    window=settings.TERMINAL_ERROR_WINDOW_SECONDS,
+)
+register_store('health.tracker', tracker)
+
+
+def rank_by_health(terminals):
+    """Order terminals healthy first, keeping the routing order within each group"""
+    return sorted(terminals, key=lambda terminal: not tracker.is_healthy(terminal.pk))
+
+
+def load_offline_terminal_ids(shop_domain):
+    """Ids of the shop's terminal links whose latest check within TERMINAL_HEALTH_MAX_AGE_SECONDS failed"""
+    since = timezone.now() - timedelta(seconds=settings.TERMINAL_HEALTH_MAX_AGE_SECONDS)
+    link_ids = [terminal.pk for terminal in shop_terminal_links(shop_domain)]
+    if not link_ids:
+        return frozenset()
+    checks = TerminalHealthCheck.objects.filter(terminal_link_id__in=link_ids, checked_at__gte=since)
+    if len(shard_aliases()) > 1:
+        checks = checks.using(shard_for(shop_domain))
+    latest = {}
+    for terminal_link_id, reachable in (
+            checks.order_by('terminal_link_id', '-checked_at').values_list('terminal_link_id', 'reachable')):
+        latest.setdefault(terminal_link_id, reachable)
+    return frozenset(pk for pk, reachable in latest.items() if not reachable)
+
+
+class OfflineCache:
+    """Per-process snapshots of offline terminal ids per shop, reloaded after `ttl` seconds"""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self._shops = LocalCache(max_entries)
+
+    def __len__(self):
+        return len(self._shops)
+
+    def get(self, shop_domain):
+        ids = self._shops.get(shop_domain)
+        if ids is None:
+            ids = load_offline_terminal_ids(shop_domain)
+            self._shops.set(shop_domain, ids, self.ttl)
+        return ids
+
+    def invalidate(self):
+        self._shops.clear()
+
+
+offline_cache = OfflineCache(
+    ttl=settings.TERMINAL_HEALTH_CACHE_SECONDS,
+    max_entries=settings.TERMINAL_HEALTH_CACHE_MAX_ENTRIES,
+)
+register_store('health.offline_cache', offline_cache)
+
+
+def is_offline(terminal):
+    return terminal.pk in offline_cache.get(terminal.shop_domain)
+
+
+def probe_terminal(terminal, service=None):
+    """
+    Check one terminal
+
+    Returns:
+        TerminalHealthCheck: Unsaved check result, or None if the shop's
+        probe slots were all taken (that says nothing about the terminal)
+    """
+    service = service or PinVandaagService(shop_domain=terminal.shop_domain)
+    start = time.perf_counter()
+    try:
+        service.probe(
+            terminal_id=terminal.terminal_id,
+            api_key=terminal.api_key,
+            timeout=settings.TERMINAL_PROBE_TIMEOUT
+        )
+        reachable, error = True, None
+    except BulkheadFull:
+        return None
+    except requests.RequestException as e:
+        reachable, error = False, str(e)[:255]
+    return TerminalHealthCheck(
+        terminal_link=terminal,
+        checked_at=timezone.now(),
+        reachable=reachable,
+        latency_ms=int((time.perf_counter() - start) * 1000),
+        error=error,
+    )
+
+
+def probe_terminals(terminals, concurrency=8):
+    """
+    Probe terminals in parallel and store the results
+
+    Args:
+        terminals: Iterable of TerminalLinks
+        concurrency: Probes in flight at once
+
+    Returns:
+        list: Saved TerminalHealthCheck rows
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        checks = [check for check in pool.map(probe_terminal, terminals) if check]
+    TerminalHealthCheck.objects.bulk_create(checks)
+    offline_cache.invalidate()
+
+    offline = [check for check in checks if not check.reachable]
+    for check in offline:
+        logger.warning(f"Terminal {check.terminal_link} is offline: {check.error}")
+    logger.info(f"Probed {len(checks)} terminals, {len(offline)} offline")
+    return checks
+
+
+def purge_health_checks(older_than):
+    """Delete health checks older than `older_than` (a timedelta)"""
+    deleted, _ = TerminalHealthCheck.objects.filter(checked_at__lt=timezone.now() - older_than).delete()
+    return deleted
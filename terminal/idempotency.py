@@ -0,0 +1,204 @@
+"""
+Idempotency-Key support for POS endpoints
+
+The first response for a key is kept in the cache (see terminal/cache.py)
+and replayed for repeats. A duplicate that arrives while the original is
+still running waits for it instead of starting a second payment.
+
+Only the shared backends ('sqlite', 'django') see keys of other workers. With
+the default 'local' backend a retry that lands on another worker starts a
+second payment, so a warning is logged at startup and `manage.py check`
+reports terminal.W001 when more than one worker is configured.
+"""
+import hashlib
+import logging
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core import checks
+from django.http import HttpResponse, JsonResponse
+
+from terminal.cache import LocalCache, get_cache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+OWNER = 'owner'
+WAIT = 'wait'
+REPLAY = 'replay'
+MISMATCH = 'mismatch'
+
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+
+
+class PendingRequest:
+    """Handle on a request that another worker or thread is still running"""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+
+    def wait(self, timeout):
+        """
+        Block until the original completes or is abandoned
+
+        Returns:
+            bool: False on timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            entry = self.cache.get(self.key)
+            if entry is None or entry[0] == DONE:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+
+class IdempotencyStore:
+    """
+    Stored responses with a TTL, plus in-flight tracking
+
+    Args:
+        max_entries: Bound of the default per-process cache
+        ttl: Seconds a response is replayed
+        cache: Cache backend to use instead of a per-process LRU
+    """
+
+    def __init__(self, max_entries, ttl, cache=None):
+        self.ttl = ttl
+        self.cache = cache if cache is not None else LocalCache(max_entries)
+
+    def _key(self, key):
+        # Client keys may be long or contain characters network caches reject
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def begin(self, key, fingerprint):
+        """
+        Claim a key or find out what to do with a repeat
+
+        Returns:
+            tuple: (OWNER, None) if the caller must run the request,
+                   (REPLAY, (status, content_type, content)) for a stored response,
+                   (WAIT, PendingRequest) while another request holds the key,
+                   (MISMATCH, None) if the key was used with a different body
+        """
+        cache_key = self._key(key)
+        while True:
+            # An owner that died mid-request stops blocking the key after the wait time
+            if self.cache.add(cache_key, (IN_FLIGHT, fingerprint), settings.TERMINAL_IDEMPOTENCY_WAIT_SECONDS):
+                return OWNER, None
+            entry = self.cache.get(cache_key)
+            if entry is None:
+                continue
+            state, stored_fingerprint, *response = entry
+            if stored_fingerprint != fingerprint:
+                return MISMATCH, None
+            if state == DONE:
+                return REPLAY, tuple(response)
+            return WAIT, PendingRequest(self.cache, cache_key)
+
+    def complete(self, key, fingerprint, status, content, content_type):
+        self.cache.set(self._key(key), (DONE, fingerprint, status, content_type, content), self.ttl)
+
+    def abandon(self, key):
+        """Release waiters without storing a response, so a retry runs again"""
+        self.cache.delete(self._key(key))
+
+    def clear(self):
+        self.cache.clear()
+
+
+store = IdempotencyStore(
+    max_entries=settings.TERMINAL_IDEMPOTENCY_MAX_ENTRIES,
+    ttl=settings.TERMINAL_IDEMPOTENCY_TTL,
+    cache=get_cache('idempotency', settings.TERMINAL_IDEMPOTENCY_MAX_ENTRIES),
+)
+
+
+def shared_across_workers():
+    """Whether a retry reaching another worker finds the original's key"""
+    return settings.TERMINAL_CACHE_BACKEND != 'local' or settings.TERMINAL_WEB_WORKERS <= 1
+
+
+def check_idempotency_backend(app_configs=None, **kwargs):
+    """System check: idempotency keys must be shared when there are several workers"""
+    if shared_across_workers():
+        return []
+    return [checks.Warning(
+        f"Idempotency-Key dedup only works within one worker, but WEB_CONCURRENCY is "
+        f"{settings.TERMINAL_WEB_WORKERS} and TERMINAL_CACHE_BACKEND is 'local'",
+        hint="Set TERMINAL_CACHE_BACKEND to 'sqlite' (one host) or 'django' (several hosts).",
+        id='terminal.W001',
+    )]
+
+
+if not shared_across_workers():
+    logger.warning(f"TERMINAL_CACHE_BACKEND is 'local' with {settings.TERMINAL_WEB_WORKERS} workers: "
+                   f"retried starts reaching another worker are not deduplicated")
+
+
+def idempotent(view):
+    """
+    Make a POST view idempotent for requests carrying an Idempotency-Key header
+
+    Responses below 500 are stored and replayed; server errors and 409
+    (terminal busy) are not, so the client can retry them.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({
+                'success': False,
+                'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'
+            }, status=400)
+
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+        deadline = time.monotonic() + settings.TERMINAL_IDEMPOTENCY_WAIT_SECONDS
+
+        while True:
+            state, value = store.begin(key, fingerprint)
+            if state == OWNER:
+                break
+            if state == MISMATCH:
+                return JsonResponse({
+                    'success': False,
+                    'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'
+                }, status=422)
+            if state == REPLAY:
+                status, content_type, content = value
+                response = HttpResponse(content, status=status, content_type=content_type)
+                response['Idempotent-Replayed'] = 'true'
+                return response
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'A request with this Idempotency-Key is still in progress'
+                }, status=409)
+            value.wait(remaining)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            store.abandon(key)
+            raise
+
+        if response.status_code < 500 and response.status_code != 409:
+            store.complete(key, fingerprint, response.status_code, response.content, response['Content-Type'])
+        else:
+            store.abandon(key)
+        return response
+
+    return wrapper
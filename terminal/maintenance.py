@@ -0,0 +1,386 @@
+"""Batch maintenance jobs for the Transaction table"""
+import gzip
+import json
+import logging
+import os
+import time
+
+import requests
+from django.db import connections, transaction as db_transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from terminal.bulkheads import BulkheadFull
+from terminal.models import (
+    DailyTransactionStat, Location, StaffMember, TerminalHealthCheck, TerminalLinks, TerminalOccupancy, Transaction,
+    TransactionArchive, TransactionReceipt, decompress_text
+)
+from terminal.notify import publish
+from terminal.occupancy import release_transactions
+from terminal.open_transactions import mark_timed_out
+from terminal.rollups import record_transitions
+from terminal.services import PinVandaagService, apply_status_update, parse_status_response
+from terminal.shards import each_shard, shard_aliases, shard_for
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_ERROR_MSG = 'No final status received from terminal'
+
+
+def _resolve_upstream(rows):
+    """
+    Ask Pin Vandaag once for the final status of stale transactions
+
+    Returns:
+        dict: pk -> (status, error_msg, receipt) for rows that reached a final state upstream
+    """
+    service = PinVandaagService()
+    resolved = {}
+    for pk, transaction_id, terminal_id, api_key, is_demo in rows:
+        if not terminal_id or is_demo:
+            continue
+        try:
+            result = service.get_status(
+                terminal_id=terminal_id,
+                api_key=api_key,
+                transaction_id=transaction_id
+            )
+        except (requests.RequestException, BulkheadFull):
+            continue
+        payment_status, error_msg, receipt = parse_status_response(result)
+        if payment_status in Transaction.FINAL_STATUSES:
+            resolved[pk] = (payment_status, error_msg, receipt)
+    return resolved
+
+
+def sweep_stale_transactions(older_than, chunk_size=500, check_upstream=False, dry_run=False, pause=0):
+    """
+    Mark 'started' transactions older than `older_than` as 'timeout'
+
+    Rows are processed oldest first through the (status, created_at) index in
+    chunks of `chunk_size`, one shard after the other; each chunk is its own
+    short UPDATE transaction so no long locks are held.
+
+    Args:
+        older_than: timedelta, minimum age of a transaction to be swept
+        chunk_size: Rows per UPDATE
+        check_upstream: Ask Pin Vandaag once for each row before timing it out
+        dry_run: Only count matching rows
+        pause: Seconds to sleep between chunks
+
+    Returns:
+        dict: Counts of 'stale', 'timeout' and 'resolved' rows
+    """
+    cutoff = timezone.now() - older_than
+    counts = {'stale': 0, 'timeout': 0, 'resolved': 0}
+    for alias in each_shard():
+        stale = Transaction.objects.filter(status='started', created_at__lt=cutoff)
+        if dry_run:
+            counts['stale'] += stale.count()
+            continue
+        _sweep_shard(alias, stale, counts, chunk_size, check_upstream, pause)
+
+    return counts
+
+
+def _sweep_shard(alias, stale, counts, chunk_size, check_upstream, pause):
+    while True:
+        rows = list(
+            stale.order_by('created_at').values_list(
+                'pk', 'transaction_id',
+                'terminal_link__terminal_id', 'terminal_link__api_key', 'terminal_link__is_demo'
+            )[:chunk_size]
+        )
+        if not rows:
+            break
+        counts['stale'] += len(rows)
+
+        resolved = _resolve_upstream(rows) if check_upstream else {}
+        now = timezone.now()
+
+        with db_transaction.atomic(using=alias):
+            for transaction in (Transaction.objects.select_for_update(of=('self',))
+                                .select_related('terminal_link')
+                                .filter(pk__in=list(resolved), status='started')):
+                apply_status_update(transaction, *resolved[transaction.pk])
+                counts['resolved'] += 1
+
+            # Lock the rows first so the rollups see exactly the rows that were updated
+            timed_out = list(
+                Transaction.objects.select_for_update(of=('self',))
+                .filter(pk__in=[row[0] for row in rows if row[0] not in resolved], status='started')
+                .values_list('pk', 'transaction_id', 'shop_domain', 'terminal_link__terminal_id', 'created_at', 'amount')
+            )
+            counts['timeout'] += Transaction.objects.filter(pk__in=[row[0] for row in timed_out]).update(
+                status='timeout',
+                error_msg=Coalesce('error_msg', Value(TIMEOUT_ERROR_MSG)),
+                updated_at=now
+            )
+            record_transitions([row[2:] for row in timed_out], 'started', 'timeout')
+            transaction_ids = [row[1] for row in timed_out]
+            release_transactions(transaction_ids)
+
+        # Polls must stop finding them open, and waiting polls should answer now
+        mark_timed_out(transaction_ids)
+        for transaction_id in transaction_ids:
+            publish(transaction_id)
+
+        logger.info(f"Swept {counts['stale']} stale transactions so far "
+                    f"({counts['timeout']} timed out, {counts['resolved']} resolved upstream)")
+        if pause:
+            time.sleep(pause)
+
+
+ARCHIVE_FIELDS = (
+    'pk', 'transaction_id', 'terminal_link_id', 'amount', 'status', 'error_msg',
+    'shop_domain', 'created_at', 'updated_at',
+)
+
+
+class TableArchiveWriter:
+    """Copies archived rows into the TransactionArchive table"""
+
+    def write(self, rows):
+        TransactionArchive.objects.bulk_create([
+            TransactionArchive(
+                transaction_id=row['transaction_id'],
+                terminal_link_id=row['terminal_link_id'],
+                amount=row['amount'],
+                status=row['status'],
+                error_msg=row['error_msg'],
+                # Already zlib-compressed in TransactionReceipt, copied as is
+                receipt_compressed=row['receipt_data'],
+                shop_domain=row['shop_domain'],
+                location_id=row['location_id'],
+                staff_member_id=row['staff_member_id'],
+                created_at=row['created_at'],
+                updated_at=row['updated_at'],
+            ) for row in rows
+        ])
+
+    def close(self):
+        pass
+
+
+class NDJSONArchiveWriter:
+    """Appends archived rows to a gzip-compressed NDJSON file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.raw = open(path, 'ab')
+        self.file = gzip.GzipFile(fileobj=self.raw, mode='ab')
+
+    def write(self, rows):
+        for row in rows:
+            record = {key: value for key, value in row.items() if key not in ('pk', 'receipt_data')}
+            record['receipt'] = decompress_text(row['receipt_data'])
+            record['created_at'] = row['created_at'].isoformat()
+            record['updated_at'] = row['updated_at'].isoformat()
+            self.file.write((json.dumps(record) + '\n').encode('utf-8'))
+        # Rows are deleted right after this batch, so make sure they are on disk
+        self.file.flush()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+
+    def close(self):
+        self.file.close()
+        self.raw.close()
+
+
+def iter_archive_file(path):
+    """Yield archived transactions from an NDJSON archive file as dicts"""
+    with gzip.open(path, 'rt', encoding='utf-8') as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+
+def archive_transactions(older_than, writer, batch_size=1000, pause=0, progress=None):
+    """
+    Move transactions created before now - `older_than` into an archive
+
+    Rows are read shard by shard in primary key order (oldest first) and
+    each batch is written to `writer` and deleted from the live table in one
+    short database transaction, so online traffic never waits on a long lock.
+
+    Args:
+        older_than: timedelta retention window
+        writer: TableArchiveWriter or NDJSONArchiveWriter
+        batch_size: Rows per batch
+        pause: Seconds to sleep between batches
+        progress: Optional callable(archived_count) called after each batch
+
+    Returns:
+        int: Number of archived rows
+    """
+    cutoff = timezone.now() - older_than
+    archived = 0
+    for alias in each_shard():
+        archived = _archive_shard(alias, cutoff, writer, batch_size, pause, progress, archived)
+
+    writer.close()
+    logger.info(f"Archived {archived} transactions created before {cutoff.isoformat()}")
+    return archived
+
+
+def _archive_shard(alias, cutoff, writer, batch_size, pause, progress, archived):
+    old = Transaction.objects.filter(created_at__lt=cutoff).order_by('pk')
+    last_pk = 0
+
+    while True:
+        rows = list(
+            old.filter(pk__gt=last_pk)
+            .values(*ARCHIVE_FIELDS, location_id=F('location_ref__value'), staff_member_id=F('staff_ref__value'),
+                    receipt_data=F('receipt_record__data'))[:batch_size]
+        )
+        if not rows:
+            break
+
+        pks = [row['pk'] for row in rows]
+        with db_transaction.atomic(using=alias):
+            writer.write(rows)
+            Transaction.objects.filter(pk__in=pks).delete()
+
+        last_pk = pks[-1]
+        archived += len(rows)
+        if progress:
+            progress(archived)
+        if pause:
+            time.sleep(pause)
+    return archived
+
+
+# Rows that move with their shop, parents before children
+SHOP_ROWS = (
+    (TerminalLinks, 'shop_domain'),
+    (Location, 'shop_domain'),
+    (StaffMember, 'shop_domain'),
+    (Transaction, 'shop_domain'),
+    (TransactionReceipt, 'transaction__shop_domain'),
+    (TerminalOccupancy, 'terminal_link__shop_domain'),
+    (TerminalHealthCheck, 'terminal_link__shop_domain'),
+    (TransactionArchive, 'shop_domain'),
+)
+
+
+def misplaced_shops():
+    """
+    Shops with rows outside the shard they hash to
+
+    Returns:
+        list: (shop_domain, source alias, target alias), sorted
+    """
+    misplaced = set()
+    for alias in shard_aliases():
+        for model in (TerminalLinks, Transaction, TransactionArchive, DailyTransactionStat):
+            for shop_domain in model.objects.using(alias).values_list('shop_domain', flat=True).distinct():
+                if shard_for(shop_domain) != alias:
+                    misplaced.add((shop_domain, alias, shard_for(shop_domain)))
+    return sorted(misplaced)
+
+
+def _copy_rows(queryset, target, batch_size):
+    """
+    Insert the rows of `queryset` into `target` as they are, keeping ids and timestamps
+
+    Rows already on `target` (from an interrupted earlier run) are skipped.
+
+    Returns:
+        int: Number of rows copied
+    """
+    meta = queryset.model._meta
+    fields = meta.concrete_fields
+    connection = connections[target]
+    quote = connection.ops.quote_name
+    sql = (f"INSERT INTO {quote(meta.db_table)} ({', '.join(quote(field.column) for field in fields)}) "
+           f"VALUES ({', '.join(['%s'] * len(fields))})")
+    copied = 0
+    last_pk = None
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        rows = list(batch.values_list(*[field.attname for field in fields])[:batch_size])
+        if not rows:
+            return copied
+        last_pk = rows[-1][fields.index(meta.pk)]
+        present = set(queryset.model.objects.using(target).filter(
+            pk__in=[row[fields.index(meta.pk)] for row in rows]
+        ).values_list('pk', flat=True))
+        values = [
+            [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+            for row in rows if row[fields.index(meta.pk)] not in present
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, values)
+        copied += len(values)
+
+
+def _merge_stats(shop_domain, source, target):
+    """
+    Move a shop's rollup rows, adding them to buckets the target already has
+
+    A merged bucket takes the id of the moved row, so a rerun after an
+    interruption recognizes it as already moved.
+    """
+    moved = 0
+    for stat in DailyTransactionStat.objects.using(source).filter(shop_domain=shop_domain):
+        if DailyTransactionStat.objects.using(target).filter(pk=stat.pk).exists():
+            continue
+        existing = DailyTransactionStat.objects.using(target).filter(
+            shop_domain=shop_domain, terminal_id=stat.terminal_id, day=stat.day, status=stat.status
+        ).first()
+        if existing:
+            stat.count += existing.count
+            stat.amount_total += existing.amount_total
+            existing.delete()
+        stat.save(using=target, force_insert=True)
+        moved += 1
+    return moved
+
+
+def rebalance_shards(batch_size=1000, dry_run=False, progress=None):
+    """
+    Move every shop's rows to the shard it hashes to
+
+    Needed after TERMINAL_SHARD_URLS changes. Each shop is copied to its new
+    shard in one database transaction there, then deleted from the old one
+    in another; ids are kept, so caches and shared-memory tables keyed by id
+    stay valid. A run that was interrupted in between can simply be
+    repeated. Until a shop has been moved its terminal links are not found,
+    so run this right after deploying the new shard list.
+
+    Args:
+        batch_size: Rows per copy batch
+        dry_run: Only report the shops that would move
+        progress: Optional callable(shop_domain, source, target, rows) called after each shop
+
+    Returns:
+        dict: Counts of moved 'shops' and 'rows'
+    """
+    counts = {'shops': 0, 'rows': 0}
+    for shop_domain, source, target in misplaced_shops():
+        counts['shops'] += 1
+        if dry_run:
+            if progress:
+                progress(shop_domain, source, target, 0)
+            continue
+
+        rows = 0
+        with db_transaction.atomic(using=target):
+            for model, shop_field in SHOP_ROWS:
+                rows += _copy_rows(
+                    model.objects.using(source).filter(**{shop_field: shop_domain}), target, batch_size
+                )
+            rows += _merge_stats(shop_domain, source, target)
+
+        with db_transaction.atomic(using=source):
+            for model, shop_field in reversed(SHOP_ROWS + ((DailyTransactionStat, 'shop_domain'),)):
+                model.objects.using(source).filter(**{shop_field: shop_domain}).delete()
+
+        counts['rows'] += rows
+        logger.info(f"Moved shop {shop_domain} from {source} to {target} ({rows} rows)")
+        if progress:
+            progress(shop_domain, source, target, rows)
+    return counts
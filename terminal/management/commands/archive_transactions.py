@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from terminal.maintenance import NDJSONArchiveWriter, TableArchiveWriter, archive_transactions
+
+
+class Command(BaseCommand):
+    help = 'Move transactions older than the retention window into the archive table or an NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TERMINAL_TRANSACTION_RETENTION_DAYS,
+                            help='Retention window in days (default: TERMINAL_TRANSACTION_RETENTION_DAYS)')
+        parser.add_argument('--to', choices=['table', 'ndjson'], default='table',
+                            help='Archive destination (default: table)')
+        parser.add_argument('--output', help='Path of the .ndjson.gz file when --to ndjson')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches (default: 0.05)')
+
+    def handle(self, *args, **options):
+        if options['to'] == 'ndjson':
+            if not options['output']:
+                self.stderr.write('--output is required with --to ndjson')
+                return
+            writer = NDJSONArchiveWriter(options['output'])
+        else:
+            writer = TableArchiveWriter()
+
+        archived = archive_transactions(
+            older_than=timedelta(days=options['days']),
+            writer=writer,
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            progress=lambda count: self.stdout.write(f"  archived {count} transactions"),
+        )
+        self.stdout.write(f"Archived {archived} transactions older than {options['days']} days")
@@ -0,0 +1,343 @@
+"""
+Large-dataset benchmark for the Transaction table
+
+Seeds a reproducible dataset (shops, terminal links, transactions) and
+measures the hot read paths against it. Results are emitted as JSON so
+runs can be compared across commits.
+
+Usage:
+    python manage.py benchmark --transactions 2000000 --shops 2000 --terminals 200000
+    python manage.py benchmark --skip-seed --output bench.json
+    python manage.py benchmark --cleanup
+
+Point DATABASE_URL at a dedicated database: seeding writes millions of rows.
+"""
+import hashlib
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from terminal.models import Location, TerminalLinks, Transaction, TransactionReceipt
+from terminal.services import find_terminal
+from terminal.shards import bind_shop, shard_scope
+from terminal.tokens import check_status_token, make_status_token
+from terminal.views.views import get_transactions, lookup_open_transaction, lookup_transaction
+
+BENCH_PREFIX = 'bench-'
+BENCH_ADMIN_USERNAME = 'bench-admin'
+STATUSES = ['success', 'success', 'success', 'failed', 'started', 'timeout']
+
+
+def shop_domain_for(index):
+    return f"{BENCH_PREFIX}{index:06d}.myshopify.com"
+
+
+@contextmanager
+def preserve_created_at():
+    """Let bulk_create keep explicit created_at values instead of now()"""
+    field = Transaction._meta.get_field('created_at')
+    original = field.auto_now_add
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = original
+
+
+def summarize(timings, query_counts):
+    """Summarize a list of timings (seconds) into milliseconds percentiles"""
+    ordered = sorted(timings)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'n': len(ordered),
+        'mean_ms': round(statistics.mean(ordered) * 1000, 3),
+        'p50_ms': round(pct(50), 3),
+        'p95_ms': round(pct(95), 3),
+        'p99_ms': round(pct(99), 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'queries_per_call': round(statistics.mean(query_counts), 2),
+    }
+
+
+def sample_rows(queryset, fields, count, rng):
+    """
+    Rows at random points of the primary key range
+
+    Each row is an index seek, unlike order_by('?') which sorts the whole table.
+    Rows after gaps in the key range are picked more often.
+    """
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+    rows = []
+    for _ in range(count):
+        row = (queryset.filter(pk__gte=rng.randint(bounds['low'], bounds['high']))
+               .order_by('pk').values_list(*fields).first())
+        if row:
+            rows.append(row)
+    return rows
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=settings.BASE_DIR,
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Seed a large Transaction dataset and benchmark the hot read paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=2_000_000)
+        parser.add_argument('--shops', type=int, default=2_000)
+        parser.add_argument('--terminals', type=int, default=200_000)
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='Calls per measured operation (default: 200)')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-seed', action='store_true',
+                            help='Reuse previously seeded benchmark rows')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete all benchmark rows and exit')
+        parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self.cleanup(options['batch_size'])
+            return
+
+        rng = random.Random(options['seed'])
+
+        if not options['skip_seed']:
+            self.seed(rng, options)
+
+        shops = self.seeded_shops() if options['skip_seed'] else options['shops']
+        link_sample = sample_rows(
+            TerminalLinks.objects.filter(shop_domain__startswith=BENCH_PREFIX),
+            ('shop_domain', 'location_id'), options['repeat'], rng
+        )
+        tx_sample = sample_rows(
+            Transaction.objects.filter(shop_domain__startswith=BENCH_PREFIX),
+            ('transaction_id', 'shop_domain', 'terminal_link_id', 'terminal_link__terminal_id'), options['repeat'], rng
+        )
+        if not link_sample or not tx_sample:
+            self.stderr.write('No benchmark data found, run without --skip-seed first')
+            return
+
+        factory = RequestFactory()
+        admin_user = self.get_admin_user()
+        transaction_admin = admin.site._registry[Transaction]
+        links_admin = admin.site._registry[TerminalLinks]
+        repeat = options['repeat']
+
+        def run_get_transactions(i):
+            shop = shop_domain_for(rng.randrange(shops))
+            return get_transactions(factory.get('/api/terminal/transactions/', {'shop': shop}))
+
+        def run_find_terminal(i):
+            shop_domain, location_id = link_sample[i % len(link_sample)]
+            return find_terminal(shop_domain=shop_domain, location_id=location_id)
+
+        # Polls carry the status token from /start, as POS clients do
+        status_tokens = [
+            make_status_token(terminal_link_id, terminal_id, transaction_id, shop_domain)
+            for transaction_id, shop_domain, terminal_link_id, terminal_id in tx_sample
+        ]
+
+        def run_status_lookup(i):
+            # The lookups of get_transaction_status before it calls Pin Vandaag
+            claims = check_status_token(status_tokens[i % len(status_tokens)])
+            with shard_scope():
+                bind_shop(claims['shop_domain'])
+                open_transaction, terminal = lookup_open_transaction(
+                    claims['transaction_id'], claims['shop_domain'], claims)
+                if open_transaction:
+                    return open_transaction
+                return lookup_transaction(claims['transaction_id'], claims['shop_domain'], claims)
+
+        def changelist(model_admin, params):
+            def run(i):
+                request = factory.get('/admin/', params)
+                request.user = admin_user
+                response = model_admin.changelist_view(request)
+                response.render()
+                return response
+            return run
+
+        operations = {
+            'get_transactions': run_get_transactions,
+            'find_terminal': run_find_terminal,
+            'status_lookup': run_status_lookup,
+            'admin_transaction_changelist': changelist(transaction_admin, {}),
+            'admin_transaction_changelist_search': changelist(
+                transaction_admin, {'q': shop_domain_for(rng.randrange(shops))}),
+            'admin_transaction_changelist_filtered': changelist(
+                transaction_admin, {'status__exact': 'started'}),
+            'admin_terminallinks_changelist': changelist(links_admin, {}),
+        }
+
+        results = {}
+        for name, operation in operations.items():
+            results[name] = self.measure(operation, repeat)
+            self.stderr.write(f"{name}: p50={results[name]['p50_ms']}ms p95={results[name]['p95_ms']}ms")
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'seed': options['seed'],
+                'repeat': repeat,
+            },
+            'dataset': {
+                'shops': shops,
+                'terminal_links': TerminalLinks.objects.filter(shop_domain__startswith=BENCH_PREFIX).count(),
+                'transactions': Transaction.objects.filter(shop_domain__startswith=BENCH_PREFIX).count(),
+            },
+            'results': results,
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output)
+            self.stderr.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def measure(self, operation, repeat):
+        # Warm up connections and caches once so the first call does not skew p99
+        operation(0)
+        timings = []
+        query_counts = []
+        for i in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                operation(i)
+                timings.append(time.perf_counter() - start)
+            query_counts.append(len(queries))
+        return summarize(timings, query_counts)
+
+    def seeded_shops(self):
+        """Number of shops in an existing dataset; seeding numbers them from 0"""
+        last = (TerminalLinks.objects.filter(shop_domain__startswith=BENCH_PREFIX)
+                .order_by('-shop_domain').values_list('shop_domain', flat=True).first())
+        if last is None:
+            return 0
+        return int(last[len(BENCH_PREFIX):].split('.', 1)[0]) + 1
+
+    def get_admin_user(self):
+        user, _ = User.objects.get_or_create(
+            username=BENCH_ADMIN_USERNAME,
+            defaults={'is_staff': True, 'is_superuser': True},
+        )
+        return user
+
+    def seed(self, rng, options):
+        self.cleanup(options['batch_size'])
+
+        shops = options['shops']
+        terminals = max(options['terminals'], shops)
+        batch_size = options['batch_size']
+
+        self.stderr.write(f"Seeding {terminals} terminal links across {shops} shops...")
+        links = []
+        for i in range(terminals):
+            shop_index = i % shops
+            links.append(TerminalLinks(
+                shop_domain=shop_domain_for(shop_index),
+                shop_id=f"shop-{shop_index}",
+                location_id=f"loc-{i // shops % 50}",
+                staff_member_id=f"staff-{rng.randrange(20)}" if rng.random() < 0.3 else None,
+                terminal_id=f"{50000000 + i}",
+                api_key=f"bench-key-{shop_index}",
+            ))
+            if len(links) >= batch_size:
+                TerminalLinks.objects.bulk_create(links)
+                links = []
+        if links:
+            TerminalLinks.objects.bulk_create(links)
+
+        # bulk_create skips Transaction.save(), so locations are interned here
+        link_ids = {}
+        locations = {}
+        for pk, shop_domain, location_id in (
+                TerminalLinks.objects.filter(shop_domain__startswith=BENCH_PREFIX)
+                .values_list('pk', 'shop_domain', 'location_id').iterator()):
+            if (shop_domain, location_id) not in locations:
+                locations[shop_domain, location_id] = Location.intern(shop_domain, location_id)
+            link_ids.setdefault(shop_domain, []).append((pk, locations[shop_domain, location_id]))
+
+        self.stderr.write(f"Seeding {options['transactions']} transactions...")
+        now = timezone.now()
+        year = 365 * 24 * 3600
+        rows = []
+        with preserve_created_at():
+            for i in range(options['transactions']):
+                shop_domain = shop_domain_for(rng.randrange(shops))
+                link_id, location = rng.choice(link_ids[shop_domain])
+                status = rng.choice(STATUSES)
+                rows.append(Transaction(
+                    transaction_id=f"{BENCH_PREFIX}{i}",
+                    terminal_link_id=link_id,
+                    amount=rng.randrange(100, 50_000),
+                    status=status,
+                    error_msg='Kaart geweigerd' if status == 'failed' else None,
+                    shop_domain=shop_domain,
+                    location_ref=location,
+                    created_at=now - timedelta(seconds=rng.randrange(year)),
+                ))
+                if len(rows) >= batch_size:
+                    self.bulk_create_transactions(rows)
+                    rows = []
+                    self.stderr.write(f"  {i + 1} rows")
+            if rows:
+                self.bulk_create_transactions(rows)
+
+    def bulk_create_transactions(self, rows):
+        Transaction.objects.bulk_create(rows)
+        receipt = ('RECEIPT ' * 40).encode('utf-8')
+        data = zlib.compress(receipt, 6)
+        digest = hashlib.sha256(receipt).hexdigest()
+        TransactionReceipt.objects.bulk_create([
+            TransactionReceipt(transaction_id=row.pk, data=data, digest=digest, size=len(receipt))
+            for row in rows if row.status == 'success'
+        ])
+
+    def cleanup(self, batch_size):
+        """Delete benchmark rows in bounded batches"""
+        for model in (Transaction, Location, TerminalLinks):
+            queryset = model.objects.filter(shop_domain__startswith=BENCH_PREFIX)
+            while True:
+                pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                model.objects.filter(pk__in=pks).delete()
+        User.objects.filter(username=BENCH_ADMIN_USERNAME).delete()
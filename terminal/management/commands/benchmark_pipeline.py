@@ -0,0 +1,113 @@
+"""
+Per-request overhead of the full middleware stack vs the lean POS pipeline
+
+Sends the same requests straight into the WSGI application with the lean
+pipeline off (WSGIHandler) and on (PosDispatcher, so its routing is counted)
+without a server or network, and reports timings per side and the
+difference. The requests are cheap validation failures so the middleware
+dominates. The preflight is a control: CorsMiddleware answers it before any
+middleware the lean stack drops, so both sides should be within noise.
+
+Usage:
+    python manage.py benchmark_pipeline --repeat 5000 --output pipeline.json
+"""
+import io
+import json
+import logging
+import platform
+import time
+from wsgiref.util import setup_testing_defaults
+
+import django
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from terminal.handlers import LeanWSGIHandler, PosDispatcher
+from terminal.management.commands.benchmark import git_commit, summarize
+
+REQUESTS = {
+    'status_invalid': ('POST', '/api/terminal/status', '', b'{}'),
+    'status_preflight': ('OPTIONS', '/api/terminal/status', '', b''),
+    'receipt_missing_shop': ('GET', '/api/terminal/receipt/2405102', '', b''),
+}
+
+
+def environ_for(method, path, query, body):
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'HTTP_ORIGIN': 'https://extensions.shopifycdn.com',
+        'HTTP_ACCESS_CONTROL_REQUEST_METHOD': 'POST',
+        'SERVER_NAME': 'localhost',
+        'wsgi.input': io.BytesIO(body),
+    }
+    setup_testing_defaults(environ)
+    return environ
+
+
+def start_response(status, headers):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-request overhead of the full and the lean POS middleware stack'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=2000,
+                            help='Requests per handler and request kind (default: 2000)')
+        parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        handlers = {'full': WSGIHandler(), 'lean': PosDispatcher(WSGIHandler(), LeanWSGIHandler())}
+        # Every request is a 4xx on purpose; logging each one would be most of the cost
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        repeat = options['repeat']
+
+        results = {}
+        for name, request in REQUESTS.items():
+            results[name] = self.measure(handlers, request, repeat)
+            saved = results[name]['full']['p50_ms'] - results[name]['lean']['p50_ms']
+            results[name]['saved_p50_us'] = round(saved * 1000, 1)
+            self.stderr.write(
+                f"{name}: full p50={results[name]['full']['p50_ms']}ms "
+                f"lean p50={results[name]['lean']['p50_ms']}ms saved={results[name]['saved_p50_us']}us"
+            )
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'repeat': repeat,
+            },
+            'results': results,
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output)
+            self.stderr.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def measure(self, handlers, request, repeat):
+        # Warm up URL resolvers and lazy imports once so the first call does not skew p99
+        for handler in handlers.values():
+            handler(environ_for(*request), start_response)
+        # Alternate the handlers so drift in machine load hits both sides alike
+        timings = {label: [] for label in handlers}
+        for _ in range(repeat):
+            for label, handler in handlers.items():
+                environ = environ_for(*request)
+                start = time.perf_counter()
+                response = handler(environ, start_response)
+                b''.join(response)
+                response.close()
+                timings[label].append(time.perf_counter() - start)
+        return {label: summarize(samples, [0]) for label, samples in timings.items()}
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from terminal.tokens import make_diagnostics_token
+
+
+class Command(BaseCommand):
+    help = 'Print a signed token that unlocks a diagnostics feature (e.g. profiling)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('purpose', choices=['profile', 'memory', 'metrics'])
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_diagnostics_token(options['purpose']))
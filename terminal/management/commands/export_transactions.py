@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from terminal.exports import EXPORT_FORMATS, export_rows, iter_export, parse_day
+
+
+class Command(BaseCommand):
+    help = 'Stream transactions of a shop to CSV or NDJSON with constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', required=True, help='Shop domain')
+        parser.add_argument('--from', dest='date_from', help='First day (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Last day, inclusive (YYYY-MM-DD)')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            start = parse_day(options['date_from']) if options['date_from'] else None
+            end = parse_day(options['date_to'], end=True) if options['date_to'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = iter_export(export_rows(options['shop'], start, end), options['format'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as fh:
+                fh.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,39 @@
+import json
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from terminal.diagnostics import memory_report
+from terminal.tokens import make_diagnostics_token
+from terminal.views.diagnostics_views import DIAGNOSTICS_HEADER, MEMORY_ACTIONS
+
+
+class Command(BaseCommand):
+    help = (
+        'Report tracemalloc allocation sites and in-process store sizes. '
+        'With --url the report is fetched from a running worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--action', choices=MEMORY_ACTIONS, default='snapshot')
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--url', help='Diagnostics endpoint of a running server, '
+                                          'e.g. https://host/api/terminal/diagnostics/memory')
+
+    def handle(self, *args, **options):
+        if options['url']:
+            try:
+                response = requests.get(
+                    options['url'],
+                    params={'action': options['action'], 'top': options['top']},
+                    headers={DIAGNOSTICS_HEADER: make_diagnostics_token('memory')},
+                    timeout=30,
+                )
+                response.raise_for_status()
+            except requests.RequestException as e:
+                raise CommandError(f"Failed to fetch memory report: {e}")
+            report = response.json()['report']
+        else:
+            report = memory_report(action=options['action'], top=options['top'])
+
+        self.stdout.write(json.dumps(report, indent=2))
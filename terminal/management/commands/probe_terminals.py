@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from terminal.health import probe_terminals, purge_health_checks
+from terminal.models import TerminalLinks
+from terminal.shards import each_shard
+
+
+class Command(BaseCommand):
+    help = 'Check every terminal through a cheap Pin Vandaag call and record its reachability'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', help='Only probe terminals of this shop domain')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Probes in flight at once (default: 8)')
+        parser.add_argument('--loop', type=int, metavar='SECONDS',
+                            help='Keep running, probing every SECONDS')
+
+    def handle(self, *args, **options):
+        while True:
+            checks = []
+            purged = 0
+            for _ in each_shard():
+                terminals = TerminalLinks.objects.filter(is_demo=False)
+                if options['shop']:
+                    terminals = terminals.filter(shop_domain=options['shop'])
+
+                checks += probe_terminals(list(terminals), concurrency=options['concurrency'])
+                purged += purge_health_checks(timedelta(days=settings.TERMINAL_HEALTH_RETENTION_DAYS))
+
+            offline = sum(1 for check in checks if not check.reachable)
+            self.stdout.write(f"Probed {len(checks)} terminals: {offline} offline ({purged} old checks purged)")
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from terminal.maintenance import rebalance_shards
+
+
+class Command(BaseCommand):
+    help = 'Move shops whose rows are not on the shard their domain hashes to (after changing TERMINAL_SHARD_URLS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the shops that would move')
+
+    def handle(self, *args, **options):
+        counts = rebalance_shards(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            progress=lambda shop, source, target, rows: self.stdout.write(
+                f"  {shop}: {source} -> {target}" + ('' if options['dry_run'] else f" ({rows} rows)")
+            ),
+        )
+        if options['dry_run']:
+            self.stdout.write(f"{counts['shops']} shops would move")
+        else:
+            self.stdout.write(f"Moved {counts['shops']} shops ({counts['rows']} rows)")
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from terminal.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute daily transaction rollups from the Transaction table (backfill or repair)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='First day (YYYY-MM-DD, default: 30 days ago)')
+        parser.add_argument('--to', dest='date_to', help='Last day, inclusive (YYYY-MM-DD, default: today)')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        start = parse_date(options['date_from']) if options['date_from'] else today - timedelta(days=30)
+        end = parse_date(options['date_to']) if options['date_to'] else today
+        if start is None or end is None:
+            raise CommandError('--from and --to must be dates (YYYY-MM-DD)')
+
+        written = rebuild_rollups(start, end)
+        self.stdout.write(f"Rebuilt rollups for {start} to {end}: {written} rows")
@@ -0,0 +1,61 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from terminal.exports import parse_day
+from terminal.reconciliation import database_rows, reconcile
+
+
+class Command(BaseCommand):
+    help = 'Reconcile a Pin Vandaag settlement CSV against the Transaction table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('settlement', help='Path to the settlement CSV export')
+        parser.add_argument('--shop', help='Only reconcile this shop domain')
+        parser.add_argument('--from', dest='date_from', help='First day (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Last day, inclusive (YYYY-MM-DD)')
+        parser.add_argument('--include-archive', action='store_true',
+                            help='Also match against TransactionArchive')
+        parser.add_argument('--output', help='Discrepancy report CSV (default: stdout)')
+        parser.add_argument('--partitions', type=int, default=64,
+                            help='Hash partitions; more partitions means less memory (default: 64)')
+        parser.add_argument('--amount-unit', choices=['cents', 'euros'], default='cents')
+        parser.add_argument('--id-column', default='transaction_id')
+        parser.add_argument('--amount-column', default='amount')
+        parser.add_argument('--status-column', default='status')
+
+    def handle(self, *args, **options):
+        try:
+            start = parse_day(options['date_from']) if options['date_from'] else None
+            end = parse_day(options['date_to'], end=True) if options['date_to'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        report = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else self.stdout
+        started = time.monotonic()
+        try:
+            with open(options['settlement'], newline='', encoding='utf-8-sig') as settlement:
+                result = reconcile(
+                    settlement,
+                    csv.writer(report),
+                    database_rows(options['shop'], start, end, options['include_archive']),
+                    partitions=options['partitions'],
+                    amount_unit=options['amount_unit'],
+                    id_column=options['id_column'],
+                    amount_column=options['amount_column'],
+                    status_column=options['status_column'],
+                )
+        except OSError as e:
+            raise CommandError(f"Cannot read settlement file: {e}")
+        finally:
+            if options['output']:
+                report.close()
+
+        summary = (
+            f"Reconciled {result.settlement_rows} settlement rows against {result.db_rows} transactions "
+            f"in {time.monotonic() - started:.1f}s: {result.matched} matched, {result.discrepancies} discrepancies"
+        )
+        for kind, count in sorted(result.counts.items()):
+            summary += f"\n  {kind}: {count}"
+        self.stderr.write(summary)
@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from terminal.maintenance import sweep_stale_transactions
+
+
+class Command(BaseCommand):
+    help = "Mark abandoned 'started' transactions as 'timeout' in chunked bulk UPDATEs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=settings.TERMINAL_STALE_TRANSACTION_SECONDS,
+                            help='Minimum age in seconds (default: TERMINAL_STALE_TRANSACTION_SECONDS)')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between chunks')
+        parser.add_argument('--check-upstream', action='store_true',
+                            help='Ask Pin Vandaag once for each row before timing it out')
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--loop', type=int, metavar='SECONDS',
+                            help='Keep running, sweeping every SECONDS')
+
+    def handle(self, *args, **options):
+        while True:
+            counts = sweep_stale_transactions(
+                older_than=timedelta(seconds=options['older_than']),
+                chunk_size=options['chunk_size'],
+                check_upstream=options['check_upstream'],
+                dry_run=options['dry_run'],
+                pause=options['pause'],
+            )
+            if options['dry_run']:
+                self.stdout.write(f"{counts['stale']} stale transactions would be swept")
+            else:
+                self.stdout.write(
+                    f"Swept {counts['stale']} stale transactions: "
+                    f"{counts['timeout']} timed out, {counts['resolved']} resolved upstream"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,79 @@
+"""
+Counters shared by all workers on a host
+
+Counters live in a SharedTable, so a scrape of any worker sees the totals
+of the whole host. Series are stored with their name, which lets
+render_prometheus list them without a registry.
+"""
+import os
+from collections import defaultdict
+
+from django.conf import settings
+
+from terminal.sharedmem import SharedTable
+
+MAX_SERIES_LENGTH = 120
+
+_table = SharedTable(
+    os.path.join(settings.TERMINAL_SHARED_MEMORY_DIR, 'metrics.bin'),
+    slots=4096,
+    value_format=f'q{MAX_SERIES_LENGTH}s',
+    max_probe=64,
+)
+
+
+def series_name(name, labels):
+    if not labels:
+        return name
+    rendered = ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return f'{name}{{{rendered}}}'
+
+
+def increment(name, amount=1, **labels):
+    """
+    Add `amount` to a counter
+
+    Args:
+        name: Metric name, e.g. 'terminal_poll_throttle_total'
+        amount: Increment
+        **labels: Label values, e.g. scope='transaction'
+    """
+    series = series_name(name, labels)
+    encoded = series.encode('utf-8')
+    if len(encoded) > MAX_SERIES_LENGTH:
+        raise ValueError(f"Metric series too long: {series}")
+
+    def add(stored):
+        return ((stored[0] if stored else 0) + amount, encoded), None
+
+    _table.update(series, add)
+
+
+def get(name, **labels):
+    stored = _table.get(series_name(name, labels))
+    return stored[0] if stored else 0
+
+
+def snapshot():
+    """All counters as {series: value}"""
+    return {
+        encoded.rstrip(b'\0').decode('utf-8'): value
+        for value, encoded in _table.records()
+    }
+
+
+def render_prometheus():
+    """Counters in the Prometheus text exposition format"""
+    by_name = defaultdict(list)
+    for series, value in sorted(snapshot().items()):
+        by_name[series.split('{', 1)[0]].append((series, value))
+
+    lines = []
+    for name, samples in by_name.items():
+        lines.append(f'# TYPE {name} counter')
+        lines.extend(f'{series} {value}' for series, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    _table.clear()
@@ -0,0 +1,210 @@
+import logging
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+
+from terminal import admission
+from terminal.db_routers import replica_reads
+from terminal.tokens import check_diagnostics_token
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Terminal-Profile'
+PROFILE_QUERY_PARAM = '_profile'
+PROFILED_PATH_PREFIX = '/api/terminal/'
+PRIMARY_PIN_COOKIE = 'terminal_primary_pin'
+
+
+def _sampling_profiler_available():
+    try:
+        import pyinstrument  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ProfilingMiddleware:
+    """
+    Profile a single /api/terminal/* request on demand.
+
+    Enabled with TERMINAL_PROFILING_ENABLED. A request is profiled only when it
+    carries a valid diagnostics token (see `manage.py diagnostics_token profile`)
+    in the X-Terminal-Profile header or the `_profile` query parameter.
+    When disabled the middleware removes itself from the stack at startup.
+    """
+
+    def __init__(self, get_response):
+        if not settings.TERMINAL_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.output_dir = settings.TERMINAL_PROFILE_DIR
+        profiler = settings.TERMINAL_PROFILER
+        if profiler == 'auto':
+            profiler = 'pyinstrument' if _sampling_profiler_available() else 'cprofile'
+        self.profiler = profiler
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.path.strip('/').replace('/', '_')}-{uuid.uuid4().hex[:8]}"
+        if self.profiler == 'pyinstrument':
+            response, path, summary = self.profile_sampling(request, name)
+        else:
+            response, path, summary = self.profile_cprofile(request, name)
+
+        logger.info(f"Profiled {request.method} {request.path} -> {response.status_code}: {summary}, written to {path}")
+        response['X-Terminal-Profile-File'] = os.path.basename(path)
+        return response
+
+    def should_profile(self, request):
+        if not request.path.startswith(PROFILED_PATH_PREFIX):
+            return False
+        token = request.headers.get(PROFILE_HEADER) or request.GET.get(PROFILE_QUERY_PARAM)
+        return check_diagnostics_token(token, 'profile')
+
+    def profile_cprofile(self, request, name):
+        import cProfile
+        import pstats
+
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        response = profile.runcall(self.get_response, request)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        path = os.path.join(self.output_dir, f"{name}.pstats")
+        profile.dump_stats(path)
+        stats = pstats.Stats(profile)
+        summary = f"{elapsed_ms:.1f}ms wall, {stats.total_calls} calls"
+        return response, path, summary
+
+    def profile_sampling(self, request, name):
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            session = profiler.stop()
+
+        # Speedscope JSON loads directly into speedscope.app as a flamegraph
+        path = os.path.join(self.output_dir, f"{name}.speedscope.json")
+        with open(path, 'w') as fh:
+            fh.write(SpeedscopeRenderer().render(session))
+        summary = f"{session.duration * 1000:.1f}ms wall, {session.sample_count} samples"
+        return response, path, summary
+
+
+class TimingMiddleware:
+    """
+    Report the time spent below this middleware in a Server-Timing header.
+
+    Part of POS_MIDDLEWARE, so POS clients and load balancers see how much of a
+    request's latency is the app itself.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        response['Server-Timing'] = f"app;dur={(time.perf_counter() - start) * 1000:.1f}"
+        return response
+
+
+class AdmissionMiddleware:
+    """
+    Shed low-priority requests with a 503 when the host is saturated.
+
+    See terminal/admission.py. Listed in both MIDDLEWARE and POS_MIDDLEWARE so
+    payment requests on the lean pipeline are counted too. Disabled with
+    TERMINAL_ADMISSION_ENABLED=False.
+    """
+
+    def __init__(self, get_response):
+        if not settings.TERMINAL_ADMISSION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        priority = admission.classify(request.path)
+        if not admission.enter(priority):
+            logger.warning(f"Shed {admission.PRIORITY_NAMES[priority]} request {request.method} {request.path}")
+            response = JsonResponse({
+                'success': False,
+                'error': 'Server is busy, retry shortly'
+            }, status=503)
+            response['Retry-After'] = str(settings.TERMINAL_ADMISSION_RETRY_AFTER)
+            return response
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            admission.leave(priority)
+            raise
+        if response.streaming:
+            # Exports do their work while the body is sent; count them until the server closes the response
+            response.close = self._leave_on_close(response.close, priority)
+        else:
+            admission.leave(priority)
+        return response
+
+    @staticmethod
+    def _leave_on_close(close, priority):
+        left = False
+
+        def close_and_leave():
+            nonlocal left
+            try:
+                close()
+            finally:
+                if not left:
+                    left = True
+                    admission.leave(priority)
+
+        return close_and_leave
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve read-only dashboard, export, stats and admin requests from the replica.
+
+    Active with TERMINAL_DATABASE_MODE = 'replica' (see terminal/db_routers.py).
+    A request that writes sets a short-lived cookie that keeps the client's
+    next requests on the primary.
+    """
+
+    def __init__(self, get_response):
+        if settings.TERMINAL_DATABASE_MODE != 'replica':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        use_replica = (
+            request.method in ('GET', 'HEAD')
+            and admission.classify(request.path) == admission.LOW
+            and PRIMARY_PIN_COOKIE not in request.COOKIES
+        )
+        with replica_reads(use_replica) as state:
+            response = self.get_response(request)
+        if use_replica and response.streaming:
+            # Exports query while the body is sent, after this method returned
+            response.streaming_content = self._stream_from_replica(response.streaming_content)
+        if state.wrote:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, '1', max_age=settings.TERMINAL_REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax'
+            )
+        return response
+
+    @staticmethod
+    def _stream_from_replica(content):
+        with replica_reads():
+            yield from content
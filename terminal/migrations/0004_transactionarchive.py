@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminal', '0003_transaction_status_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_id', models.CharField(db_index=True, max_length=255)),
+                ('terminal_link_id', models.BigIntegerField(blank=True, null=True)),
+                ('amount', models.IntegerField(help_text='Amount in cents')),
+                ('status', models.CharField(choices=[('started', 'Started'), ('success', 'Success'), ('failed', 'Failed'), ('timeout', 'Timeout')], max_length=20)),
+                ('error_msg', models.TextField(blank=True, null=True)),
+                ('receipt_compressed', models.BinaryField(blank=True, null=True)),
+                ('shop_domain', models.CharField(max_length=255)),
+                ('location_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('staff_member_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shop_domain', 'created_at'], name='terminal_archive_shop_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:43
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def move_receipts(apps, schema_editor):
+    Transaction = apps.get_model('terminal', 'Transaction')
+    TransactionReceipt = apps.get_model('terminal', 'TransactionReceipt')
+    db = schema_editor.connection.alias
+    last_pk = 0
+    while True:
+        rows = list(
+            Transaction.objects.using(db).filter(pk__gt=last_pk, receipt__isnull=False)
+            .order_by('pk').values_list('pk', 'receipt')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        receipts = []
+        for pk, receipt in rows:
+            encoded = receipt.encode('utf-8')
+            receipts.append(TransactionReceipt(
+                transaction_id=pk,
+                data=zlib.compress(encoded, 6),
+                digest=hashlib.sha256(encoded).hexdigest(),
+                size=len(encoded),
+            ))
+        TransactionReceipt.objects.using(db).bulk_create(receipts)
+        last_pk = rows[-1][0]
+
+
+def restore_receipts(apps, schema_editor):
+    Transaction = apps.get_model('terminal', 'Transaction')
+    TransactionReceipt = apps.get_model('terminal', 'TransactionReceipt')
+    db = schema_editor.connection.alias
+    for receipt in TransactionReceipt.objects.using(db).iterator(chunk_size=BATCH_SIZE):
+        Transaction.objects.using(db).filter(pk=receipt.transaction_id).update(
+            receipt=zlib.decompress(bytes(receipt.data)).decode('utf-8')
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminal', '0004_transactionarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionReceipt',
+            fields=[
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='receipt_record', serialize=False, to='terminal.transaction')),
+                ('data', models.BinaryField()),
+                ('digest', models.CharField(max_length=64)),
+                ('size', models.PositiveIntegerField(help_text='Uncompressed size in bytes')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(move_receipts, restore_receipts),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='receipt',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminal', '0005_transactionreceipt'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['shop_domain', 'created_at'], name='terminal_tx_shop_created'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminal', '0006_transaction_shop_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTransactionStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shop_domain', models.CharField(max_length=255)),
+                ('terminal_id', models.CharField(blank=True, default='', max_length=255)),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('started', 'Started'), ('success', 'Success'), ('failed', 'Failed'), ('timeout', 'Timeout')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('amount_total', models.BigIntegerField(default=0, help_text='Sum of amounts in cents')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shop_domain', 'day'], name='terminal_dailystat_shop_day')],
+                'constraints': [models.UniqueConstraint(fields=('shop_domain', 'terminal_id', 'day', 'status'), name='terminal_dailystat_unique')],
+            },
+        ),
+    ]
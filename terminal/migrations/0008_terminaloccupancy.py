@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminal', '0007_dailytransactionstat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TerminalOccupancy',
+            fields=[
+                ('terminal_link', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='occupancy', serialize=False, to='terminal.terminallinks')),
+                ('transaction_id', models.CharField(blank=True, db_index=True, max_length=255, null=True)),
+                ('claimed_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'Terminal occupancy',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminal', '0008_terminaloccupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TerminalHealthCheck',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checked_at', models.DateTimeField()),
+                ('reachable', models.BooleanField()),
+                ('latency_ms', models.IntegerField(blank=True, null=True)),
+                ('error', models.CharField(blank=True, max_length=255, null=True)),
+                ('terminal_link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='health_checks', to='terminal.terminallinks')),
+            ],
+            options={
+                'ordering': ['-checked_at'],
+                'indexes': [models.Index(fields=['terminal_link', '-checked_at'], name='terminal_health_link_checked'), models.Index(fields=['checked_at'], name='terminal_health_checked')],
+            },
+        ),
+    ]
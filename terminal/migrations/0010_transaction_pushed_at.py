@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminal', '0009_terminalhealthcheck'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='pushed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
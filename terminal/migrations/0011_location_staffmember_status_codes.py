@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:22
+
+import django.db.models.deletion
+import terminal.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """First step of the compact Transaction layout: new columns next to the old ones"""
+
+    dependencies = [
+        ('terminal', '0010_transaction_pushed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shop_domain', models.CharField(max_length=255)),
+                ('value', models.CharField(max_length=255)),
+            ],
+            options={
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('shop_domain', 'value'), name='terminal_location_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StaffMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shop_domain', models.CharField(max_length=255)),
+                ('value', models.CharField(max_length=255)),
+            ],
+            options={
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('shop_domain', 'value'), name='terminal_staffmember_unique')],
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='location_ref',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='terminal.location'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='staff_ref',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='terminal.staffmember'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='status_code',
+            field=terminal.models.StatusField(choices=[('started', 'Started'), ('success', 'Success'), ('failed', 'Failed'), ('timeout', 'Timeout')], null=True),
+        ),
+        migrations.AddField(
+            model_name='transactionarchive',
+            name='status_code',
+            field=terminal.models.StatusField(choices=[('started', 'Started'), ('success', 'Success'), ('failed', 'Failed'), ('timeout', 'Timeout')], null=True),
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:24
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 2000
+STATUSES = ('started', 'success', 'failed', 'timeout')
+
+
+def _status(value):
+    # Upstream states without a code (e.g. 'waiting') were never final
+    return value if value in STATUSES else 'started'
+
+
+def _intern(model, db, interned, shop_domain, value):
+    if value is None or value == '':
+        return None
+    if (shop_domain, value) not in interned:
+        interned[shop_domain, value] = model.objects.using(db).get_or_create(shop_domain=shop_domain, value=value)[0].pk
+    return interned[shop_domain, value]
+
+
+def fill_columns(apps, schema_editor):
+    """Copy status, location and staff into the compact columns, one committed batch at a time"""
+    Transaction = apps.get_model('terminal', 'Transaction')
+    TransactionArchive = apps.get_model('terminal', 'TransactionArchive')
+    Location = apps.get_model('terminal', 'Location')
+    StaffMember = apps.get_model('terminal', 'StaffMember')
+    db = schema_editor.connection.alias
+    locations, staff = {}, {}
+
+    last_pk = 0
+    while True:
+        rows = list(
+            Transaction.objects.using(db).filter(pk__gt=last_pk, status_code__isnull=True)
+            .order_by('pk').values_list('pk', 'status', 'shop_domain', 'location_id', 'staff_member_id')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        with transaction.atomic(using=db):
+            Transaction.objects.using(db).bulk_update([
+                Transaction(
+                    pk=pk,
+                    status_code=_status(status),
+                    location_ref_id=_intern(Location, db, locations, shop_domain, location_id),
+                    staff_ref_id=_intern(StaffMember, db, staff, shop_domain, staff_member_id),
+                ) for pk, status, shop_domain, location_id, staff_member_id in rows
+            ], ['status_code', 'location_ref', 'staff_ref'])
+        last_pk = rows[-1][0]
+
+    last_pk = 0
+    while True:
+        rows = list(
+            TransactionArchive.objects.using(db).filter(pk__gt=last_pk, status_code__isnull=True)
+            .order_by('pk').values_list('pk', 'status')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        with transaction.atomic(using=db):
+            TransactionArchive.objects.using(db).bulk_update(
+                [TransactionArchive(pk=pk, status_code=_status(status)) for pk, status in rows], ['status_code']
+            )
+        last_pk = rows[-1][0]
+
+
+def restore_columns(apps, schema_editor):
+    Transaction = apps.get_model('terminal', 'Transaction')
+    TransactionArchive = apps.get_model('terminal', 'TransactionArchive')
+    db = schema_editor.connection.alias
+
+    last_pk = 0
+    while True:
+        rows = list(
+            Transaction.objects.using(db).filter(pk__gt=last_pk)
+            .select_related('location_ref', 'staff_ref').order_by('pk')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        for row in rows:
+            row.status = row.status_code
+            row.location_id = row.location_ref.value if row.location_ref_id else None
+            row.staff_member_id = row.staff_ref.value if row.staff_ref_id else None
+        with transaction.atomic(using=db):
+            Transaction.objects.using(db).bulk_update(rows, ['status', 'location_id', 'staff_member_id'])
+        last_pk = rows[-1].pk
+
+    last_pk = 0
+    while True:
+        rows = list(TransactionArchive.objects.using(db).filter(pk__gt=last_pk).order_by('pk')[:BATCH_SIZE])
+        if not rows:
+            break
+        for row in rows:
+            row.status = row.status_code
+        with transaction.atomic(using=db):
+            TransactionArchive.objects.using(db).bulk_update(rows, ['status'])
+        last_pk = rows[-1].pk
+
+
+class Migration(migrations.Migration):
+    """
+    Second step: fill the compact columns in batches
+
+    Not atomic, so every batch commits on its own and no lock is held on the
+    whole table; rerunning after an interruption skips filled rows.
+    """
+    atomic = False
+
+    dependencies = [
+        ('terminal', '0011_location_staffmember_status_codes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_columns, restore_columns),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:26
+
+import terminal.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Last step: drop the wide columns and take over their names"""
+
+    dependencies = [
+        ('terminal', '0012_fill_compact_transaction_columns'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='terminal_tx_status_created',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='status',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='location_id',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='staff_member_id',
+        ),
+        migrations.RenameField(
+            model_name='transaction',
+            old_name='status_code',
+            new_name='status',
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='status',
+            field=terminal.models.StatusField(choices=[('started', 'Started'), ('success', 'Success'), ('failed', 'Failed'), ('timeout', 'Timeout')], default='started'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'created_at'], name='terminal_tx_status_created'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='amount',
+            field=models.BigIntegerField(help_text='Amount in cents'),
+        ),
+        migrations.RemoveField(
+            model_name='transactionarchive',
+            name='status',
+        ),
+        migrations.RenameField(
+            model_name='transactionarchive',
+            old_name='status_code',
+            new_name='status',
+        ),
+        migrations.AlterField(
+            model_name='transactionarchive',
+            name='status',
+            field=terminal.models.StatusField(choices=[('started', 'Started'), ('success', 'Success'), ('failed', 'Failed'), ('timeout', 'Timeout')]),
+        ),
+        migrations.AlterField(
+            model_name='transactionarchive',
+            name='amount',
+            field=models.BigIntegerField(help_text='Amount in cents'),
+        ),
+    ]
@@ -4,8 +4,11 @@ import time
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
+from terminal.diagnostics import register_store
+
 # In-memory storage for mock transactions
 MOCK_TRANSACTIONS = {}
+register_store('mock_views.MOCK_TRANSACTIONS', MOCK_TRANSACTIONS)
 
 
 @csrf_exempt
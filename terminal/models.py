@@ -1,4 +1,97 @@
-from django.db import models
+import hashlib
+import zlib
+
+from django.core.exceptions import ValidationError
+from django.db import models, router
+from django.utils.functional import cached_property
+
+from terminal.shards import ShardedManager
+
+STATUS_CHOICES = [
+    ('started', 'Started'),
+    ('success', 'Success'),
+    ('failed', 'Failed'),
+    ('timeout', 'Timeout'),
+]
+# Codes stored in the database; never renumber them
+STATUS_CODES = {'started': 1, 'success': 2, 'failed': 3, 'timeout': 4}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+
+def decompress_text(data):
+    if data is None:
+        return None
+    return zlib.decompress(bytes(data)).decode('utf-8')
+
+
+class StatusField(models.PositiveSmallIntegerField):
+    """
+    Transaction status stored as a 2-byte code (STATUS_CODES)
+
+    Python code, lookups and forms use the status names ('started', ...);
+    only the column holds the code.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', STATUS_CHOICES)
+        super().__init__(*args, **kwargs)
+
+    @cached_property
+    def validators(self):
+        # Values are names, so the integer range validators do not apply
+        return [*self.default_validators, *self._validators]
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else STATUS_NAMES[value]
+
+    def to_python(self, value):
+        if value is None or value in STATUS_CODES:
+            return value
+        try:
+            return STATUS_NAMES[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(f"{value!r} is not a transaction status", code='invalid')
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, int):
+            return value
+        try:
+            return STATUS_CODES[value]
+        except (KeyError, TypeError):
+            raise ValueError(f"Field '{self.name}' expected a transaction status but got {value!r}") from None
+
+
+class PosReference(models.Model):
+    """A shop's Shopify id (location, staff member) stored once and referenced by transactions"""
+    shop_domain = models.CharField(max_length=255)
+    value = models.CharField(max_length=255)
+
+    objects = ShardedManager()
+
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(fields=['shop_domain', 'value'], name='terminal_%(class)s_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.shop_domain} {self.value}"
+
+    @classmethod
+    def intern(cls, shop_domain, value, using=None):
+        """The reference for `value`, created on first use; None for an empty value"""
+        if value is None or value == '':
+            return None
+        reference, _ = cls.objects.db_manager(using).get_or_create(shop_domain=shop_domain, value=str(value))
+        return reference
+
+
+class Location(PosReference):
+    pass
+
+
+class StaffMember(PosReference):
+    pass
 
 
 class TerminalLinks(models.Model):
@@ -14,6 +107,7 @@ class TerminalLinks(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_demo = models.BooleanField(default=False)
 
+    objects = ShardedManager()
 
     class Meta:
         verbose_name_plural = "Terminal Links"
@@ -24,24 +118,222 @@ class TerminalLinks(models.Model):
 
 class Transaction(models.Model):
     """Logs all transactions for debugging and reconciliation"""
-    STATUS_CHOICES = [
-        ('started', 'Started'),
-        ('success', 'Success'),
-        ('failed', 'Failed'),
-        ('timeout', 'Timeout'),
-    ]
+    STATUS_CHOICES = STATUS_CHOICES
+    FINAL_STATUSES = ('success', 'failed', 'timeout')
 
     transaction_id = models.CharField(max_length=255, db_index=True)
     terminal_link = models.ForeignKey(TerminalLinks, on_delete=models.SET_NULL, null=True)
-    amount = models.IntegerField(help_text="Amount in cents")
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='started')
+    amount = models.BigIntegerField(help_text="Amount in cents")
+    status = StatusField(default='started')
     error_msg = models.TextField(blank=True, null=True)
-    receipt = models.TextField(blank=True, null=True)
     shop_domain = models.CharField(max_length=255)
-    location_id = models.CharField(max_length=255, blank=True, null=True)
-    staff_member_id = models.CharField(max_length=255, blank=True, null=True)
+    # Read and set through location_id / staff_member_id; nothing filters on them, so no index
+    location_ref = models.ForeignKey(Location, on_delete=models.PROTECT, blank=True, null=True,
+                                     db_index=False, related_name='+')
+    staff_ref = models.ForeignKey(StaffMember, on_delete=models.PROTECT, blank=True, null=True,
+                                  db_index=False, related_name='+')
+    # Last time Pin Vandaag pushed a final result for this transaction; once set, status polls stop asking upstream
+    pushed_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            # Open-transaction scans (stale sweeper, "started" filters) by age
+            models.Index(fields=['status', 'created_at'], name='terminal_tx_status_created'),
+            # Per-shop listings and exports by date range
+            models.Index(fields=['shop_domain', 'created_at'], name='terminal_tx_shop_created'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_id} - {self.status}"
+
+    @property
+    def location_id(self):
+        """Shopify location id (select_related('location_ref') when reading many rows)"""
+        if hasattr(self, '_pending_location_id'):
+            return self._pending_location_id
+        return self.location_ref.value if self.location_ref_id else None
+
+    @location_id.setter
+    def location_id(self, value):
+        # Interned into Location on the next save()
+        self._pending_location_id = value
+
+    @property
+    def staff_member_id(self):
+        """Shopify staff member id (select_related('staff_ref') when reading many rows)"""
+        if hasattr(self, '_pending_staff_member_id'):
+            return self._pending_staff_member_id
+        return self.staff_ref.value if self.staff_ref_id else None
+
+    @staff_member_id.setter
+    def staff_member_id(self, value):
+        # Interned into StaffMember on the next save()
+        self._pending_staff_member_id = value
+
+    @property
+    def receipt(self):
+        """Receipt text, loaded from TransactionReceipt on first access"""
+        if hasattr(self, '_pending_receipt'):
+            return self._pending_receipt
+        try:
+            return self.receipt_record.text
+        except TransactionReceipt.DoesNotExist:
+            return None
+
+    @receipt.setter
+    def receipt(self, text):
+        # Written to TransactionReceipt on the next save()
+        self._pending_receipt = text
+
+    def save(self, *args, **kwargs):
+        if hasattr(self, '_pending_location_id') or hasattr(self, '_pending_staff_member_id'):
+            using = kwargs.get('using') or router.db_for_write(Transaction, instance=self)
+            if hasattr(self, '_pending_location_id'):
+                self.location_ref = Location.intern(self.shop_domain, self._pending_location_id, using)
+                del self._pending_location_id
+            if hasattr(self, '_pending_staff_member_id'):
+                self.staff_ref = StaffMember.intern(self.shop_domain, self._pending_staff_member_id, using)
+                del self._pending_staff_member_id
+        super().save(*args, **kwargs)
+        if hasattr(self, '_pending_receipt'):
+            TransactionReceipt.store(self.pk, self._pending_receipt, using=self._state.db)
+            del self._pending_receipt
+            self._state.fields_cache.pop('receipt_record', None)
+
+
+class TransactionReceipt(models.Model):
+    """zlib-compressed receipt text, kept out of the Transaction row"""
+    transaction = models.OneToOneField(
+        Transaction, on_delete=models.CASCADE, primary_key=True, related_name='receipt_record'
+    )
+    data = models.BinaryField()
+    # sha256 of the uncompressed text, served as the receipt's strong ETag
+    digest = models.CharField(max_length=64)
+    size = models.PositiveIntegerField(help_text="Uncompressed size in bytes")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Receipt for {self.transaction_id} ({self.size} bytes)"
+
+    @property
+    def text(self):
+        return decompress_text(self.data)
+
+    @staticmethod
+    def digest_of(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def store(cls, transaction_pk, text, using=None):
+        """Create, replace or (for None) remove the receipt of a transaction (on its database, `using`)"""
+        receipts = cls.objects.db_manager(using)
+        if text is None:
+            receipts.filter(transaction_id=transaction_pk).delete()
+            return None
+        encoded = text.encode('utf-8')
+        digest = cls.digest_of(text)
+        if receipts.filter(transaction_id=transaction_pk, digest=digest).exists():
+            return None
+        receipt, _ = receipts.update_or_create(
+            transaction_id=transaction_pk,
+            defaults={'data': zlib.compress(encoded, 6), 'digest': digest, 'size': len(encoded)},
+        )
+        return receipt
+
+
+class TransactionArchive(models.Model):
+    """Compact copy of transactions moved out of the live table for reconciliation"""
+    transaction_id = models.CharField(max_length=255, db_index=True)
+    # Plain id instead of a foreign key: terminal links may be deleted after archiving
+    terminal_link_id = models.BigIntegerField(blank=True, null=True)
+    amount = models.BigIntegerField(help_text="Amount in cents")
+    status = StatusField()
+    error_msg = models.TextField(blank=True, null=True)
+    receipt_compressed = models.BinaryField(blank=True, null=True)
+    shop_domain = models.CharField(max_length=255)
+    location_id = models.CharField(max_length=255, blank=True, null=True)
+    staff_member_id = models.CharField(max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['shop_domain', 'created_at'], name='terminal_archive_shop_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.transaction_id} - {self.status} (archived)"
+
+    @property
+    def receipt(self):
+        return decompress_text(self.receipt_compressed)
+
+
+class TerminalOccupancy(models.Model):
+    """A terminal that is running a payment; at most one row per terminal"""
+    terminal_link = models.OneToOneField(
+        TerminalLinks, on_delete=models.CASCADE, primary_key=True, related_name='occupancy'
+    )
+    # Empty while the start call to Pin Vandaag is still in flight
+    transaction_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+    claimed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "Terminal occupancy"
+
+    def __str__(self):
+        return f"{self.terminal_link_id} busy with {self.transaction_id or 'starting payment'}"
+
+
+class DailyTransactionStat(models.Model):
+    """Per shop, terminal, day and status totals, maintained on every status transition"""
+    shop_domain = models.CharField(max_length=255)
+    # Pin Vandaag terminal id, empty for transactions without a terminal link
+    terminal_id = models.CharField(max_length=255, blank=True, default='')
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Transaction.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+    amount_total = models.BigIntegerField(default=0, help_text="Sum of amounts in cents")
+
+    objects = ShardedManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['shop_domain', 'terminal_id', 'day', 'status'],
+                name='terminal_dailystat_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['shop_domain', 'day'], name='terminal_dailystat_shop_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.shop_domain} {self.terminal_id} {self.day} {self.status}: {self.count}"
+
+
+class TerminalHealthCheck(models.Model):
+    """Result of one reachability probe of a terminal, written by `manage.py probe_terminals`"""
+    terminal_link = models.ForeignKey(TerminalLinks, on_delete=models.CASCADE, related_name='health_checks')
+    checked_at = models.DateTimeField()
+    reachable = models.BooleanField()
+    latency_ms = models.IntegerField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        ordering = ['-checked_at']
+        indexes = [
+            models.Index(fields=['terminal_link', '-checked_at'], name='terminal_health_link_checked'),
+            models.Index(fields=['checked_at'], name='terminal_health_checked'),
+        ]
+
+    def __str__(self):
+        state = 'reachable' if self.reachable else 'offline'
+        return f"{self.terminal_link_id} {state} at {self.checked_at}"
@@ -0,0 +1,57 @@
+"""
+Wake status requests that wait for a transaction to change
+
+Every change of a pushed transaction bumps its version in a SharedTable.
+Waiters in the same worker are woken through a Condition; waiters in other
+workers notice the new version on their next check, every POLL_INTERVAL
+seconds, which costs a few microseconds and no database query.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from terminal.sharedmem import SharedTable
+
+POLL_INTERVAL = 0.05
+
+_versions = SharedTable(
+    os.path.join(settings.TERMINAL_SHARED_MEMORY_DIR, 'notify.bin'),
+    slots=settings.TERMINAL_NOTIFY_SLOTS,
+    value_format='q',
+)
+_condition = threading.Condition()
+
+
+def version(transaction_id):
+    stored = _versions.get(f'tx:{transaction_id}')
+    return stored[0] if stored else 0
+
+
+def publish(transaction_id):
+    """Signal that a transaction changed"""
+    _versions.update(f'tx:{transaction_id}', lambda stored: (((stored[0] if stored else 0) + 1,), None))
+    with _condition:
+        _condition.notify_all()
+
+
+def wait_for_change(transaction_id, seen_version, timeout):
+    """
+    Block until the transaction's version moves past `seen_version`
+
+    Returns:
+        bool: True if it changed, False on timeout
+    """
+    deadline = time.monotonic() + timeout
+    while version(transaction_id) == seen_version:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        with _condition:
+            _condition.wait(min(POLL_INTERVAL, remaining))
+    return True
+
+
+def reset():
+    _versions.clear()
@@ -0,0 +1,76 @@
+"""
+Terminal occupancy: which terminals are running a payment right now
+
+A physical terminal handles one payment at a time. A start claims the
+terminal by inserting its TerminalOccupancy row (the primary key makes the
+claim atomic across workers); the claim is released when the transaction
+reaches a final state, or expires after TERMINAL_OCCUPANCY_TTL seconds.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+
+from terminal.models import TerminalOccupancy
+from terminal.shards import current_shard
+
+logger = logging.getLogger(__name__)
+
+
+def claim_terminal(terminal):
+    """
+    Try to mark a terminal as busy
+
+    Returns:
+        tuple: (True, None) if claimed, or (False, active_transaction_id) if the
+        terminal is already busy (the id is None while that start is in flight)
+    """
+    now = timezone.now()
+    TerminalOccupancy.objects.filter(
+        terminal_link=terminal,
+        claimed_at__lt=now - timedelta(seconds=settings.TERMINAL_OCCUPANCY_TTL)
+    ).delete()
+
+    try:
+        with db_transaction.atomic(using=current_shard()):
+            TerminalOccupancy.objects.create(terminal_link=terminal, claimed_at=now)
+        return True, None
+    except IntegrityError:
+        active = TerminalOccupancy.objects.filter(terminal_link=terminal).values_list(
+            'transaction_id', flat=True
+        ).first()
+        logger.info(f"Terminal {terminal} is busy with transaction {active}")
+        return False, active
+
+
+def bind_transaction(terminal, transaction_id):
+    """Record which transaction holds a claimed terminal"""
+    TerminalOccupancy.objects.filter(terminal_link=terminal).update(transaction_id=transaction_id)
+
+
+def release_terminal(terminal_link_id, transaction_id=None):
+    """
+    Release a terminal claim
+
+    Args:
+        terminal_link_id: Terminal to release
+        transaction_id: Only release if the claim belongs to this transaction
+    """
+    claims = TerminalOccupancy.objects.filter(terminal_link_id=terminal_link_id)
+    if transaction_id is not None:
+        claims = claims.filter(transaction_id=transaction_id)
+    claims.delete()
+
+
+def release_transactions(transaction_ids):
+    """Release the claims held by any of the given transactions"""
+    TerminalOccupancy.objects.filter(transaction_id__in=transaction_ids).delete()
+
+
+def is_busy(terminal):
+    return TerminalOccupancy.objects.filter(
+        terminal_link=terminal,
+        claimed_at__gte=timezone.now() - timedelta(seconds=settings.TERMINAL_OCCUPANCY_TTL)
+    ).exists()
@@ -0,0 +1,100 @@
+"""
+Open transactions in host shared memory
+
+Every worker polling a running payment needs the same few facts: which
+terminal it runs on, when it started and whether it is still open. They are
+kept in a SharedTable keyed by transaction id, so a status poll on any
+worker finds them with one memory lookup instead of a database query, and a
+poll whose upstream status did not change writes nothing at all.
+
+A record is only trusted while its transaction is 'started', was not pushed,
+has no error or receipt, belongs to the polling shop and is younger than
+TERMINAL_STALE_TRANSACTION_SECONDS (after which the sweeper owns the row);
+anything else falls back to the database.
+"""
+import os
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from terminal.sharedmem import SharedTable, key_hash
+
+STATUSES = ('started', 'success', 'failed', 'timeout')
+
+PUSHED = 1
+HAS_RECEIPT = 2
+HAS_ERROR = 4
+
+OpenTransaction = namedtuple('OpenTransaction', 'pk terminal_link_id created_at')
+
+_table = SharedTable(
+    os.path.join(settings.TERMINAL_SHARED_MEMORY_DIR, 'open_transactions.bin'),
+    slots=settings.TERMINAL_OPEN_TRANSACTION_SLOTS,
+    # pk, terminal link id, shop hash, status, flags, created_at
+    value_format='qqQBBd',
+)
+
+
+def remember_transaction(transaction, has_receipt=False):
+    """
+    Store the current state of a transaction
+
+    Args:
+        transaction: Saved Transaction
+        has_receipt: Whether a receipt is stored for it
+    """
+    # Upstream states outside STATUSES (e.g. 'pending') are still waiting
+    status = STATUSES.index(transaction.status) if transaction.status in STATUSES else 0
+    flags = ((PUSHED if transaction.pushed_at else 0) | (HAS_RECEIPT if has_receipt else 0)
+             | (HAS_ERROR if transaction.error_msg else 0))
+
+    def store(stored):
+        # A receipt stays stored when later updates do not repeat it
+        kept = stored[4] & HAS_RECEIPT if stored and stored[0] == transaction.pk else 0
+        return (transaction.pk, transaction.terminal_link_id or 0, key_hash(transaction.shop_domain),
+                status, flags | kept, transaction.created_at.timestamp()), None
+
+    _table.update(f'tx:{transaction.transaction_id}', store)
+
+
+def mark_timed_out(transaction_ids):
+    """
+    Close the records of transactions the sweeper timed out in bulk
+
+    The sweeper updates rows without remember_transaction(); without this a
+    poll would keep finding the transaction open here.
+    """
+    def close(stored):
+        if stored is None:
+            return (0, 0, 0, STATUSES.index('timeout'), HAS_ERROR, 0.0), None
+        pk, terminal_link_id, shop_hash, _, flags, created_at = stored
+        return (pk, terminal_link_id, shop_hash, STATUSES.index('timeout'), flags | HAS_ERROR, created_at), None
+
+    for transaction_id in transaction_ids:
+        # Only rewrite records that exist, so the sweep does not fill the table
+        if _table.get(f'tx:{transaction_id}') is not None:
+            _table.update(f'tx:{transaction_id}', close)
+
+
+def find_open_transaction(transaction_id, shop_domain, now=None):
+    """
+    Open transaction `transaction_id` of `shop_domain`
+
+    Returns:
+        OpenTransaction, or None if it is unknown, not open or not the shop's
+    """
+    stored = _table.get(f'tx:{transaction_id}')
+    if stored is None:
+        return None
+    pk, terminal_link_id, shop_hash, status, flags, created_at = stored
+    now = time.time() if now is None else now
+    if (STATUSES[status] != 'started' or flags or not terminal_link_id or shop_hash != key_hash(shop_domain)
+            or now - created_at >= settings.TERMINAL_STALE_TRANSACTION_SECONDS):
+        return None
+    return OpenTransaction(pk, terminal_link_id, datetime.fromtimestamp(created_at, tz=timezone.utc))
+
+
+def reset():
+    _table.clear()
@@ -0,0 +1,129 @@
+"""
+Next-poll hints from per-terminal completion-time history
+
+Each terminal keeps a compact sketch of how long its payments take to reach
+a final status: a histogram over logarithmic time buckets whose counts decay
+with a half-life of TERMINAL_COMPLETION_HALF_LIFE_HOURS, so quantiles follow
+recent behaviour. Sketches live in a SharedTable (one fixed-size record per
+terminal), so every worker learns from every completion.
+
+The hint spaces polls out while the customer is most likely still tapping
+(before the terminal's 10th percentile), polls densely around the usual
+approval time, and backs off slowly once the payment takes unusually long.
+"""
+import math
+import os
+import time
+
+from django.conf import settings
+
+from terminal.sharedmem import SharedTable
+
+BUCKETS = 32
+# Bucket i covers [FIRST_BUCKET_MS * GROWTH**i, FIRST_BUCKET_MS * GROWTH**(i + 1))
+FIRST_BUCKET_MS = 500
+GROWTH = 1.25
+# Below this decayed sample weight the history is not trusted yet
+MIN_WEIGHT = 3
+
+_sketches = SharedTable(
+    os.path.join(settings.TERMINAL_SHARED_MEMORY_DIR, 'completion.bin'),
+    slots=settings.TERMINAL_COMPLETION_SKETCH_SLOTS,
+    value_format=f'd{BUCKETS}f',
+)
+
+
+def bucket_index(duration_ms):
+    if duration_ms < FIRST_BUCKET_MS:
+        return 0
+    return min(BUCKETS - 1, int(math.log(duration_ms / FIRST_BUCKET_MS, GROWTH)))
+
+
+def _decayed(stored, now):
+    if not stored:
+        return [0.0] * BUCKETS
+    updated_at, *counts = stored
+    factor = 0.5 ** (max(0.0, now - updated_at) / (settings.TERMINAL_COMPLETION_HALF_LIFE_HOURS * 3600))
+    return [count * factor for count in counts]
+
+
+def record_completion(terminal_link_id, duration_ms, now=None):
+    """Add one completion time to the terminal's sketch"""
+    now = time.time() if now is None else now
+    index = bucket_index(duration_ms)
+
+    def add(stored):
+        counts = _decayed(stored, now)
+        counts[index] += 1
+        return (now, *counts), None
+
+    _sketches.update(f'terminal:{terminal_link_id}', add)
+
+
+def quantiles(counts, qs):
+    """
+    Estimate quantiles (in ms) from histogram counts
+
+    Interpolates geometrically inside the bucket holding each quantile.
+    """
+    total = sum(counts)
+    results = []
+    for q in qs:
+        target = q * total
+        seen = 0.0
+        for index, count in enumerate(counts):
+            if count and seen + count >= target:
+                fraction = (target - seen) / count
+                results.append(FIRST_BUCKET_MS * GROWTH ** (index + fraction))
+                break
+            seen += count
+        else:
+            results.append(FIRST_BUCKET_MS * GROWTH ** BUCKETS)
+    return results
+
+
+def completion_quantiles(terminal_link_id, qs=(0.1, 0.5, 0.9), now=None):
+    """
+    Rolling completion-time quantiles of a terminal
+
+    Returns:
+        list: Quantiles in ms, or None while there is too little history
+    """
+    now = time.time() if now is None else now
+    counts = _decayed(_sketches.get(f'terminal:{terminal_link_id}'), now)
+    if sum(counts) < MIN_WEIGHT:
+        return None
+    return quantiles(counts, qs)
+
+
+def next_poll_ms(terminal_link_id, elapsed_ms, now=None):
+    """
+    Suggest when the POS should poll a running payment again
+
+    Args:
+        terminal_link_id: Terminal running the payment
+        elapsed_ms: Time since the payment was started
+
+    Returns:
+        int: Milliseconds until the next poll
+    """
+    fastest = int(settings.TERMINAL_POLL_INTERVAL_SECONDS * 1000)
+    slowest = settings.TERMINAL_POLL_MAX_MS
+    history = completion_quantiles(terminal_link_id, now=now) if terminal_link_id else None
+    if history is None:
+        return fastest
+
+    p10, p50, p90 = history
+    if elapsed_ms < p10:
+        # Customer is most likely still tapping: aim at the earliest usual completion
+        wait = p10 - elapsed_ms
+    elif elapsed_ms <= p90:
+        wait = fastest
+    else:
+        # Slower than usual: back off in proportion to how late it is
+        wait = (elapsed_ms - p90) / 2
+    return int(min(slowest, max(fastest, wait)))
+
+
+def reset():
+    _sketches.clear()
@@ -0,0 +1,202 @@
+"""
+Reconciliation of Pin Vandaag settlement exports against our transactions
+
+Both sides are streamed once into N partition files by a hash of the
+transaction id (a grace hash join), then each partition is joined in memory.
+Memory is bounded by the size of one settlement partition, never by the
+total number of rows, and the database is read with a single server-side
+cursor instead of per-row lookups.
+"""
+import csv
+import os
+import tempfile
+import zlib
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from terminal.models import Transaction, TransactionArchive
+from terminal.shards import shard_aliases
+
+SETTLEMENT_STATUS_MAP = {
+    'success': 'success',
+    'approved': 'success',
+    'paid': 'success',
+    'settled': 'success',
+    'failed': 'failed',
+    'declined': 'failed',
+    'refused': 'failed',
+    'cancelled': 'failed',
+    'canceled': 'failed',
+}
+
+REPORT_HEADER = ['kind', 'transaction_id', 'our_amount', 'settlement_amount', 'our_status', 'settlement_status']
+
+MISSING_IN_DB = 'missing_in_db'
+MISSING_IN_SETTLEMENT = 'missing_in_settlement'
+AMOUNT_MISMATCH = 'amount_mismatch'
+STATUS_MISMATCH = 'status_mismatch'
+DUPLICATE_IN_SETTLEMENT = 'duplicate_in_settlement'
+INVALID_SETTLEMENT_ROW = 'invalid_settlement_row'
+
+
+@dataclass
+class ReconciliationResult:
+    settlement_rows: int = 0
+    db_rows: int = 0
+    matched: int = 0
+    counts: dict = field(default_factory=dict)
+
+    def add(self, kind):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    @property
+    def discrepancies(self):
+        return sum(self.counts.values())
+
+
+def parse_amount(value, unit='cents'):
+    """
+    Parse a settlement amount into integer cents
+
+    Raises:
+        ValueError: If the value is not a number
+    """
+    try:
+        amount = Decimal(value.strip().replace(',', '.'))
+    except (InvalidOperation, AttributeError):
+        raise ValueError(f"Invalid amount: {value!r}")
+    if unit == 'euros':
+        amount *= 100
+    return int(amount.to_integral_value())
+
+
+def normalize_status(value):
+    value = (value or '').strip().lower()
+    return SETTLEMENT_STATUS_MAP.get(value, value)
+
+
+def _partition(transaction_id, partitions):
+    return zlib.crc32(transaction_id.encode('utf-8')) % partitions
+
+
+class _PartitionWriter:
+    def __init__(self, directory, prefix, partitions):
+        self.paths = [os.path.join(directory, f"{prefix}-{i}.csv") for i in range(partitions)]
+        self.files = [open(path, 'w', newline='', encoding='utf-8') for path in self.paths]
+        self.writers = [csv.writer(fh) for fh in self.files]
+        self.partitions = partitions
+
+    def write(self, transaction_id, *values):
+        self.writers[_partition(transaction_id, self.partitions)].writerow((transaction_id, *values))
+
+    def close(self):
+        for fh in self.files:
+            fh.close()
+
+
+def _read_partition(path):
+    with open(path, newline='', encoding='utf-8') as fh:
+        yield from csv.reader(fh)
+
+
+def database_rows(shop_domain=None, start=None, end=None, include_archive=False):
+    """Yield (transaction_id, amount, status) for our side of the join"""
+    models = [Transaction, TransactionArchive] if include_archive else [Transaction]
+    for model in models:
+        # A shop's rows sit on one shard; without a shop every shard is read
+        querysets = ([model.objects.for_shop(shop_domain)] if shop_domain
+                     else [model.objects.using(alias) for alias in shard_aliases()])
+        for queryset in querysets:
+            if start:
+                queryset = queryset.filter(created_at__gte=start)
+            if end:
+                queryset = queryset.filter(created_at__lt=end)
+            yield from queryset.values_list('transaction_id', 'amount', 'status').iterator(chunk_size=5000)
+
+
+def reconcile(settlement_file, report_writer, db_rows, partitions=64, amount_unit='cents',
+              id_column='transaction_id', amount_column='amount', status_column='status'):
+    """
+    Match a settlement CSV against our transactions
+
+    Args:
+        settlement_file: Open text file with the provider's settlement CSV
+        report_writer: csv.writer receiving one REPORT_HEADER row per discrepancy
+        db_rows: Iterable of (transaction_id, amount, status), see database_rows
+        partitions: Number of hash partitions; memory use is about 1/partitions
+            of the settlement file
+        amount_unit: 'cents' or 'euros' for the settlement amount column
+        id_column, amount_column, status_column: Settlement CSV column names
+
+    Returns:
+        ReconciliationResult
+    """
+    result = ReconciliationResult()
+    report_writer.writerow(REPORT_HEADER)
+
+    with tempfile.TemporaryDirectory(prefix='reconcile-') as workdir:
+        settlement_parts = _PartitionWriter(workdir, 'settlement', partitions)
+        try:
+            for row in csv.DictReader(settlement_file):
+                result.settlement_rows += 1
+                transaction_id = (row.get(id_column) or '').strip()
+                try:
+                    amount = parse_amount(row.get(amount_column), amount_unit)
+                except ValueError:
+                    amount = None
+                if not transaction_id or amount is None:
+                    result.add(INVALID_SETTLEMENT_ROW)
+                    report_writer.writerow([INVALID_SETTLEMENT_ROW, transaction_id, '', row.get(amount_column), '', ''])
+                    continue
+                settlement_parts.write(transaction_id, amount, normalize_status(row.get(status_column)))
+        finally:
+            settlement_parts.close()
+
+        db_parts = _PartitionWriter(workdir, 'db', partitions)
+        try:
+            for transaction_id, amount, status in db_rows:
+                result.db_rows += 1
+                db_parts.write(transaction_id, amount, status)
+        finally:
+            db_parts.close()
+
+        for settlement_path, db_path in zip(settlement_parts.paths, db_parts.paths):
+            _join_partition(settlement_path, db_path, report_writer, result)
+
+    return result
+
+
+def _join_partition(settlement_path, db_path, report_writer, result):
+    settlement = {}
+    for transaction_id, amount, status in _read_partition(settlement_path):
+        if transaction_id in settlement:
+            result.add(DUPLICATE_IN_SETTLEMENT)
+            report_writer.writerow([DUPLICATE_IN_SETTLEMENT, transaction_id, '', amount, '', status])
+        settlement[transaction_id] = (int(amount), status)
+
+    for transaction_id, amount, status in _read_partition(db_path):
+        amount = int(amount)
+        match = settlement.pop(transaction_id, None)
+        if match is None:
+            # Only payments that were (or may have been) taken should be settled
+            if status != 'failed':
+                result.add(MISSING_IN_SETTLEMENT)
+                report_writer.writerow([MISSING_IN_SETTLEMENT, transaction_id, amount, '', status, ''])
+            continue
+
+        settlement_amount, settlement_status = match
+        matched = True
+        if amount != settlement_amount:
+            matched = False
+            result.add(AMOUNT_MISMATCH)
+            report_writer.writerow([AMOUNT_MISMATCH, transaction_id, amount, settlement_amount, status, settlement_status])
+        if settlement_status and status != settlement_status:
+            matched = False
+            result.add(STATUS_MISMATCH)
+            report_writer.writerow([STATUS_MISMATCH, transaction_id, amount, settlement_amount, status, settlement_status])
+        if matched:
+            result.matched += 1
+
+    for transaction_id, (amount, status) in settlement.items():
+        result.add(MISSING_IN_DB)
+        report_writer.writerow([MISSING_IN_DB, transaction_id, '', amount, '', status])
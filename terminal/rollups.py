@@ -0,0 +1,182 @@
+"""
+Incrementally maintained daily rollups of transactions
+
+Every status transition moves a transaction's count and amount from the
+(shop, terminal, day, status) bucket of its old status to the bucket of
+its new status, so dashboard aggregates read O(days) rollup rows instead of
+scanning Transaction.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from terminal.models import DailyTransactionStat, TerminalLinks, Transaction, TransactionArchive
+from terminal.shards import current_shard, each_shard
+
+
+def _bump(shop_domain, terminal_id, day, status, count, amount):
+    bucket = DailyTransactionStat.objects.filter(
+        shop_domain=shop_domain, terminal_id=terminal_id, day=day, status=status
+    )
+    if bucket.update(count=F('count') + count, amount_total=F('amount_total') + amount):
+        return
+    try:
+        with db_transaction.atomic(using=current_shard()):
+            DailyTransactionStat.objects.create(
+                shop_domain=shop_domain, terminal_id=terminal_id, day=day,
+                status=status, count=count, amount_total=amount
+            )
+    except IntegrityError:
+        # Another worker created the bucket first
+        bucket.update(count=F('count') + count, amount_total=F('amount_total') + amount)
+
+
+def record_transitions(rows, old_status, new_status):
+    """
+    Apply a status transition for many transactions at once
+
+    Args:
+        rows: Iterable of (shop_domain, terminal_id, created_at, amount)
+        old_status: Previous status, or None for newly created transactions
+        new_status: New status
+    """
+    if old_status == new_status:
+        return
+    buckets = defaultdict(lambda: [0, 0])
+    for shop_domain, terminal_id, created_at, amount in rows:
+        bucket = buckets[(shop_domain, terminal_id or '', timezone.localdate(created_at))]
+        bucket[0] += 1
+        bucket[1] += amount
+    for (shop_domain, terminal_id, day), (count, amount) in buckets.items():
+        if old_status:
+            _bump(shop_domain, terminal_id, day, old_status, -count, -amount)
+        _bump(shop_domain, terminal_id, day, new_status, count, amount)
+
+
+def record_transition(transaction, old_status, new_status):
+    """Apply a status transition of a single transaction to the rollups"""
+    terminal_id = transaction.terminal_link.terminal_id if transaction.terminal_link_id else ''
+    record_transitions(
+        [(transaction.shop_domain, terminal_id, transaction.created_at, transaction.amount)],
+        old_status, new_status
+    )
+
+
+def rebuild_rollups(start_day, end_day):
+    """
+    Recompute rollups for [start_day, end_day] from the Transaction and TransactionArchive tables
+
+    Used to backfill history and to repair drift; each day of each shard is
+    replaced in its own database transaction. Rows archived to an NDJSON
+    file are no longer in the database, so do not rebuild days archived that way.
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    written = 0
+    for alias in each_shard():
+        written += _rebuild_shard(alias, start_day, end_day)
+    return written
+
+
+def _rebuild_shard(alias, start_day, end_day):
+    written = 0
+    day = start_day
+    while day <= end_day:
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        end = start + timedelta(days=1)
+        totals = defaultdict(lambda: [0, 0])
+        live = (
+            Transaction.objects.filter(created_at__gte=start, created_at__lt=end)
+            .values_list('shop_domain', 'terminal_link__terminal_id', 'status')
+            .annotate(count=Count('pk'), amount_total=Sum('amount'))
+            .order_by()
+        )
+        for shop_domain, terminal_id, status, count, amount in live:
+            bucket = totals[(shop_domain, terminal_id or '', status)]
+            bucket[0] += count
+            bucket[1] += amount
+        archived = list(
+            TransactionArchive.objects.filter(created_at__gte=start, created_at__lt=end)
+            .values_list('shop_domain', 'terminal_link_id', 'status')
+            .annotate(count=Count('pk'), amount_total=Sum('amount'))
+            .order_by()
+        )
+        # The archive keeps the link id only; links deleted since count under ''
+        terminal_ids = dict(TerminalLinks.objects.filter(
+            pk__in={row[1] for row in archived if row[1]}
+        ).values_list('pk', 'terminal_id'))
+        for shop_domain, terminal_link_id, status, count, amount in archived:
+            bucket = totals[(shop_domain, terminal_ids.get(terminal_link_id) or '', status)]
+            bucket[0] += count
+            bucket[1] += amount
+        stats = [
+            DailyTransactionStat(
+                shop_domain=shop_domain,
+                terminal_id=terminal_id,
+                day=day,
+                status=status,
+                count=count,
+                amount_total=amount,
+            ) for (shop_domain, terminal_id, status), (count, amount) in totals.items()
+        ]
+        with db_transaction.atomic(using=alias):
+            DailyTransactionStat.objects.filter(day=day).delete()
+            DailyTransactionStat.objects.bulk_create(stats)
+        written += len(stats)
+        day += timedelta(days=1)
+    return written
+
+
+def shop_stats(shop_domain, days=30):
+    """
+    Dashboard aggregates for the last `days` days of a shop
+
+    Returns:
+        dict: Per-day totals, per-terminal volume and overall totals
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = DailyTransactionStat.objects.for_shop(shop_domain).filter(
+        day__gte=since
+    ).values_list('day', 'terminal_id', 'status', 'count', 'amount_total')
+
+    per_day = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    per_terminal = defaultdict(lambda: {'count': 0, 'revenue': 0})
+    for day, terminal_id, status, count, amount in rows:
+        per_day[day][status][0] += count
+        per_day[day][status][1] += amount
+        per_terminal[terminal_id]['count'] += count
+        if status == 'success':
+            per_terminal[terminal_id]['revenue'] += amount
+
+    def summarize(statuses):
+        count = sum(value[0] for value in statuses.values())
+        finished = sum(statuses[status][0] for status in Transaction.FINAL_STATUSES if status in statuses)
+        success = statuses['success'][0] if 'success' in statuses else 0
+        return {
+            'count': count,
+            'success_count': success,
+            'revenue': statuses['success'][1] if 'success' in statuses else 0,
+            'success_rate': round(success / finished, 4) if finished else None,
+            'by_status': {status: value[0] for status, value in statuses.items() if value[0]},
+        }
+
+    totals = defaultdict(lambda: [0, 0])
+    for statuses in per_day.values():
+        for status, (count, amount) in statuses.items():
+            totals[status][0] += count
+            totals[status][1] += amount
+
+    return {
+        'days': [
+            {'day': day.isoformat(), **summarize(per_day[day])} for day in sorted(per_day)
+        ],
+        'terminals': [
+            {'terminal_id': terminal_id, **values}
+            for terminal_id, values in sorted(per_terminal.items(), key=lambda item: -item[1]['count'])
+        ],
+        'totals': summarize(totals),
+    }
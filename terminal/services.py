@@ -1,19 +1,53 @@
 import requests
 import logging
 from django.conf import settings
-from .models import TerminalLinks
+from django.db import transaction as db_transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .bulkheads import bulkhead, probe_bulkhead
+from .cache import get_cache
+from .models import STATUS_CODES, TerminalLinks, Transaction
+from .occupancy import release_terminal
+from .open_transactions import remember_transaction
+from .polling import record_completion
+from .rollups import record_transition
+from .shards import shard_for, shard_scope
 
 
 logger = logging.getLogger(__name__)
 
+# Transaction id used by health probes, never issued by Pin Vandaag
+PROBE_TRANSACTION_ID = '0'
+
 
 class PinVandaagService:
     """Service class for communicating with Pin Vandaag API"""
 
-    def __init__(self, base_url=None):
+    def __init__(self, base_url=None, shop_domain=None):
         self.base_url = base_url or settings.PIN_VANDAAG_BASE_URL
+        # Shop the calls are made for, bounds its share of upstream concurrency
+        self.shop_domain = shop_domain
+
+    def _post(self, path, api_key, data, timeout=30, probe=False):
+        """
+        POST to Pin Vandaag inside the shop's and API key's bulkhead
+
+        Probes (`probe=True`) hold a probe slot of the shop instead.
+
+        Raises:
+            BulkheadFull: If no upstream slot frees up in time
+            requests.RequestException: If the request itself fails
+        """
+        slot = probe_bulkhead(self.shop_domain) if probe else bulkhead(shop_domain=self.shop_domain, api_key=api_key)
+        with slot:
+            return requests.post(
+                f"{self.base_url}{path}",
+                headers={'X-API-KEY': api_key},
+                data=data,
+                timeout=timeout
+            )
 
-    def start_transaction(self, terminal_id, api_key, amount):
+    def start_transaction(self, terminal_id, api_key, amount, callback_url=None):
         """
         Start a new transaction on Pin Vandaag terminal
 
@@ -21,25 +55,25 @@ class PinVandaagService:
             terminal_id: Terminal ID to process payment
             api_key: API key for authentication
             amount: Amount in cents
+            callback_url: URL Pin Vandaag pushes the result to (optional)
 
         Returns:
             dict: Response from Pin Vandaag API
 
         Raises:
+            BulkheadFull: If no upstream slot frees up in time
             requests.RequestException: If API call fails
         """
-        url = f"{self.base_url}/instore/transactions/start"
-        headers = {
-            'X-API-KEY': api_key
-        }
         data = {
             'terminal_id': terminal_id,
             'amount': amount
         }
+        if callback_url:
+            data['CallbackUrl'] = callback_url
 
         try:
             logger.debug(f"Starting transaction: terminal={terminal_id}, amount={amount}")
-            response = requests.post(url, headers=headers, data=data, timeout=30)
+            response = self._post('/instore/transactions/start', api_key, data)
             response.raise_for_status()
             result = response.json()
             logger.info(f"Transaction started: {result.get('transaction_id')}")
@@ -61,12 +95,9 @@ class PinVandaagService:
             dict: Response from Pin Vandaag API
 
         Raises:
+            BulkheadFull: If no upstream slot frees up in time
             requests.RequestException: If API call fails
         """
-        url = f"{self.base_url}/instore/transactions/status"
-        headers = {
-            'X-API-KEY': api_key
-        }
         data = {
             'terminal_id': terminal_id,
             'transaction_id': transaction_id
@@ -74,7 +105,7 @@ class PinVandaagService:
 
         try:
             logger.debug(f"Checking status: transaction={transaction_id}")
-            response = requests.post(url, headers=headers, data=data, timeout=30)
+            response = self._post('/instore/transactions/status', api_key, data)
             response.raise_for_status()
             result = response.json()
             logger.info(f"Transaction status FULL response: {result}")
@@ -83,10 +114,119 @@ class PinVandaagService:
             logger.error(f"Failed to get transaction status: {e}")
             raise
 
+    def probe(self, terminal_id, api_key, timeout=5):
+        """
+        Cheap reachability check of a terminal
 
-def find_terminal(shop_domain, location_id=None, staff_member_id=None, user_id=None, shop_id=None):
+        Pin Vandaag has no ping endpoint, so this asks the status of a
+        transaction id that never exists. Only a 2xx or the expected 404
+        means the API is up and accepts the terminal's credentials; a 401 or
+        403 (bad credentials), any other 4xx and 5xx count as unreachable.
+
+        Args:
+            terminal_id: Terminal ID
+            api_key: API key for authentication
+            timeout: Seconds to wait for an answer
+
+        Raises:
+            BulkheadFull: If no probe slot of the shop frees up in time
+            requests.RequestException: If the terminal is unreachable
+        """
+        data = {
+            'terminal_id': terminal_id,
+            'transaction_id': PROBE_TRANSACTION_ID
+        }
+        response = self._post('/instore/transactions/status', api_key, data, timeout=timeout, probe=True)
+        if not (200 <= response.status_code < 300 or response.status_code == 404):
+            raise requests.HTTPError(f"Probe answered {response.status_code}", response=response)
+
+
+def parse_status_response(result):
     """
-    Find a terminal link based on shop domain and optional filters
+    Extract the payment status from a Pin Vandaag status response
+
+    Pin Vandaag returns: {'status': 'success', 'transaction': {'status': 'unknown/success/failed', ...}}
+    The top-level 'status' means "API call succeeded", not payment status
+
+    Args:
+        result: Decoded JSON response from the status endpoint
+
+    Returns:
+        tuple: (payment_status, error_msg, receipt)
+    """
+    payment_status = 'started'
+    error_msg = None
+    receipt = None
+
+    if 'transaction' in result:
+        tx_data = result['transaction']
+        payment_status = tx_data.get('status', 'started')
+        error_msg = tx_data.get('error_msg') or tx_data.get('errorMsg')
+        receipt = tx_data.get('receipt')
+        logger.info(f"Extracted payment status from transaction: {payment_status}")
+    elif 'worldline' in result:
+        wl_data = result['worldline']
+        payment_status = wl_data.get('status', 'started')
+        logger.info(f"Extracted payment status from worldline: {payment_status}")
+    else:
+        # Fallback to old behavior for backwards compatibility
+        payment_status = result.get('status', 'started')
+        error_msg = result.get('errorMsg')
+        receipt = result.get('receipt')
+
+    # Map 'unknown' status to 'started' (still waiting)
+    if payment_status == 'unknown':
+        payment_status = 'started'
+
+    return payment_status, error_msg, receipt
+
+
+def apply_status_update(transaction, payment_status, error_msg=None, receipt=None):
+    """
+    Persist a new payment status and keep derived state in step
+
+    Args:
+        transaction: Transaction to update
+        payment_status: Status as returned by parse_status_response; states
+            without a status code (e.g. 'waiting') are stored as 'started'
+        error_msg: Error message (optional)
+        receipt: Receipt text; None leaves a stored receipt untouched
+
+    Returns:
+        str: The previous status
+    """
+    old_status = transaction.status
+    if payment_status not in STATUS_CODES:
+        logger.info(f"Storing upstream status {payment_status!r} of {transaction.transaction_id} as 'started'")
+        payment_status = 'started'
+    alias = transaction._state.db or shard_for(transaction.shop_domain)
+    # Rollups and occupancy rows live on the transaction's shard
+    with shard_scope(alias), db_transaction.atomic(using=alias):
+        transaction.status = payment_status
+        transaction.error_msg = error_msg
+        if receipt is not None:
+            transaction.receipt = receipt
+        transaction.save()
+        record_transition(transaction, old_status, payment_status)
+        remember_transaction(transaction, has_receipt=receipt is not None)
+        if payment_status in Transaction.FINAL_STATUSES and transaction.terminal_link_id:
+            release_terminal(transaction.terminal_link_id, transaction.transaction_id)
+            if old_status not in Transaction.FINAL_STATUSES:
+                duration = (transaction.updated_at - transaction.created_at).total_seconds()
+                # Rows resolved late by the sweeper say nothing about the terminal's speed
+                if duration < settings.TERMINAL_STALE_TRANSACTION_SECONDS:
+                    record_completion(transaction.terminal_link_id, duration * 1000)
+    return old_status
+
+
+def find_terminal_candidates(shop_domain, location_id=None, staff_member_id=None, user_id=None, shop_id=None):
+    """
+    Find the terminal links that can take a payment, best match first
+
+    Optional filters narrow the candidates in order of specificity; a filter
+    that would match nothing is skipped. Terminals that match equally well
+    (e.g. several terminals at one location) are all returned so the caller
+    can fail over between them.
 
     Args:
         shop_domain: Shop domain (required)
@@ -96,46 +236,130 @@ def find_terminal(shop_domain, location_id=None, staff_member_id=None, user_id=N
         shop_id: Shop ID (optional)
 
     Returns:
-        TerminalLinks: Matching terminal link or None
+        list: Matching TerminalLinks, empty if none match
     """
     # Start with shop_domain filter (required)
-    queryset = TerminalLinks.objects.filter(shop_domain=shop_domain)
+    candidates = shop_terminal_links(shop_domain)
 
     logger.debug(f"Finding terminal for shop_domain={shop_domain}")
 
-    if not queryset.exists():
+    if not candidates:
         logger.warning(f"No terminal found for shop_domain={shop_domain}")
-        return None
+        return []
 
     # Apply optional filters in order of specificity
-    if queryset.count() > 1 and location_id:
-        filtered = queryset.filter(location_id=location_id)
-        if filtered.exists():
-            queryset = filtered
-            logger.debug(f"Filtered by location_id={location_id}, found {queryset.count()}")
-
-    if queryset.count() > 1 and staff_member_id:
-        filtered = queryset.filter(staff_member_id=staff_member_id)
-        if filtered.exists():
-            queryset = filtered
-            logger.debug(f"Filtered by staff_member_id={staff_member_id}, found {queryset.count()}")
-
-    if queryset.count() > 1 and user_id:
-        filtered = queryset.filter(user_id=user_id)
-        if filtered.exists():
-            queryset = filtered
-            logger.debug(f"Filtered by user_id={user_id}, found {queryset.count()}")
-
-    if queryset.count() > 1 and shop_id:
-        filtered = queryset.filter(shop_id=shop_id)
-        if filtered.exists():
-            queryset = filtered
-            logger.debug(f"Filtered by shop_id={shop_id}, found {queryset.count()}")
-
-    terminal = queryset.first()
-    if terminal:
-        logger.info(f"Found terminal: {terminal}")
-    else:
-        logger.warning("No matching terminal found after filtering")
+    for field, value in (('location_id', location_id), ('staff_member_id', staff_member_id),
+                         ('user_id', user_id), ('shop_id', shop_id)):
+        if len(candidates) > 1 and value:
+            filtered = [terminal for terminal in candidates if getattr(terminal, field) == str(value)]
+            if filtered:
+                candidates = filtered
+                logger.debug(f"Filtered by {field}={value}, found {len(candidates)}")
+
+    return candidates
+
+
+def find_terminal(shop_domain, location_id=None, staff_member_id=None, user_id=None, shop_id=None):
+    """
+    Find a terminal link based on shop domain and optional filters
 
+    Args:
+        shop_domain: Shop domain (required)
+        location_id: Location ID (optional)
+        staff_member_id: Staff member ID (optional)
+        user_id: User ID (optional)
+        shop_id: Shop ID (optional)
+
+    Returns:
+        TerminalLinks: Best matching terminal link or None
+    """
+    candidates = find_terminal_candidates(
+        shop_domain=shop_domain,
+        location_id=location_id,
+        staff_member_id=staff_member_id,
+        user_id=user_id,
+        shop_id=shop_id
+    )
+    if not candidates:
+        return None
+
+    terminal = candidates[0]
+    logger.info(f"Found terminal: {terminal}")
     return terminal
+
+
+def _link_field_names():
+    return [field.attname for field in TerminalLinks._meta.concrete_fields]
+
+
+def shop_terminal_links(shop_domain):
+    """
+    All terminal links of a shop, oldest first
+
+    Rows are cached for TERMINAL_ROUTING_CACHE_SECONDS; saving or deleting a
+    link drops its shop's entry.
+
+    Returns:
+        list: Fresh TerminalLinks instances (safe to modify)
+    """
+    field_names = _link_field_names()
+    rows = routing_cache.get_or_compute(
+        shop_domain,
+        lambda: list(TerminalLinks.objects.for_shop(shop_domain).order_by('pk').values_list(*field_names)),
+        settings.TERMINAL_ROUTING_CACHE_SECONDS,
+    )
+    return [TerminalLinks.from_db(shard_for(shop_domain), field_names, row) for row in rows]
+
+
+class TerminalLinkCache:
+    """
+    TerminalLinks rows by primary key, on the configured cache backend
+
+    Saves and deletes evict their entry right away (in every worker when the
+    backend is shared); with the local backend other workers pick up changes
+    (e.g. a rotated API key) after `ttl` seconds.
+    """
+
+    def __init__(self, cache, ttl):
+        self.cache = cache
+        self.ttl = ttl
+
+    def get(self, terminal_link_id):
+        """
+        Terminal link by primary key, from the cache when fresh
+
+        A miss reads the shard bound to the current request (see
+        terminal.shards.bind_shop).
+
+        Returns:
+            TerminalLinks: A fresh instance (safe to modify), or None
+        """
+        field_names = _link_field_names()
+        values = self.cache.get_or_compute(
+            str(terminal_link_id),
+            lambda: TerminalLinks.objects.filter(pk=terminal_link_id).values_list(*field_names).first(),
+            self.ttl,
+        )
+        if values is None:
+            return None
+        shop_domain = values[field_names.index('shop_domain')]
+        return TerminalLinks.from_db(shard_for(shop_domain), field_names, values)
+
+    def evict(self, terminal_link_id):
+        self.cache.delete(str(terminal_link_id))
+
+    def clear(self):
+        self.cache.clear()
+
+
+routing_cache = get_cache('routing', settings.TERMINAL_LINK_CACHE_MAX_ENTRIES)
+terminal_links = TerminalLinkCache(
+    get_cache('terminal_links', settings.TERMINAL_LINK_CACHE_MAX_ENTRIES),
+    ttl=settings.TERMINAL_LINK_CACHE_SECONDS,
+)
+
+
+@receiver([post_save, post_delete], sender=TerminalLinks)
+def _evict_terminal_link(sender, instance, **kwargs):
+    terminal_links.evict(instance.pk)
+    routing_cache.delete(instance.shop_domain)
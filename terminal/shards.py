@@ -0,0 +1,175 @@
+"""
+Shop-hash sharding of the terminal tables
+
+With TERMINAL_SHARD_URLS set, every model of this app (terminal links,
+transactions and everything hanging off them) lives in one of the shard
+databases: 'default' plus 'shard_1'..'shard_N'. A shop's rows all sit in
+shard_for(shop_domain), so joins and foreign keys stay inside one database.
+Other apps (auth, sessions, admin log) stay on 'default'.
+
+ShardRouter picks the database from, in order: the instance being saved or
+followed, its shop_domain, and the shard bound to the current request with
+bind_shop()/bind_shard() inside a @sharded view or a shard_scope() block.
+Code that works across shops (maintenance commands) loops over each_shard().
+Outside a bound shard everything falls to 'default'; the admin therefore
+picks the shard itself (a shard filter on the change lists, the object's
+shard on its pages, see terminal.admin.ShardedModelAdmin).
+
+Each shard hands out primary keys from its own range (shard index *
+TERMINAL_SHARD_ID_SPACING, reserved after migrate), so ids stay unique
+across shards: caches and shared-memory tables keyed by id need no shard
+prefix, and `manage.py rebalance_shards` can move rows keeping their ids.
+Only SQLite and PostgreSQL shards are supported; settings refuse others.
+"""
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, models
+
+APP_LABEL = 'terminal'
+
+_shard = ContextVar('terminal_shard', default=None)
+
+
+def shard_aliases():
+    """Database aliases of the shards, 'default' first"""
+    return settings.TERMINAL_SHARD_ALIASES
+
+
+def shard_for(shop_domain, aliases=None):
+    """
+    Shard holding a shop's rows
+
+    Args:
+        shop_domain: Shop domain
+        aliases: Shard aliases to choose from (default: the configured shards)
+    """
+    aliases = aliases or shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+    digest = hashlib.blake2b(shop_domain.encode('utf-8'), digest_size=8).digest()
+    return aliases[int.from_bytes(digest, 'big') % len(aliases)]
+
+
+def current_shard():
+    """Shard bound to the current request or block, 'default' if none"""
+    return _shard.get() or 'default'
+
+
+@contextmanager
+def shard_scope(alias=None):
+    """Block with its own shard binding, restored afterwards"""
+    token = _shard.set(alias)
+    try:
+        yield
+    finally:
+        _shard.reset(token)
+
+
+def bind_shard(alias):
+    """Send the rest of the current scope's terminal queries to `alias`"""
+    _shard.set(alias)
+
+
+def bind_shop(shop_domain):
+    bind_shard(shard_for(shop_domain))
+
+
+def each_shard():
+    """Iterate the shards, binding each one while the loop body runs"""
+    for alias in shard_aliases():
+        with shard_scope(alias):
+            yield alias
+
+
+def sharded(view):
+    """Give a view its own shard scope; the view calls bind_shop() once it knows the shop"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with shard_scope():
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ShardedQuerySet(models.QuerySet):
+    def for_shop(self, shop_domain):
+        """The shop's rows, read from its shard whatever is bound"""
+        queryset = self.filter(shop_domain=shop_domain)
+        if len(shard_aliases()) == 1:
+            # Unsharded: leave the choice to the other routers (e.g. a read replica)
+            return queryset
+        return queryset.using(shard_for(shop_domain))
+
+
+ShardedManager = models.Manager.from_queryset(ShardedQuerySet)
+
+
+class ShardRouter:
+    """Routes models of the terminal app to their shop's shard"""
+
+    def _db(self, model, instance):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        if instance is not None:
+            if instance._state.db:
+                return instance._state.db
+            if getattr(instance, 'shop_domain', None):
+                return shard_for(instance.shop_domain)
+        return _shard.get()
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._meta.app_label == APP_LABEL and obj2._meta.app_label == APP_LABEL:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db not in shard_aliases():
+            return None
+        # Shards other than 'default' only hold this app's tables
+        return app_label == APP_LABEL or db == 'default'
+
+
+def reserve_id_ranges(alias):
+    """
+    Start a shard's primary keys at its own range
+
+    Raises the id sequence of every auto-increment terminal table on
+    `alias` to index * TERMINAL_SHARD_ID_SPACING; sequences already past
+    that point are left alone.
+    """
+    offset = shard_aliases().index(alias) * settings.TERMINAL_SHARD_ID_SPACING
+    if not offset:
+        return
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in apps.get_app_config(APP_LABEL).get_models():
+            if not isinstance(model._meta.pk, models.AutoField):
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, offset])
+                elif row[0] < offset:
+                    cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [offset, table])
+            elif connection.vendor == 'postgresql':
+                column = model._meta.pk.column
+                cursor.execute(f'SELECT MAX({connection.ops.quote_name(column)}) FROM {connection.ops.quote_name(table)}')
+                if (cursor.fetchone()[0] or 0) < offset:
+                    cursor.execute('SELECT setval(pg_get_serial_sequence(%s, %s), %s)', [table, column, offset])
+            else:
+                # settings only accept SQLite and PostgreSQL shards
+                raise ImproperlyConfigured(f"Cannot reserve id ranges on {connection.vendor}")
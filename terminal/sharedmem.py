@@ -0,0 +1,125 @@
+"""
+Fixed-size record tables in a memory-mapped file, shared by all workers on a host
+
+Records are fixed-size structs found by a stable 64-bit hash of their key
+(with a short linear probe on collisions). Each record is guarded by an
+fcntl byte-range lock on its own bytes, so workers only contend when they
+touch the same record, and a crashed worker's locks are dropped by the
+kernel. No external service is needed.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+
+def key_hash(key):
+    """Stable non-zero 64-bit hash (Python's hash() differs per process)"""
+    value = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+    return value or 1
+
+
+class SharedTable:
+    """
+    Table of `slots` records of `value_format` (a struct format) keyed by string
+
+    The file is opened lazily in each process, so tables can be created at
+    import time before gunicorn forks its workers.
+    """
+
+    def __init__(self, path, slots, value_format, max_probe=8):
+        self.path = path
+        self.slots = slots
+        self.struct = struct.Struct('<Q' + value_format)
+        self.max_probe = max_probe
+        self._pid = None
+        self._fd = None
+        self._map = None
+        # fcntl locks are per process, threads of one worker also need excluding
+        self._thread_lock = threading.Lock()
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.slots * self.struct.size
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._map = mmap.mmap(fd, size)
+        self._fd = fd
+        self._pid = os.getpid()
+
+    @contextmanager
+    def _locked(self, index):
+        offset = index * self.struct.size
+        with self._thread_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.struct.size, offset, os.SEEK_SET)
+            try:
+                yield offset
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.struct.size, offset, os.SEEK_SET)
+
+    def update(self, key, func):
+        """
+        Atomically read-modify-write the record of `key`
+
+        Args:
+            key: Record key
+            func: Called with the stored values (None for a new record) while
+                the record is locked; returns (new_values, result). Keep it short.
+
+        Returns:
+            The `result` returned by func
+        """
+        self._open()
+        hashed = key_hash(key)
+        home = hashed % self.slots
+        for probe in range(self.max_probe):
+            with self._locked((home + probe) % self.slots) as offset:
+                stored = self.struct.unpack_from(self._map, offset)
+                if stored[0] in (hashed, 0):
+                    values, result = func(stored[1:] if stored[0] == hashed else None)
+                    self.struct.pack_into(self._map, offset, hashed, *values)
+                    return result
+
+        # Every slot in reach is taken by another key: evict the home record
+        with self._locked(home) as offset:
+            values, result = func(None)
+            self.struct.pack_into(self._map, offset, hashed, *values)
+            return result
+
+    def get(self, key):
+        """Stored values of `key`, or None"""
+        self._open()
+        hashed = key_hash(key)
+        home = hashed % self.slots
+        for probe in range(self.max_probe):
+            with self._locked((home + probe) % self.slots) as offset:
+                stored = self.struct.unpack_from(self._map, offset)
+            if stored[0] == hashed:
+                return stored[1:]
+            if stored[0] == 0:
+                return None
+        return None
+
+    def records(self):
+        """Yield the values of every used record"""
+        self._open()
+        for index in range(self.slots):
+            with self._locked(index) as offset:
+                stored = self.struct.unpack_from(self._map, offset)
+            if stored[0]:
+                yield stored[1:]
+
+    def clear(self):
+        self._open()
+        with self._thread_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                self._map[:] = bytes(len(self._map))
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
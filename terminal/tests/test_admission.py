@@ -0,0 +1,112 @@
+import json
+import os
+
+import pytest
+from django.test import Client
+
+from terminal import admission
+from terminal.admission import LOW, NORMAL, PAYMENT, classify, in_flight
+
+
+def in_child(func):
+    """Run func in a forked worker that exits without cleaning up"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            func()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+
+class TestClassify:
+    """Test request priorities"""
+
+    def test_payment_paths(self):
+        assert classify('/api/terminal/start') == PAYMENT
+        assert classify('/api/terminal/status') == PAYMENT
+        assert classify('/api/terminal/receipt/2405102') == PAYMENT
+
+    def test_low_priority_paths(self):
+        assert classify('/api/terminal/transactions/') == LOW
+        assert classify('/api/terminal/transactions/export') == LOW
+        assert classify('/admin/terminal/transaction/') == LOW
+
+    def test_other_paths(self):
+        assert classify('/api/terminal/webhooks') == NORMAL
+
+
+class TestAdmission:
+    """Test shedding by priority"""
+
+    @pytest.fixture(autouse=True)
+    def capacity(self, settings):
+        settings.TERMINAL_ADMISSION_CAPACITY = 10
+        settings.TERMINAL_ADMISSION_LOW_SHARE = 0.5
+        settings.TERMINAL_ADMISSION_NORMAL_SHARE = 0.8
+
+    def test_sheds_low_priority_first(self):
+        in_flight.add(PAYMENT, 5)
+        assert not admission.enter(LOW)
+        assert admission.enter(NORMAL)
+        assert admission.enter(PAYMENT)
+
+    def test_payments_are_never_shed(self):
+        in_flight.add(PAYMENT, 50)
+        assert not admission.enter(NORMAL)
+        assert admission.enter(PAYMENT)
+
+    def test_leave(self):
+        assert admission.enter(LOW)
+        admission.leave(LOW)
+        assert in_flight.totals() == [0, 0, 0]
+
+    def test_other_workers_are_counted(self):
+        in_child(lambda: in_flight.add(LOW, 3))
+        assert in_flight.totals()[LOW] == 3
+
+    def test_dead_worker_counts_are_reclaimed(self):
+        """Test a worker that died mid-request stops counting once its record is claimed again"""
+        in_child(lambda: in_flight.add(LOW, 3))
+        in_child(lambda: in_flight.totals())
+        assert in_flight.totals() == [0, 0, 0]
+
+
+@pytest.mark.django_db
+class TestAdmissionMiddleware:
+    """Test the middleware during saturation"""
+
+    def test_dashboard_is_shed(self, settings):
+        settings.TERMINAL_ADMISSION_CAPACITY = 4
+        in_flight.add(PAYMENT, 2)
+
+        response = Client().get('/api/terminal/stats', {'shop': 'test.myshopify.com'})
+
+        assert response.status_code == 503
+        assert response['Retry-After'] == str(settings.TERMINAL_ADMISSION_RETRY_AFTER)
+
+    def test_payments_pass(self, settings):
+        settings.TERMINAL_ADMISSION_CAPACITY = 4
+        in_flight.add(PAYMENT, 4)
+
+        response = Client().post('/api/terminal/status', data=json.dumps({}), content_type='application/json')
+
+        assert response.status_code == 400
+        assert in_flight.totals() == [4, 0, 0]
+
+    def test_streamed_response_counts_until_closed(self):
+        """Test an export stays in flight while its body is streamed"""
+        response = Client().get('/api/terminal/transactions/export', {'shop': 'test.myshopify.com'})
+
+        assert response.streaming
+        assert in_flight.totals()[LOW] == 1
+        b''.join(response.streaming_content)
+        assert in_flight.totals()[LOW] == 0
+
+    def test_unread_streamed_response_leaves_on_close(self):
+        """Test a stream the client never read is released when the server closes it"""
+        response = Client().get('/api/terminal/transactions/export', {'shop': 'test.myshopify.com'})
+
+        response.close()
+        response.close()
+        assert in_flight.totals()[LOW] == 0
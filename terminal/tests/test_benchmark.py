@@ -0,0 +1,45 @@
+import json
+import pytest
+from io import StringIO
+from django.core.management import call_command
+from terminal.models import TerminalLinks, Transaction
+
+
+@pytest.mark.django_db
+class TestBenchmarkCommand:
+    """Test the benchmark management command on a tiny dataset"""
+
+    def test_benchmark_emits_json_results(self):
+        """Test seeding and measuring produces comparable JSON"""
+        out = StringIO()
+        call_command(
+            'benchmark',
+            transactions=60, shops=3, terminals=6, repeat=3, batch_size=25,
+            stdout=out, stderr=StringIO()
+        )
+
+        report = json.loads(out.getvalue())
+        assert report['dataset'] == {'shops': 3, 'terminal_links': 6, 'transactions': 60}
+        assert report['meta']['seed'] == 42
+        for name in ('get_transactions', 'find_terminal', 'status_lookup',
+                     'admin_transaction_changelist', 'admin_terminallinks_changelist'):
+            assert report['results'][name]['n'] == 3
+            assert report['results'][name]['p95_ms'] >= 0
+
+    def test_skip_seed_reads_shop_count(self):
+        """Test --skip-seed measures the shops that were seeded, not the --shops default"""
+        call_command('benchmark', transactions=10, shops=3, terminals=3, repeat=1,
+                     stdout=StringIO(), stderr=StringIO())
+        out = StringIO()
+        call_command('benchmark', skip_seed=True, repeat=1, stdout=out, stderr=StringIO())
+
+        assert json.loads(out.getvalue())['dataset']['shops'] == 3
+
+    def test_benchmark_cleanup(self):
+        """Test cleanup removes all benchmark rows"""
+        call_command('benchmark', transactions=10, shops=2, terminals=2, repeat=1,
+                     stdout=StringIO(), stderr=StringIO())
+        call_command('benchmark', cleanup=True, stdout=StringIO(), stderr=StringIO())
+
+        assert not TerminalLinks.objects.filter(shop_domain__startswith='bench-').exists()
+        assert not Transaction.objects.filter(shop_domain__startswith='bench-').exists()
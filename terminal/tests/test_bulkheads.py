@@ -0,0 +1,116 @@
+import json
+
+import pytest
+import responses
+from django.test import Client
+
+from terminal.bulkheads import BulkheadFull, bulkhead, probe_bulkhead
+from terminal.models import TerminalLinks
+from terminal.occupancy import is_busy
+from terminal.services import PinVandaagService
+
+
+START_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/start'
+STATUS_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/status'
+
+
+@pytest.fixture(autouse=True)
+def small_bulkheads(settings, tmp_path):
+    settings.TERMINAL_BULKHEAD_ENABLED = True
+    settings.TERMINAL_BULKHEAD_DIR = str(tmp_path)
+    settings.TERMINAL_BULKHEAD_SHOP_SLOTS = 1
+    settings.TERMINAL_BULKHEAD_KEY_SLOTS = 2
+    settings.TERMINAL_BULKHEAD_PROBE_SLOTS = 1
+    settings.TERMINAL_BULKHEAD_QUEUE_SECONDS = 0.05
+    settings.TERMINAL_PROBE_TIMEOUT = 0.05
+
+
+def start(shop_domain):
+    return Client().post(
+        '/api/terminal/start',
+        data=json.dumps({'shopDomain': shop_domain, 'amount': 1250}),
+        content_type='application/json'
+    )
+
+
+class TestBulkhead:
+    """Test bulkhead slots"""
+
+    def test_full_shop_raises_after_queue_time(self):
+        """Test a shop with all slots held is rejected, other shops are not"""
+        with bulkhead(shop_domain='busy.myshopify.com'):
+            with pytest.raises(BulkheadFull):
+                with bulkhead(shop_domain='busy.myshopify.com'):
+                    pass
+            with bulkhead(shop_domain='other.myshopify.com'):
+                pass
+
+    def test_slot_is_released(self):
+        """Test a slot is free again after the block"""
+        with bulkhead(shop_domain='busy.myshopify.com'):
+            pass
+        with bulkhead(shop_domain='busy.myshopify.com'):
+            pass
+
+    def test_api_key_limit_spans_shops(self):
+        """Test the API key limit applies across shops sharing the key"""
+        with bulkhead(shop_domain='a.myshopify.com', api_key='shared'):
+            with bulkhead(shop_domain='b.myshopify.com', api_key='shared'):
+                with pytest.raises(BulkheadFull) as exc_info:
+                    with bulkhead(shop_domain='c.myshopify.com', api_key='shared'):
+                        pass
+        # API keys never end up in errors or logs
+        assert 'shared' not in str(exc_info.value)
+
+    def test_probes_leave_payment_slots_alone(self):
+        """Test a running probe holds neither the shop's nor the API key's payment slots"""
+        with probe_bulkhead('busy.myshopify.com'):
+            with bulkhead(shop_domain='busy.myshopify.com', api_key='shared'):
+                pass
+            with pytest.raises(BulkheadFull):
+                with probe_bulkhead('busy.myshopify.com'):
+                    pass
+
+    @responses.activate
+    def test_probe_runs_while_payment_slots_are_full(self):
+        """Test a probe does not queue behind payments of its shop"""
+        responses.add(responses.POST, STATUS_URL, json={'status': 'error'}, status=404)
+        service = PinVandaagService(shop_domain='busy.myshopify.com')
+
+        with bulkhead(shop_domain='busy.myshopify.com', api_key='shared'):
+            service.probe(terminal_id='50303253', api_key='shared')
+
+        assert len(responses.calls) == 1
+
+    def test_disabled(self, settings):
+        """Test nothing is limited when bulkheads are disabled"""
+        settings.TERMINAL_BULKHEAD_ENABLED = False
+        with bulkhead(shop_domain='busy.myshopify.com'):
+            with bulkhead(shop_domain='busy.myshopify.com'):
+                pass
+
+
+@pytest.mark.django_db
+class TestBulkheadViews:
+    """Test views when a shop's upstream slots are full"""
+
+    @responses.activate
+    def test_start_gets_fast_503(self):
+        """Test a start is rejected with Retry-After and leaves the terminal free"""
+        terminal = TerminalLinks.objects.create(
+            shop_domain='busy.myshopify.com', terminal_id='50303253', api_key='test-api-key'
+        )
+        TerminalLinks.objects.create(
+            shop_domain='calm.myshopify.com', terminal_id='50303254', api_key='other-api-key'
+        )
+        responses.add(responses.POST, START_URL, json={'transaction_id': '2405102'})
+
+        with bulkhead(shop_domain='busy.myshopify.com'):
+            busy = start('busy.myshopify.com')
+            calm = start('calm.myshopify.com')
+
+        assert busy.status_code == 503
+        assert busy['Retry-After']
+        assert not is_busy(terminal)
+        assert calm.status_code == 200
+        assert len(responses.calls) == 1
@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from terminal.cache import Cache, DjangoCache, LocalCache, SQLiteCache, get_cache
+from terminal.models import TerminalLinks
+from terminal.services import find_terminal_candidates
+
+
+@pytest.fixture(params=['local', 'sqlite', 'django'])
+def cache(request, tmp_path):
+    if request.param == 'local':
+        return LocalCache(max_entries=100)
+    if request.param == 'sqlite':
+        return SQLiteCache(str(tmp_path / 'cache.sqlite3'), 'tests', max_entries=100)
+    backend = DjangoCache('default', 'tests')
+    backend.clear()
+    return backend
+
+
+class TestBackends:
+    """Test the operations every backend offers"""
+
+    def test_set_get_delete(self, cache):
+        cache.set('a', {'rows': [1, 2]}, 60)
+        assert cache.get('a') == {'rows': [1, 2]}
+        cache.delete('a')
+        assert cache.get('a', 'missing') == 'missing'
+
+    def test_expiry(self, cache):
+        cache.set('a', 1, 0.05)
+        time.sleep(0.06)
+        assert cache.get('a') is None
+
+    def test_add(self, cache):
+        assert cache.add('lock', 1, 60)
+        assert not cache.add('lock', 2, 60)
+        assert cache.get('lock') == 1
+
+    def test_backends_implement_the_interface(self):
+        class Partial(Cache):
+            def get(self, key, default=None):
+                return default
+
+        with pytest.raises(TypeError):
+            Partial()
+
+
+class TestSQLiteCache:
+    """Test the host-shared SQLite backend"""
+
+    def test_shared_between_processes(self, tmp_path):
+        path = str(tmp_path / 'cache.sqlite3')
+        pid = os.fork()
+        if pid == 0:
+            try:
+                SQLiteCache(path, 'tests', max_entries=100).set('a', 'from child', 60)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        assert SQLiteCache(path, 'tests', max_entries=100).get('a') == 'from child'
+
+    def test_namespaces(self, tmp_path):
+        path = str(tmp_path / 'cache.sqlite3')
+        first, second = SQLiteCache(path, 'one', 100), SQLiteCache(path, 'two', 100)
+        first.set('a', 1, 60)
+        second.set('a', 2, 60)
+        first.clear()
+        assert first.get('a') is None
+        assert second.get('a') == 2
+        assert len(second) == 1
+
+
+class TestGetOrCompute:
+    """Test stampede protection"""
+
+    def test_computes_once(self):
+        cache = LocalCache(max_entries=10)
+        calls = []
+        for _ in range(3):
+            assert cache.get_or_compute('a', lambda: calls.append(1) or 'value', 60) == 'value'
+        assert len(calls) == 1
+
+    def test_recomputes_early(self):
+        """Test a slow value close to expiry is refreshed before it expires"""
+        cache = LocalCache(max_entries=10)
+        cache.set('a', ('old', 100.0, time.time() + 1), 60)
+        assert cache.get_or_compute('a', lambda: 'new', 60) == 'new'
+
+    def test_stale_value_while_locked(self):
+        """Test others keep the old value while one worker recomputes"""
+        cache = LocalCache(max_entries=10)
+        cache.set('a', ('old', 100.0, time.time() + 1), 60)
+        cache.add('lock:a', 1, 60)
+        assert cache.get_or_compute('a', lambda: 'new', 60) == 'old'
+
+    def test_miss_waits_for_lock_holder(self, settings):
+        settings.TERMINAL_CACHE_LOCK_SECONDS = 2
+        cache = LocalCache(max_entries=10)
+        cache.add('lock:a', 1, 60)
+        threading.Timer(0.05, cache.set, args=('a', ('computed elsewhere', 0.0, time.time() + 60), 60)).start()
+
+        assert cache.get_or_compute('a', lambda: 'computed here', 60) == 'computed elsewhere'
+
+
+class TestGetCache:
+    @pytest.fixture(autouse=True)
+    def registry(self, monkeypatch):
+        monkeypatch.setattr('terminal.cache._caches', [])
+
+    def test_switch(self, settings, tmp_path):
+        settings.TERMINAL_CACHE_BACKEND = 'sqlite'
+        settings.TERMINAL_CACHE_PATH = str(tmp_path / 'cache.sqlite3')
+        assert isinstance(get_cache('tests', 10), SQLiteCache)
+
+    def test_unknown_backend(self, settings):
+        settings.TERMINAL_CACHE_BACKEND = 'memcache'
+        with pytest.raises(ImproperlyConfigured):
+            get_cache('tests', 10)
+
+
+@pytest.mark.django_db
+class TestRoutingCache:
+    """Test find_terminal_candidates on the cache"""
+
+    def test_cached_until_links_change(self):
+        TerminalLinks.objects.create(shop_domain='test.myshopify.com', terminal_id='1', api_key='key')
+        find_terminal_candidates('test.myshopify.com')
+
+        with CaptureQueriesContext(connection) as queries:
+            assert [t.terminal_id for t in find_terminal_candidates('test.myshopify.com')] == ['1']
+        assert len(queries) == 0
+
+        TerminalLinks.objects.create(shop_domain='test.myshopify.com', terminal_id='2', api_key='key')
+        assert [t.terminal_id for t in find_terminal_candidates('test.myshopify.com')] == ['1', '2']
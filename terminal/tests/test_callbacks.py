@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+
+import pytest
+import responses
+from django.test import Client
+
+from terminal.callbacks import sign_callback, verify_callback
+from terminal.models import DailyTransactionStat, TerminalLinks, Transaction, TransactionReceipt
+from terminal.notify import publish, version, wait_for_change
+from terminal.occupancy import bind_transaction, claim_terminal, is_busy
+from terminal.services import apply_status_update
+
+
+SECRET = 'callback-secret'
+STATUS_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/status'
+
+
+@pytest.fixture(autouse=True)
+def callback_settings(settings):
+    settings.TERMINAL_CALLBACK_SECRET = SECRET
+    settings.TERMINAL_CALLBACK_URL = 'https://connect.example.com/api/terminal/callback'
+
+
+@pytest.fixture
+def transaction():
+    terminal = TerminalLinks.objects.create(
+        shop_domain='test.myshopify.com', terminal_id='50303253', api_key='test-api-key'
+    )
+    claim_terminal(terminal)
+    bind_transaction(terminal, '2405102')
+    return Transaction.objects.create(
+        transaction_id='2405102', terminal_link=terminal, amount=1250,
+        status='started', shop_domain='test.myshopify.com'
+    )
+
+
+def push(payload, secret=SECRET, timestamp=None):
+    body = json.dumps(payload).encode('utf-8')
+    timestamp = str(int(time.time()) if timestamp is None else timestamp)
+    return Client().post(
+        '/api/terminal/callback', data=body, content_type='application/json',
+        HTTP_X_CALLBACK_TIMESTAMP=timestamp,
+        HTTP_X_CALLBACK_SIGNATURE=sign_callback(body, timestamp, secret)
+    )
+
+
+def poll(**extra):
+    return Client().post(
+        '/api/terminal/status',
+        data=json.dumps({'shopDomain': 'test.myshopify.com', 'transaction_id': '2405102', **extra}),
+        content_type='application/json'
+    )
+
+
+class TestVerifyCallback:
+    """Test verify_callback"""
+
+    def test_valid(self):
+        assert verify_callback(b'{}', '1000', sign_callback(b'{}', '1000', SECRET), now=1000)
+
+    def test_tampered_body(self):
+        assert not verify_callback(b'{"a": 1}', '1000', sign_callback(b'{}', '1000', SECRET), now=1000)
+
+    def test_replayed_later(self):
+        assert not verify_callback(b'{}', '1000', sign_callback(b'{}', '1000', SECRET), now=5000)
+
+    def test_no_secret_configured(self, settings):
+        settings.TERMINAL_CALLBACK_SECRET = ''
+        assert not verify_callback(b'{}', '1000', sign_callback(b'{}', '1000', ''), now=1000)
+
+
+@pytest.mark.django_db
+class TestCallbackEndpoint:
+    """Test the callback endpoint"""
+
+    def test_applies_pushed_result(self, transaction):
+        """Test a push finalizes the transaction like a status poll would"""
+        response = push({'transactionId': '2405102', 'status': 'success', 'terminal': '50303253',
+                         'receipt': 'RECEIPT'})
+
+        assert response.status_code == 200
+        assert response.json()['applied'] is True
+        transaction.refresh_from_db()
+        assert transaction.status == 'success'
+        assert transaction.pushed_at is not None
+        assert TransactionReceipt.objects.get(pk=transaction.pk).text == 'RECEIPT'
+        assert not is_busy(transaction.terminal_link)
+
+    def test_redelivery_is_not_applied_again(self, transaction):
+        push({'transactionId': '2405102', 'status': 'success'})
+        response = push({'transactionId': '2405102', 'status': 'failed'})
+
+        assert response.json()['applied'] is False
+        transaction.refresh_from_db()
+        assert transaction.status == 'success'
+
+    def test_push_replaces_swept_timeout(self, transaction):
+        """Test a pushed success replaces a timeout the sweeper inferred, rollups included"""
+        apply_status_update(transaction, 'timeout')
+
+        response = push({'transactionId': '2405102', 'status': 'success', 'terminal': '50303253'})
+
+        assert response.json()['applied'] is True
+        transaction.refresh_from_db()
+        assert transaction.status == 'success'
+        assert dict(DailyTransactionStat.objects.filter(count__gt=0).values_list('status', 'count')) == {'success': 1}
+
+    def test_terminal_picks_among_equal_ids(self, transaction):
+        """Test a transaction id used on two terminals needs the terminal to pick the row"""
+        other = TerminalLinks.objects.create(
+            shop_domain='other.myshopify.com', terminal_id='60000000', api_key='other-api-key'
+        )
+        Transaction.objects.create(
+            transaction_id='2405102', terminal_link=other, amount=500,
+            status='started', shop_domain='other.myshopify.com'
+        )
+
+        assert push({'transactionId': '2405102', 'status': 'success'}).status_code == 409
+        assert push({'transactionId': '2405102', 'status': 'success', 'terminal': '60000000'}).status_code == 200
+        transaction.refresh_from_db()
+        assert transaction.status == 'started'
+        assert Transaction.objects.get(terminal_link=other).status == 'success'
+
+    def test_bad_signature(self, transaction):
+        assert push({'transactionId': '2405102', 'status': 'success'}, secret='wrong').status_code == 401
+
+    def test_unknown_transaction(self):
+        assert push({'transactionId': 'nope', 'status': 'success'}).status_code == 404
+
+    def test_terminal_mismatch(self, transaction):
+        assert push({'transactionId': '2405102', 'status': 'success', 'terminal': 'other'}).status_code == 400
+
+    @responses.activate
+    def test_polls_stop_after_push(self, transaction):
+        """Test a transaction with a pushed final result is answered from the database"""
+        push({'transactionId': '2405102', 'status': 'failed', 'errorMsg': 'Kaart geweigerd'})
+
+        response = poll()
+
+        assert response.status_code == 200
+        assert response.json()['status'] == 'failed'
+        assert len(responses.calls) == 0
+
+    @responses.activate
+    def test_polls_continue_after_intermediate_push(self, transaction):
+        """Test a pushed intermediate status does not stop polling Pin Vandaag"""
+        responses.add(responses.POST, STATUS_URL, json={'transaction': {'status': 'success'}})
+        push({'transactionId': '2405102', 'status': 'started'})
+        transaction.refresh_from_db()
+        assert transaction.pushed_at is None
+
+        response = poll()
+
+        assert response.json()['status'] == 'success'
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_wait_falls_back_to_polling(self, transaction):
+        """Test a waiting poll without a push asks Pin Vandaag after the wait"""
+        responses.add(responses.POST, STATUS_URL, json={'transaction': {'status': 'unknown'}})
+
+        start = time.monotonic()
+        response = poll(waitMs=200)
+
+        assert time.monotonic() - start >= 0.2
+        assert response.json()['status'] == 'started'
+        assert len(responses.calls) == 1
+
+
+class TestWaitForChange:
+    """Test notify wakeups"""
+
+    def test_publish_wakes_waiter(self):
+        seen = version('tx-1')
+        threading.Timer(0.05, publish, args=('tx-1',)).start()
+
+        start = time.monotonic()
+        assert wait_for_change('tx-1', seen, timeout=2)
+        assert time.monotonic() - start < 1
+
+    def test_timeout(self):
+        assert not wait_for_change('tx-2', version('tx-2'), timeout=0.05)
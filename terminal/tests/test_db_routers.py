@@ -0,0 +1,87 @@
+import pytest
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+
+from terminal.db_routers import ReplicaRouter, replica_reads
+from terminal.middleware import PRIMARY_PIN_COOKIE, ReplicaRoutingMiddleware
+from terminal.models import Transaction
+
+
+@pytest.fixture(autouse=True)
+def replica_mode(settings):
+    settings.TERMINAL_DATABASE_MODE = 'replica'
+    settings.DATABASE_ROUTERS = ['terminal.db_routers.ReplicaRouter']
+
+
+def read_db():
+    return router.db_for_read(Transaction)
+
+
+class TestReplicaRouter:
+    """Test ReplicaRouter"""
+
+    def test_primary_by_default(self):
+        assert ReplicaRouter().db_for_read(Transaction) is None
+
+    def test_replica_reads(self):
+        with replica_reads():
+            assert ReplicaRouter().db_for_read(Transaction) == 'replica'
+
+    def test_read_your_writes(self):
+        """Test reads return to the primary once the block wrote"""
+        with replica_reads() as state:
+            assert ReplicaRouter().db_for_write(Transaction) == 'default'
+            assert ReplicaRouter().db_for_read(Transaction) is None
+        assert state.wrote
+
+
+class TestReplicaRoutingMiddleware:
+    """Test which requests read from the replica"""
+
+    def run(self, request, view=None):
+        seen = {}
+
+        def get_response(request):
+            if view:
+                view()
+            seen['db'] = read_db()
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        return seen['db'], response
+
+    def test_dashboard_reads_replica(self):
+        db, response = self.run(RequestFactory().get('/api/terminal/transactions/', {'shop': 'x'}))
+        assert db == 'replica'
+        assert PRIMARY_PIN_COOKIE not in response.cookies
+
+    def test_payments_read_primary(self):
+        db, _ = self.run(RequestFactory().post('/api/terminal/status'))
+        assert db == 'default'
+
+    def test_admin_post_pins_client(self):
+        """Test a write keeps the client on the primary for its next requests"""
+        db, response = self.run(RequestFactory().post('/admin/terminal/terminallinks/1/change/'),
+                                view=lambda: router.db_for_write(Transaction))
+        assert db == 'default'
+        assert response.cookies[PRIMARY_PIN_COOKIE]['max-age'] == 10
+
+        request = RequestFactory().get('/admin/terminal/terminallinks/')
+        request.COOKIES[PRIMARY_PIN_COOKIE] = '1'
+        assert self.run(request)[0] == 'default'
+
+    def test_streamed_export_reads_replica(self):
+        def get_response(request):
+            return StreamingHttpResponse(read_db() for _ in range(1))
+
+        response = ReplicaRoutingMiddleware(get_response)(
+            RequestFactory().get('/api/terminal/transactions/export', {'shop': 'x'})
+        )
+        assert list(response.streaming_content) == [b'replica']
+
+    def test_single_mode(self, settings):
+        settings.TERMINAL_DATABASE_MODE = 'single'
+        with pytest.raises(MiddlewareNotUsed):
+            ReplicaRoutingMiddleware(lambda request: HttpResponse())
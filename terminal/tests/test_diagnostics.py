@@ -0,0 +1,70 @@
+import pytest
+from django.test import Client
+from terminal.diagnostics import memory_report, register_store, stop_tracing, store_sizes
+from terminal.tokens import make_diagnostics_token
+
+
+@pytest.fixture(autouse=True)
+def stop_tracemalloc():
+    yield
+    stop_tracing()
+
+
+class TestMemoryReport:
+    """Test in-process memory reporting"""
+
+    def test_registered_store_sizes(self):
+        """Test registered stores are reported with entry counts"""
+        store = {'a': 1, 'b': 2}
+        register_store('tests.store', store)
+
+        sizes = store_sizes()
+        assert sizes['tests.store']['entries'] == 2
+        assert sizes['tests.store']['approx_bytes'] > 0
+        assert 'mock_views.MOCK_TRANSACTIONS' in sizes
+
+    def test_snapshot_requires_tracing(self):
+        """Test snapshot without tracing explains how to start"""
+        report = memory_report(action='snapshot')
+        assert report['tracing'] is False
+        assert 'action=start' in report['error']
+
+    def test_start_then_diff_reports_growth(self):
+        """Test diff reports allocation sites that grew since the baseline"""
+        memory_report(action='start')
+        leak = [bytearray(1024) for _ in range(200)]
+
+        report = memory_report(action='diff', top=5)
+        assert report['tracing'] is True
+        assert len(report['top']) <= 5
+        assert any(entry['size_diff_bytes'] >= 200 * 1024 for entry in report['top'])
+        del leak
+
+
+class TestMemoryDiagnosticsView:
+    """Test memory diagnostics endpoint"""
+
+    def test_requires_token(self):
+        """Test endpoint rejects requests without a diagnostics token"""
+        response = Client().get('/api/terminal/diagnostics/memory')
+        assert response.status_code == 401
+
+    def test_profile_token_not_accepted(self):
+        """Test tokens minted for another purpose are rejected"""
+        response = Client().get(
+            '/api/terminal/diagnostics/memory',
+            HTTP_X_TERMINAL_DIAGNOSTICS=make_diagnostics_token('profile')
+        )
+        assert response.status_code == 401
+
+    def test_start_action(self):
+        """Test starting tracing through the endpoint"""
+        response = Client().get(
+            '/api/terminal/diagnostics/memory',
+            {'action': 'start', 'top': 3},
+            HTTP_X_TERMINAL_DIAGNOSTICS=make_diagnostics_token('memory')
+        )
+        assert response.status_code == 200
+        report = response.json()['report']
+        assert report['tracing'] is True
+        assert 'stores' in report
@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+import pytest
+from datetime import datetime, timezone as dt_timezone
+from django.core.management import call_command
+from django.test import Client
+from terminal.models import TerminalLinks, Transaction
+
+
+@pytest.fixture
+def transactions():
+    terminal = TerminalLinks.objects.create(
+        shop_domain='test.myshopify.com',
+        terminal_id='50303253',
+        api_key='test-api-key'
+    )
+    for i, day in enumerate([1, 15, 31]):
+        transaction = Transaction.objects.create(
+            transaction_id=f'txn-{day}',
+            terminal_link=terminal,
+            amount=1000 + i,
+            status='success',
+            shop_domain='test.myshopify.com'
+        )
+        Transaction.objects.filter(pk=transaction.pk).update(
+            created_at=datetime(2025, 1, day, 12, tzinfo=dt_timezone.utc)
+        )
+    Transaction.objects.create(
+        transaction_id='other-shop',
+        amount=500,
+        shop_domain='other.myshopify.com'
+    )
+
+
+def streamed(response):
+    return b''.join(response.streaming_content).decode()
+
+
+@pytest.mark.django_db
+class TestExportTransactionsView:
+    """Test export_transactions view"""
+
+    def test_export_csv(self, transactions):
+        """Test CSV export streams only the shop's rows in range"""
+        response = Client().get('/api/terminal/transactions/export', {
+            'shop': 'test.myshopify.com', 'from': '2025-01-01', 'to': '2025-01-15'
+        })
+
+        assert response.status_code == 200
+        assert response.streaming
+        rows = list(csv.DictReader(io.StringIO(streamed(response))))
+        assert [row['transaction_id'] for row in rows] == ['txn-1', 'txn-15']
+        assert rows[0]['terminal_id'] == '50303253'
+        assert rows[0]['amount'] == '1000'
+
+    def test_export_ndjson(self, transactions):
+        """Test NDJSON export"""
+        response = Client().get('/api/terminal/transactions/export', {
+            'shop': 'test.myshopify.com', 'format': 'ndjson'
+        })
+
+        records = [json.loads(line) for line in streamed(response).splitlines()]
+        assert [record['transaction_id'] for record in records] == ['txn-1', 'txn-15', 'txn-31']
+        assert response['Content-Type'] == 'application/x-ndjson'
+
+    def test_export_invalid_date(self, transactions):
+        """Test invalid dates are rejected"""
+        response = Client().get('/api/terminal/transactions/export', {
+            'shop': 'test.myshopify.com', 'from': 'yesterday'
+        })
+        assert response.status_code == 400
+
+    def test_export_requires_shop(self):
+        """Test shop parameter is required"""
+        response = Client().get('/api/terminal/transactions/export')
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestExportTransactionsCommand:
+    """Test export_transactions management command"""
+
+    def test_command_writes_csv(self, transactions):
+        """Test command output matches the endpoint format"""
+        out = io.StringIO()
+        call_command('export_transactions', shop='test.myshopify.com', date_from='2025-01-31', stdout=out)
+
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        assert [row['transaction_id'] for row in rows] == ['txn-31']
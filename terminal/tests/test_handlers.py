@@ -0,0 +1,85 @@
+import io
+import json
+from unittest import mock
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+from django.core.handlers.wsgi import WSGIHandler
+from django.urls.resolvers import URLResolver
+
+from terminal.handlers import LeanWSGIHandler, PosDispatcher
+
+
+@pytest.fixture(scope='module')
+def dispatcher():
+    return PosDispatcher(WSGIHandler(), LeanWSGIHandler())
+
+
+def call(app, method, path, body=b'', query='', **headers):
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body), **headers,
+    }
+    setup_testing_defaults(environ)
+    started = {}
+
+    def start_response(status, response_headers):
+        started['status'] = int(status.split()[0])
+        started['headers'] = dict(response_headers)
+
+    response = app(environ, start_response)
+    content = b''.join(response)
+    response.close()
+    return started['status'], started['headers'], content
+
+
+class TestPosDispatcher:
+    """Test the lean POS pipeline"""
+
+    def test_routes_pos_paths(self, dispatcher):
+        assert dispatcher.handler_for('/api/terminal/status') is dispatcher.lean
+        assert dispatcher.handler_for('/api/terminal/receipt/2405102') is dispatcher.lean
+        assert dispatcher.handler_for('/api/terminal/webhooks') is dispatcher.lean
+        assert dispatcher.handler_for('/api/terminal/stats') is dispatcher.default
+        assert dispatcher.handler_for('/admin/') is dispatcher.default
+
+    def test_lean_stack(self, dispatcher):
+        """Test only the POS middleware are loaded"""
+        status, headers, content = call(dispatcher, 'POST', '/api/terminal/status', b'{}')
+
+        assert status == 400
+        assert json.loads(content)['success'] is False
+        assert 'Server-Timing' in headers
+        assert 'X-Frame-Options' not in headers
+
+    def test_cors(self, dispatcher):
+        status, headers, _ = call(
+            dispatcher, 'OPTIONS', '/api/terminal/status',
+            HTTP_ORIGIN='https://extensions.shopifycdn.com', HTTP_ACCESS_CONTROL_REQUEST_METHOD='POST'
+        )
+        assert status == 200
+        assert headers['access-control-allow-origin'] == '*'
+
+    def test_pos_path_resolved_once(self, dispatcher):
+        with mock.patch.object(URLResolver, 'resolve', autospec=True, side_effect=URLResolver.resolve) as resolve:
+            status, _, _ = call(dispatcher, 'POST', '/api/terminal/status', b'{}')
+
+        assert status == 400
+        # The lean handler reuses the dispatcher's match instead of resolving the path again
+        assert [call.args[1] for call in resolve.call_args_list].count('/api/terminal/status') == 1
+
+    def test_preflight_skips_routing(self, dispatcher):
+        with mock.patch.object(dispatcher, 'resolve') as resolve:
+            status, headers, _ = call(
+                dispatcher, 'OPTIONS', '/api/terminal/status',
+                HTTP_ORIGIN='https://extensions.shopifycdn.com', HTTP_ACCESS_CONTROL_REQUEST_METHOD='POST'
+            )
+        assert status == 200
+        assert headers['access-control-allow-origin'] == '*'
+        resolve.assert_not_called()
+
+    def test_unknown_path_uses_full_stack(self, dispatcher):
+        status, headers, _ = call(dispatcher, 'GET', '/api/terminal/stats')
+        assert 'Server-Timing' not in headers
+        assert headers['X-Frame-Options'] == 'DENY'
@@ -0,0 +1,146 @@
+import json
+from datetime import timedelta
+
+import pytest
+import requests
+import responses
+from django.core.management import call_command
+from django.test import Client
+from django.utils import timezone
+
+from terminal.health import is_offline, offline_cache, probe_terminals, purge_health_checks
+from terminal.models import TerminalHealthCheck, TerminalLinks
+
+
+START_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/start'
+STATUS_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/status'
+
+
+@pytest.fixture(autouse=True)
+def fresh_offline_cache():
+    offline_cache.invalidate()
+    yield
+    offline_cache.invalidate()
+
+
+@pytest.fixture
+def terminals():
+    return [
+        TerminalLinks.objects.create(
+            shop_domain='test.myshopify.com', location_id='123', terminal_id=terminal_id, api_key=f'key-{terminal_id}'
+        ) for terminal_id in ('first', 'second')
+    ]
+
+
+def mark(terminal, reachable, age=0):
+    TerminalHealthCheck.objects.create(
+        terminal_link=terminal, reachable=reachable,
+        checked_at=timezone.now() - timedelta(seconds=age)
+    )
+    offline_cache.invalidate()
+
+
+def start():
+    return Client().post(
+        '/api/terminal/start',
+        data=json.dumps({'shopDomain': 'test.myshopify.com', 'locationId': '123', 'amount': 1250}),
+        content_type='application/json'
+    )
+
+
+@pytest.mark.django_db
+class TestProbeTerminals:
+    """Test probe_terminals"""
+
+    @responses.activate
+    def test_records_reachability(self, terminals):
+        """Test each terminal gets a check with latency, errors mark it offline"""
+        responses.add(responses.POST, STATUS_URL, json={'status': 'error', 'message': 'Transaction not found'},
+                      status=404)
+        responses.add(responses.POST, STATUS_URL, body=requests.ConnectionError('offline'))
+
+        checks = probe_terminals(terminals, concurrency=1)
+
+        assert [check.reachable for check in checks] == [True, False]
+        assert TerminalHealthCheck.objects.filter(terminal_link__in=terminals).count() == 2
+        assert checks[0].latency_ms is not None
+        assert not is_offline(terminals[0])
+        assert is_offline(terminals[1])
+
+    @responses.activate
+    def test_rejected_credentials_are_unreachable(self, terminals):
+        """Test a 401 or 403 marks the terminal offline, only 2xx and 404 count as reachable"""
+        responses.add(responses.POST, STATUS_URL, json={'status': 'error', 'message': 'Unauthorized'}, status=401)
+        responses.add(responses.POST, STATUS_URL, json={'status': 'error', 'message': 'Forbidden'}, status=403)
+
+        checks = probe_terminals(terminals, concurrency=1)
+
+        assert [check.reachable for check in checks] == [False, False]
+        assert '401' in checks[0].error
+        assert is_offline(terminals[0])
+        assert is_offline(terminals[1])
+
+    def test_latest_recent_check_wins(self, terminals):
+        """Test a terminal is online again after a good check, and old checks say nothing"""
+        mark(terminals[0], reachable=False, age=10)
+        mark(terminals[0], reachable=True)
+        mark(terminals[1], reachable=False, age=3600)
+
+        assert not is_offline(terminals[0])
+        assert not is_offline(terminals[1])
+
+    def test_offline_set_is_per_shop(self, terminals):
+        """Test a shop's offline set only holds checks of its own terminals"""
+        other = TerminalLinks.objects.create(
+            shop_domain='other.myshopify.com', terminal_id='third', api_key='key-third'
+        )
+        mark(terminals[0], reachable=False)
+        mark(other, reachable=False)
+
+        assert offline_cache.get('test.myshopify.com') == {terminals[0].pk}
+        assert offline_cache.get('other.myshopify.com') == {other.pk}
+
+    def test_purge(self, terminals):
+        """Test old checks are deleted"""
+        mark(terminals[0], reachable=True, age=30 * 24 * 3600)
+        mark(terminals[0], reachable=True)
+
+        assert purge_health_checks(timedelta(days=7)) >= 1
+        assert TerminalHealthCheck.objects.filter(terminal_link=terminals[0]).count() == 1
+
+    @responses.activate
+    def test_command(self, terminals):
+        """Test the management command probes all non-demo terminals of a shop"""
+        responses.add(responses.POST, STATUS_URL, json={'status': 'error'})
+
+        call_command('probe_terminals', shop='test.myshopify.com')
+
+        assert len(responses.calls) == 2
+
+
+@pytest.mark.django_db
+class TestOfflineRouting:
+    """Test start_transaction against offline terminals"""
+
+    @responses.activate
+    def test_offline_terminal_is_skipped(self, terminals):
+        """Test a start goes to the online terminal without trying the offline one"""
+        mark(terminals[0], reachable=False)
+        responses.add(responses.POST, START_URL, json={'transaction_id': '2405102'})
+
+        response = start()
+
+        assert response.status_code == 200
+        assert [call.request.headers['X-API-KEY'] for call in responses.calls] == ['key-second']
+
+    @responses.activate
+    def test_all_offline_rejected_immediately(self, terminals):
+        """Test a start is rejected without an upstream call when every terminal is offline"""
+        for terminal in terminals:
+            mark(terminal, reachable=False)
+
+        response = start()
+
+        assert response.status_code == 503
+        assert response.json()['error'] == 'Payment terminal offline'
+        assert len(responses.calls) == 0
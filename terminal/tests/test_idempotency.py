@@ -0,0 +1,109 @@
+import json
+import threading
+import time
+import pytest
+import responses
+from django.test import Client
+from terminal.idempotency import IdempotencyStore, OWNER, WAIT, REPLAY, MISMATCH, check_idempotency_backend, store
+from terminal.models import TerminalLinks, Transaction
+
+
+START_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/start'
+
+
+@pytest.fixture(autouse=True)
+def clear_store():
+    store.clear()
+    yield
+    store.clear()
+
+
+class TestIdempotencyStore:
+    """Test IdempotencyStore"""
+
+    def test_first_request_owns_key(self):
+        """Test the first request runs and repeats replay its response"""
+        s = IdempotencyStore(max_entries=10, ttl=60)
+        assert s.begin('key', 'fp') == (OWNER, None)
+        s.complete('key', 'fp', 200, b'{}', 'application/json')
+
+        assert s.begin('key', 'fp') == (REPLAY, (200, 'application/json', b'{}'))
+
+    def test_different_body_is_rejected(self):
+        """Test reusing a key for another request is a mismatch"""
+        s = IdempotencyStore(max_entries=10, ttl=60)
+        s.begin('key', 'fp')
+        assert s.begin('key', 'other') == (MISMATCH, None)
+
+    def test_concurrent_duplicate_waits(self):
+        """Test a duplicate waits for the in-flight original"""
+        s = IdempotencyStore(max_entries=10, ttl=60)
+        s.begin('key', 'fp')
+        state, event = s.begin('key', 'fp')
+        assert state == WAIT
+
+        threading.Timer(0.05, s.complete, args=('key', 'fp', 200, b'{}', 'application/json')).start()
+        assert event.wait(2)
+        assert s.begin('key', 'fp')[0] == REPLAY
+
+    def test_bounded_and_expiring(self):
+        """Test oldest entries are evicted and expired entries are dropped"""
+        s = IdempotencyStore(max_entries=2, ttl=0.05)
+        for key in ('a', 'b', 'c'):
+            s.begin(key, 'fp')
+            s.complete(key, 'fp', 200, b'{}', 'application/json')
+        assert len(s.cache) == 2
+        assert s.begin('a', 'fp')[0] == OWNER
+
+        time.sleep(0.06)
+        assert s.begin('b', 'fp')[0] == OWNER
+
+
+class TestBackendCheck:
+    """Test the warning for per-worker idempotency keys"""
+
+    def test_local_backend_with_several_workers(self, settings):
+        settings.TERMINAL_CACHE_BACKEND = 'local'
+        settings.TERMINAL_WEB_WORKERS = 4
+        assert [warning.id for warning in check_idempotency_backend()] == ['terminal.W001']
+
+    def test_shared_backend(self, settings):
+        settings.TERMINAL_CACHE_BACKEND = 'sqlite'
+        settings.TERMINAL_WEB_WORKERS = 4
+        assert check_idempotency_backend() == []
+
+
+@pytest.mark.django_db
+class TestIdempotentStartTransaction:
+    """Test Idempotency-Key handling on start_transaction"""
+
+    @responses.activate
+    def test_retry_replays_first_response(self):
+        """Test a retried start does not call Pin Vandaag or create a row again"""
+        TerminalLinks.objects.create(
+            shop_domain='test.myshopify.com',
+            terminal_id='50303253',
+            api_key='test-api-key'
+        )
+        responses.add(responses.POST, START_URL, json={'transaction_id': '2405102'})
+        body = json.dumps({'shopDomain': 'test.myshopify.com', 'amount': 1250})
+
+        first = Client().post('/api/terminal/start', data=body, content_type='application/json',
+                              HTTP_IDEMPOTENCY_KEY='pos-retry-1')
+        second = Client().post('/api/terminal/start', data=body, content_type='application/json',
+                               HTTP_IDEMPOTENCY_KEY='pos-retry-1')
+
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert second.json() == first.json()
+        assert second['Idempotent-Replayed'] == 'true'
+        assert len(responses.calls) == 1
+        assert Transaction.objects.filter(transaction_id='2405102').count() == 1
+
+    def test_key_reused_with_other_body(self):
+        """Test a key reused for a different payment is rejected"""
+        Client().post('/api/terminal/start', data=json.dumps({'amount': 1}),
+                      content_type='application/json', HTTP_IDEMPOTENCY_KEY='k')
+        response = Client().post('/api/terminal/start', data=json.dumps({'amount': 2}),
+                                 content_type='application/json', HTTP_IDEMPOTENCY_KEY='k')
+        assert response.status_code == 422
@@ -0,0 +1,148 @@
+import pytest
+import responses
+from datetime import timedelta
+from django.utils import timezone
+from terminal.maintenance import (
+    sweep_stale_transactions, TIMEOUT_ERROR_MSG, archive_transactions,
+    TableArchiveWriter, NDJSONArchiveWriter, iter_archive_file
+)
+from terminal.models import TerminalLinks, Transaction, TransactionArchive, TransactionReceipt
+from terminal.notify import version
+from terminal.open_transactions import find_open_transaction, remember_transaction
+
+
+@pytest.fixture
+def terminal():
+    return TerminalLinks.objects.create(
+        shop_domain='test.myshopify.com',
+        terminal_id='50303253',
+        api_key='test-api-key'
+    )
+
+
+def create_transaction(transaction_id, terminal=None, status='started', age=timedelta(hours=1)):
+    transaction = Transaction.objects.create(
+        transaction_id=transaction_id,
+        terminal_link=terminal,
+        amount=1000,
+        status=status,
+        shop_domain='test.myshopify.com'
+    )
+    Transaction.objects.filter(pk=transaction.pk).update(created_at=timezone.now() - age)
+    return transaction
+
+
+@pytest.mark.django_db
+class TestSweepStaleTransactions:
+    """Test the stale transaction sweeper"""
+
+    def test_sweeps_only_old_started_transactions(self, terminal):
+        """Test only 'started' rows older than the cutoff are timed out"""
+        stale = create_transaction('stale', terminal)
+        fresh = create_transaction('fresh', terminal, age=timedelta(seconds=5))
+        done = create_transaction('done', terminal, status='success')
+
+        counts = sweep_stale_transactions(older_than=timedelta(minutes=15), chunk_size=1)
+
+        assert counts == {'stale': 1, 'timeout': 1, 'resolved': 0}
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        done.refresh_from_db()
+        assert stale.status == 'timeout'
+        assert stale.error_msg == TIMEOUT_ERROR_MSG
+        assert fresh.status == 'started'
+        assert done.status == 'success'
+
+    def test_swept_transactions_are_closed_in_shared_memory(self, terminal):
+        """Test a sweep below the stale age stops polls finding the transaction open"""
+        transaction = create_transaction('swept', terminal, age=timedelta(seconds=30))
+        transaction.refresh_from_db()
+        remember_transaction(transaction)
+        seen = version('swept')
+
+        sweep_stale_transactions(older_than=timedelta(seconds=10))
+
+        assert find_open_transaction('swept', 'test.myshopify.com') is None
+        assert version('swept') == seen + 1
+
+    def test_chunking_processes_all_rows(self, terminal):
+        """Test rows beyond the first chunk are swept too"""
+        for i in range(5):
+            create_transaction(f'stale-{i}', terminal)
+
+        counts = sweep_stale_transactions(older_than=timedelta(minutes=15), chunk_size=2)
+
+        assert counts['timeout'] == 5
+        assert not Transaction.objects.filter(status='started').exists()
+
+    def test_dry_run_changes_nothing(self, terminal):
+        """Test dry run only counts"""
+        create_transaction('stale', terminal)
+
+        counts = sweep_stale_transactions(older_than=timedelta(minutes=15), dry_run=True)
+
+        assert counts['stale'] == 1
+        assert Transaction.objects.get(transaction_id='stale').status == 'started'
+
+    @responses.activate
+    def test_check_upstream_uses_final_status(self, terminal):
+        """Test an upstream final status wins over timeout"""
+        create_transaction('paid', terminal)
+        create_transaction('lost', terminal)
+        responses.add(
+            responses.POST,
+            'https://rest-api.pinvandaag.com/V2/instore/transactions/status',
+            match=[responses.matchers.urlencoded_params_matcher(
+                {'terminal_id': '50303253', 'transaction_id': 'paid'})],
+            json={'status': 'success', 'receipt': 'Receipt data...'}
+        )
+        responses.add(
+            responses.POST,
+            'https://rest-api.pinvandaag.com/V2/instore/transactions/status',
+            json={'status': 'started'}
+        )
+
+        counts = sweep_stale_transactions(older_than=timedelta(minutes=15), check_upstream=True)
+
+        assert counts == {'stale': 2, 'timeout': 1, 'resolved': 1}
+        assert Transaction.objects.get(transaction_id='paid').status == 'success'
+        assert Transaction.objects.get(transaction_id='lost').status == 'timeout'
+
+
+@pytest.mark.django_db
+class TestArchiveTransactions:
+    """Test transaction archival"""
+
+    def test_archive_to_table(self, terminal):
+        """Test old rows move to the archive table with compressed receipts"""
+        old = create_transaction('old', terminal, status='success', age=timedelta(days=400))
+        TransactionReceipt.store(old.pk, 'Receipt data...')
+        create_transaction('old-2', terminal, status='failed', age=timedelta(days=500))
+        create_transaction('recent', terminal, status='success', age=timedelta(days=10))
+        progress = []
+
+        archived = archive_transactions(
+            older_than=timedelta(days=365), writer=TableArchiveWriter(),
+            batch_size=1, progress=progress.append
+        )
+
+        assert archived == 2
+        assert progress == [1, 2]
+        assert list(Transaction.objects.values_list('transaction_id', flat=True)) == ['recent']
+        archive = TransactionArchive.objects.get(transaction_id='old')
+        assert archive.status == 'success'
+        assert archive.terminal_link_id == terminal.pk
+        assert archive.receipt == 'Receipt data...'
+
+    def test_archive_to_ndjson(self, terminal, tmp_path):
+        """Test old rows are written to a gzip NDJSON file and deleted"""
+        create_transaction('old', terminal, status='success', age=timedelta(days=400))
+        path = str(tmp_path / 'archive.ndjson.gz')
+
+        archived = archive_transactions(older_than=timedelta(days=365), writer=NDJSONArchiveWriter(path))
+
+        assert archived == 1
+        assert not Transaction.objects.filter(transaction_id='old').exists()
+        records = list(iter_archive_file(path))
+        assert records[0]['transaction_id'] == 'old'
+        assert records[0]['amount'] == 1000
@@ -0,0 +1,56 @@
+import os
+import pytest
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from terminal.middleware import ProfilingMiddleware
+from terminal.tokens import make_diagnostics_token
+
+
+def view(request):
+    return HttpResponse('ok')
+
+
+class TestProfilingMiddleware:
+    """Test ProfilingMiddleware"""
+
+    @override_settings(TERMINAL_PROFILING_ENABLED=False)
+    def test_disabled_removes_itself(self):
+        """Test middleware is dropped from the stack when disabled"""
+        with pytest.raises(MiddlewareNotUsed):
+            ProfilingMiddleware(view)
+
+    def test_request_without_token_not_profiled(self, tmp_path):
+        """Test requests without a valid token pass straight through"""
+        with override_settings(TERMINAL_PROFILING_ENABLED=True, TERMINAL_PROFILE_DIR=str(tmp_path)):
+            middleware = ProfilingMiddleware(view)
+            request = RequestFactory().post('/api/terminal/status', HTTP_X_TERMINAL_PROFILE='forged')
+            response = middleware(request)
+
+        assert 'X-Terminal-Profile-File' not in response
+        assert os.listdir(tmp_path) == []
+
+    def test_signed_header_writes_pstats(self, tmp_path):
+        """Test a signed header produces a pstats file"""
+        with override_settings(TERMINAL_PROFILING_ENABLED=True, TERMINAL_PROFILE_DIR=str(tmp_path),
+                               TERMINAL_PROFILER='cprofile'):
+            middleware = ProfilingMiddleware(view)
+            request = RequestFactory().post(
+                '/api/terminal/status',
+                HTTP_X_TERMINAL_PROFILE=make_diagnostics_token('profile')
+            )
+            response = middleware(request)
+
+        assert response.content == b'ok'
+        filename = response['X-Terminal-Profile-File']
+        assert filename.endswith('.pstats')
+        assert os.path.exists(tmp_path / filename)
+
+    def test_query_flag_outside_api_ignored(self, tmp_path):
+        """Test only /api/terminal/* requests are profiled"""
+        with override_settings(TERMINAL_PROFILING_ENABLED=True, TERMINAL_PROFILE_DIR=str(tmp_path)):
+            middleware = ProfilingMiddleware(view)
+            request = RequestFactory().get('/admin/', {'_profile': make_diagnostics_token('profile')})
+            response = middleware(request)
+
+        assert 'X-Terminal-Profile-File' not in response
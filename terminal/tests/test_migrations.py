@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+
+# Runs against a fresh SQLite file: rows in the wide layout of 0010, then the
+# compact migrations with two rows per batch
+COMPACT_LAYOUT = '''
+import importlib
+import json
+
+import django
+django.setup()
+from django.core.management import call_command
+from django.db import connection
+
+call_command('migrate', 'terminal', '0010', verbosity=0)
+with connection.cursor() as cursor:
+    for transaction_id, status, shop_domain, location_id, staff_member_id in [
+        ('t1', 'started', 'a.myshopify.com', 'loc-1', None),
+        ('t2', 'success', 'a.myshopify.com', 'loc-1', 'staff-1'),
+        ('t3', 'waiting', 'a.myshopify.com', 'loc-2', 'staff-1'),
+        ('t4', 'timeout', 'b.myshopify.com', 'loc-1', None),
+        ('t5', 'failed', 'b.myshopify.com', None, ''),
+    ]:
+        cursor.execute(
+            'INSERT INTO terminal_transaction (transaction_id, amount, status, shop_domain, location_id, '
+            'staff_member_id, created_at, updated_at) VALUES (%s, 1250, %s, %s, %s, %s, %s, %s)',
+            [transaction_id, status, shop_domain, location_id, staff_member_id, '2026-01-01 10:00:00', '2026-01-01 10:00:00']
+        )
+    cursor.execute(
+        'INSERT INTO terminal_transactionarchive (transaction_id, amount, status, shop_domain, created_at, updated_at, '
+        'archived_at) VALUES (%s, 1250, %s, %s, %s, %s, %s)',
+        ['old', 'failed', 'a.myshopify.com', '2025-01-01 10:00:00', '2025-01-01 10:00:00', '2026-01-01 10:00:00']
+    )
+
+importlib.import_module('terminal.migrations.0012_fill_compact_transaction_columns').BATCH_SIZE = 2
+call_command('migrate', verbosity=0)
+
+from terminal.models import Location, StaffMember, Transaction, TransactionArchive
+print(json.dumps({
+    'transactions': [
+        [tx.transaction_id, tx.status, tx.amount, tx.location_id, tx.staff_member_id]
+        for tx in Transaction.objects.select_related('location_ref', 'staff_ref').order_by('pk')
+    ],
+    'locations': Location.objects.count(),
+    'staff': StaffMember.objects.count(),
+    'archive': list(TransactionArchive.objects.values_list('status', flat=True)),
+}))
+'''
+
+
+@pytest.mark.slow
+class TestCompactTransactionMigration:
+    """Test the batched move to the compact Transaction layout"""
+
+    def test_rows_survive(self, tmp_path):
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'terminal_connect.settings',
+            'DATABASE_URL': f'sqlite:///{tmp_path / "db.sqlite3"}',
+            'TERMINAL_SHARED_MEMORY_DIR': str(tmp_path / 'shm'),
+        }
+        env.pop('TERMINAL_SHARD_URLS', None)
+        result = subprocess.run([sys.executable, '-c', COMPACT_LAYOUT], cwd=BASE_DIR, env=env,
+                                capture_output=True, text=True, timeout=120)
+        assert result.returncode == 0, result.stderr
+        migrated = json.loads(result.stdout.splitlines()[-1])
+
+        assert migrated['transactions'] == [
+            ['t1', 'started', 1250, 'loc-1', None],
+            ['t2', 'success', 1250, 'loc-1', 'staff-1'],
+            ['t3', 'started', 1250, 'loc-2', 'staff-1'],
+            ['t4', 'timeout', 1250, 'loc-1', None],
+            ['t5', 'failed', 1250, None, None],
+        ]
+        # loc-1 of a, loc-2 of a, loc-1 of b
+        assert migrated['locations'] == 3
+        assert migrated['staff'] == 1
+        assert migrated['archive'] == ['failed']
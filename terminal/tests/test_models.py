@@ -1,6 +1,7 @@
 import pytest
+from django.db import connection
 from django.utils import timezone
-from terminal.models import TerminalLinks, Transaction
+from terminal.models import Location, TerminalLinks, Transaction, TransactionReceipt
 
 
 @pytest.mark.django_db
@@ -126,3 +127,77 @@ class TestTransaction:
                 shop_domain='test.myshopify.com'
             )
             assert transaction.status == status
+
+    def test_receipt_stored_compressed(self):
+        """Test receipts are stored compressed outside the transaction row"""
+        transaction = Transaction.objects.create(
+            transaction_id='txn-123',
+            amount=1000,
+            status='success',
+            shop_domain='test.myshopify.com'
+        )
+        transaction.receipt = 'Receipt data... ' * 50
+        transaction.save()
+
+        record = TransactionReceipt.objects.get(transaction=transaction)
+        assert record.size == 800
+        assert len(record.data) < record.size
+        assert Transaction.objects.get(pk=transaction.pk).receipt == 'Receipt data... ' * 50
+
+    def test_transaction_without_receipt(self):
+        """Test receipt is None when none was stored"""
+        transaction = Transaction.objects.create(
+            transaction_id='txn-123',
+            amount=1000,
+            shop_domain='test.myshopify.com'
+        )
+        assert transaction.receipt is None
+
+    def test_status_stored_as_code(self):
+        """Test the status column holds a small integer while Python sees the name"""
+        transaction = Transaction.objects.create(
+            transaction_id='txn-123',
+            amount=1000,
+            status='timeout',
+            shop_domain='test.myshopify.com'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT status FROM terminal_transaction WHERE id = %s', [transaction.pk])
+            assert cursor.fetchone()[0] == 4
+
+        assert Transaction.objects.filter(status__in=Transaction.FINAL_STATUSES).get().status == 'timeout'
+        assert list(Transaction.objects.values_list('status', flat=True)) == ['timeout']
+
+    def test_unknown_status_rejected(self):
+        with pytest.raises(ValueError):
+            Transaction.objects.filter(status='waiting').exists()
+
+    def test_large_amount(self):
+        transaction = Transaction.objects.create(
+            transaction_id='txn-123',
+            amount=2 ** 40,
+            shop_domain='test.myshopify.com'
+        )
+        assert Transaction.objects.get(pk=transaction.pk).amount == 2 ** 40
+
+    def test_location_and_staff_interned(self):
+        """Test transactions of a shop share one Location row per location id"""
+        for n in range(3):
+            Transaction.objects.create(
+                transaction_id=f'txn-{n}',
+                amount=1000,
+                shop_domain='test.myshopify.com',
+                location_id='loc-123',
+                staff_member_id=456 if n else None
+            )
+        Transaction.objects.create(
+            transaction_id='txn-other', amount=1000, shop_domain='other.myshopify.com', location_id='loc-123'
+        )
+
+        assert Location.objects.filter(value='loc-123').count() == 2
+        transactions = Transaction.objects.filter(shop_domain='test.myshopify.com').select_related(
+            'location_ref', 'staff_ref'
+        ).order_by('pk')
+        assert [(tx.location_id, tx.staff_member_id) for tx in transactions] == [
+            ('loc-123', None), ('loc-123', '456'), ('loc-123', '456')
+        ]
@@ -0,0 +1,110 @@
+import json
+from datetime import timedelta
+
+import pytest
+import responses
+from django.test import Client
+from django.utils import timezone
+
+from terminal.maintenance import sweep_stale_transactions
+from terminal.models import TerminalLinks, TerminalOccupancy, Transaction
+from terminal.occupancy import bind_transaction, claim_terminal, is_busy, release_terminal
+from terminal.services import apply_status_update
+
+
+START_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/start'
+
+
+@pytest.fixture
+def terminal():
+    return TerminalLinks.objects.create(
+        shop_domain='test.myshopify.com',
+        terminal_id='50303253',
+        api_key='test-api-key'
+    )
+
+
+def start(amount=1250):
+    return Client().post(
+        '/api/terminal/start',
+        data=json.dumps({'shopDomain': 'test.myshopify.com', 'amount': amount}),
+        content_type='application/json'
+    )
+
+
+@pytest.mark.django_db
+class TestClaimTerminal:
+    """Test terminal claims"""
+
+    def test_claim_and_release(self, terminal):
+        """Test a terminal can only be claimed once until released"""
+        assert claim_terminal(terminal) == (True, None)
+        bind_transaction(terminal, 'tx-1')
+
+        assert claim_terminal(terminal) == (False, 'tx-1')
+        assert is_busy(terminal)
+
+        release_terminal(terminal.pk, 'other-tx')
+        assert is_busy(terminal)
+        release_terminal(terminal.pk, 'tx-1')
+        assert not is_busy(terminal)
+
+    def test_expired_claim_is_taken_over(self, terminal, settings):
+        """Test a claim older than the TTL no longer blocks the terminal"""
+        settings.TERMINAL_OCCUPANCY_TTL = 60
+        claim_terminal(terminal)
+        TerminalOccupancy.objects.filter(terminal_link=terminal).update(
+            claimed_at=timezone.now() - timedelta(seconds=120)
+        )
+
+        assert not is_busy(terminal)
+        assert claim_terminal(terminal) == (True, None)
+
+
+@pytest.mark.django_db
+class TestBusyTerminal:
+    """Test start_transaction against a busy terminal"""
+
+    @responses.activate
+    def test_second_start_fails_fast(self, terminal):
+        """Test a second start on a busy terminal returns 409 without calling Pin Vandaag"""
+        responses.add(responses.POST, START_URL, json={'transaction_id': '2405102'})
+
+        first = start()
+        second = start(amount=990)
+
+        assert first.status_code == 200
+        assert second.status_code == 409
+        assert second.json()['active_transaction_id'] == '2405102'
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_upstream_error_releases_claim(self, terminal):
+        """Test a failed start does not leave the terminal busy"""
+        responses.add(responses.POST, START_URL, json={'error': 'Terminal offline'})
+
+        assert start().status_code == 502
+        assert not is_busy(terminal)
+
+    @responses.activate
+    def test_final_status_releases_claim(self, terminal):
+        """Test the terminal is free again once the payment finished"""
+        responses.add(responses.POST, START_URL, json={'transaction_id': '2405102'})
+        start()
+
+        apply_status_update(Transaction.objects.get(transaction_id='2405102'), 'success')
+
+        assert not is_busy(terminal)
+
+    @responses.activate
+    def test_sweeper_releases_claim(self, terminal):
+        """Test timing out a stale transaction frees its terminal"""
+        responses.add(responses.POST, START_URL, json={'transaction_id': '2405102'})
+        start()
+        Transaction.objects.filter(transaction_id='2405102').update(
+            created_at=timezone.now() - timedelta(hours=1)
+        )
+
+        sweep_stale_transactions(timedelta(minutes=15))
+
+        assert not is_busy(terminal)
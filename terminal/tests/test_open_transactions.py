@@ -0,0 +1,110 @@
+import json
+import time
+
+import pytest
+import responses
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from terminal.models import TerminalLinks, Transaction
+from terminal.open_transactions import find_open_transaction, remember_transaction
+from terminal.services import apply_status_update, terminal_links
+
+
+STATUS_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/status'
+
+
+@pytest.fixture
+def transaction():
+    terminal = TerminalLinks.objects.create(
+        shop_domain='test.myshopify.com', terminal_id='50303253', api_key='test-api-key'
+    )
+    transaction = Transaction.objects.create(
+        transaction_id='2405102', terminal_link=terminal, amount=1250,
+        status='started', shop_domain='test.myshopify.com'
+    )
+    remember_transaction(transaction)
+    return transaction
+
+
+def poll():
+    return Client().post(
+        '/api/terminal/status',
+        data=json.dumps({'shopDomain': 'test.myshopify.com', 'transaction_id': '2405102'}),
+        content_type='application/json'
+    )
+
+
+@pytest.mark.django_db
+class TestOpenTransactions:
+    """Test the shared open-transaction table"""
+
+    def test_found(self, transaction):
+        found = find_open_transaction('2405102', 'test.myshopify.com')
+        assert found.pk == transaction.pk
+        assert found.terminal_link_id == transaction.terminal_link_id
+        assert abs((found.created_at - transaction.created_at).total_seconds()) < 0.001
+
+    def test_other_shop(self, transaction):
+        assert find_open_transaction('2405102', 'other.myshopify.com') is None
+
+    def test_final_is_not_open(self, transaction):
+        apply_status_update(transaction, 'failed', 'Kaart geweigerd')
+        assert find_open_transaction('2405102', 'test.myshopify.com') is None
+
+    def test_status_without_code_stays_open(self, transaction):
+        """Test an upstream 'waiting' is stored as 'started'"""
+        apply_status_update(transaction, 'waiting')
+        transaction.refresh_from_db()
+        assert transaction.status == 'started'
+        assert find_open_transaction('2405102', 'test.myshopify.com') is not None
+
+    def test_unknown_status_is_open(self, transaction):
+        """Test a status outside the known four is kept as still waiting"""
+        transaction.status = 'pending'
+        remember_transaction(transaction)
+        assert find_open_transaction('2405102', 'test.myshopify.com') is not None
+
+    def test_stale(self, transaction, settings):
+        stale = time.time() + settings.TERMINAL_STALE_TRANSACTION_SECONDS
+        assert find_open_transaction('2405102', 'test.myshopify.com', now=stale) is None
+
+
+@pytest.mark.django_db
+class TestStatusFromSharedMemory:
+    """Test status polls of open transactions"""
+
+    @responses.activate
+    def test_unchanged_status_skips_database(self, transaction):
+        responses.add(responses.POST, STATUS_URL, json={'transaction': {'status': 'unknown'}})
+        terminal_links.get(transaction.terminal_link_id)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = poll()
+
+        assert response.json()['status'] == 'started'
+        assert response.json()['next_poll_ms'] > 0
+        assert len(queries) == 0
+
+    @responses.activate
+    def test_change_is_written(self, transaction):
+        responses.add(responses.POST, STATUS_URL, json={'transaction': {'status': 'success'}})
+
+        assert poll().json()['status'] == 'success'
+        transaction.refresh_from_db()
+        assert transaction.status == 'success'
+        assert find_open_transaction('2405102', 'test.myshopify.com') is None
+
+    @responses.activate
+    def test_throttled_poll_skips_database(self, transaction, settings):
+        settings.TERMINAL_POLL_BURST = 1
+        responses.add(responses.POST, STATUS_URL, json={'transaction': {'status': 'unknown'}})
+        poll()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = poll()
+
+        assert response.json()['throttled'] is True
+        assert response.json()['status'] == 'started'
+        assert len(queries) == 0
@@ -0,0 +1,112 @@
+import json
+from datetime import timedelta
+
+import pytest
+import responses
+from django.test import Client
+from django.utils import timezone
+
+from terminal.models import TerminalLinks, Transaction
+from terminal.polling import completion_quantiles, next_poll_ms, record_completion
+from terminal.services import apply_status_update
+
+
+STATUS_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/status'
+
+
+def learn(terminal_link_id, durations_ms, now=1_000_000):
+    for duration in durations_ms:
+        record_completion(terminal_link_id, duration, now=now)
+
+
+class TestCompletionSketch:
+    """Test the completion-time sketch"""
+
+    def test_quantiles_are_close(self):
+        """Test sketch quantiles stay within a bucket's width of the true values"""
+        learn(1, range(4000, 8000, 10))
+        p10, p50, p90 = completion_quantiles(1, now=1_000_000)
+        assert p10 == pytest.approx(4400, rel=0.25)
+        assert p50 == pytest.approx(6000, rel=0.25)
+        assert p90 == pytest.approx(7600, rel=0.25)
+
+    def test_no_history(self):
+        """Test too little history gives no quantiles"""
+        learn(1, [5000])
+        assert completion_quantiles(1, now=1_000_000) is None
+
+    def test_old_history_fades(self, settings):
+        """Test recent completions outweigh ones several half-lives old"""
+        settings.TERMINAL_COMPLETION_HALF_LIFE_HOURS = 1
+        learn(1, [40_000] * 50, now=0)
+        learn(1, [5000] * 10, now=5 * 3600)
+        p50 = completion_quantiles(1, qs=(0.5,), now=5 * 3600)[0]
+        assert p50 < 10_000
+
+
+class TestNextPollHint:
+    """Test next_poll_ms"""
+
+    @pytest.fixture(autouse=True)
+    def history(self, settings):
+        settings.TERMINAL_POLL_INTERVAL_SECONDS = 1
+        settings.TERMINAL_POLL_MAX_MS = 5000
+        learn(1, range(10_000, 20_000, 100))
+
+    def test_sparse_while_tapping(self):
+        """Test early polls are spaced out towards the usual completion time"""
+        assert next_poll_ms(1, 0, now=1_000_000) == 5000
+        assert 1000 < next_poll_ms(1, 8000, now=1_000_000) < 5000
+
+    def test_dense_around_usual_completion(self):
+        assert next_poll_ms(1, 15_000, now=1_000_000) == 1000
+
+    def test_backs_off_when_late(self):
+        assert next_poll_ms(1, 60_000, now=1_000_000) == 5000
+
+    def test_default_without_history(self):
+        assert next_poll_ms(2, 0, now=1_000_000) == 1000
+
+
+@pytest.mark.django_db
+class TestStatusHint:
+    """Test next_poll_ms in status responses"""
+
+    @pytest.fixture
+    def transaction(self):
+        terminal = TerminalLinks.objects.create(
+            shop_domain='test.myshopify.com', terminal_id='50303253', api_key='test-api-key'
+        )
+        return Transaction.objects.create(
+            transaction_id='2405102', terminal_link=terminal, amount=1250,
+            status='started', shop_domain='test.myshopify.com'
+        )
+
+    def poll(self):
+        return Client().post(
+            '/api/terminal/status',
+            data=json.dumps({'shopDomain': 'test.myshopify.com', 'transaction_id': '2405102'}),
+            content_type='application/json'
+        )
+
+    @responses.activate
+    def test_hint_while_running(self, transaction):
+        responses.add(responses.POST, STATUS_URL, json={'transaction': {'status': 'unknown'}})
+        assert self.poll().json()['next_poll_ms'] > 0
+
+    @responses.activate
+    def test_no_hint_when_final(self, transaction):
+        responses.add(responses.POST, STATUS_URL, json={'transaction': {'status': 'success'}})
+        assert self.poll().json()['next_poll_ms'] is None
+
+    def test_final_status_is_learned(self, transaction):
+        """Test completing a payment records its duration for the terminal"""
+        for _ in range(4):
+            Transaction.objects.filter(pk=transaction.pk).update(
+                status='started', created_at=timezone.now() - timedelta(seconds=12)
+            )
+            transaction.refresh_from_db()
+            apply_status_update(transaction, 'success')
+
+        p50 = completion_quantiles(transaction.terminal_link_id, qs=(0.5,))[0]
+        assert p50 == pytest.approx(12_000, rel=0.25)
@@ -0,0 +1,105 @@
+import csv
+import io
+import pytest
+from django.core.management import call_command
+from terminal.models import Transaction, TransactionArchive
+from terminal.reconciliation import database_rows, parse_amount, reconcile
+
+
+SETTLEMENT = """transaction_id,amount,status
+match,1000,approved
+wrong-amount,1250,approved
+wrong-status,500,approved
+only-settlement,700,approved
+broken,abc,approved
+"""
+
+
+@pytest.fixture
+def transactions():
+    for transaction_id, amount, status in [
+        ('match', 1000, 'success'),
+        ('wrong-amount', 1200, 'success'),
+        ('wrong-status', 500, 'timeout'),
+        ('only-db', 300, 'success'),
+        ('declined', 300, 'failed'),
+    ]:
+        Transaction.objects.create(
+            transaction_id=transaction_id,
+            amount=amount,
+            status=status,
+            shop_domain='test.myshopify.com'
+        )
+
+
+def run(settlement, rows, **kwargs):
+    report = io.StringIO()
+    result = reconcile(io.StringIO(settlement), csv.writer(report), rows, **kwargs)
+    report.seek(0)
+    return result, list(csv.DictReader(report))
+
+
+class TestParseAmount:
+    """Test settlement amount parsing"""
+
+    def test_cents(self):
+        assert parse_amount('1250') == 1250
+
+    def test_euros(self):
+        assert parse_amount('12,50', unit='euros') == 1250
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            parse_amount('abc')
+
+
+@pytest.mark.django_db
+class TestReconcile:
+    """Test the partitioned reconciliation join"""
+
+    def test_reports_all_discrepancy_kinds(self, transactions):
+        """Test missing rows, amount and status mismatches are reported"""
+        result, report = run(SETTLEMENT, database_rows(), partitions=4)
+
+        kinds = {(row['kind'], row['transaction_id']) for row in report}
+        assert kinds == {
+            ('amount_mismatch', 'wrong-amount'),
+            ('status_mismatch', 'wrong-status'),
+            ('missing_in_db', 'only-settlement'),
+            ('missing_in_settlement', 'only-db'),
+            ('invalid_settlement_row', 'broken'),
+        }
+        assert result.matched == 1
+        assert result.settlement_rows == 5
+        assert result.db_rows == 5
+
+    def test_single_partition_gives_same_result(self, transactions):
+        """Test the partition count does not change the outcome"""
+        result_many, _ = run(SETTLEMENT, database_rows(), partitions=16)
+        result_one, _ = run(SETTLEMENT, database_rows(), partitions=1)
+        assert result_many.counts == result_one.counts
+
+    def test_include_archive(self, transactions):
+        """Test archived transactions can be matched too"""
+        TransactionArchive.objects.create(
+            transaction_id='only-settlement', amount=700, status='success',
+            shop_domain='test.myshopify.com',
+            created_at='2024-01-01T00:00:00Z', updated_at='2024-01-01T00:00:00Z'
+        )
+
+        result, _ = run(SETTLEMENT, database_rows(include_archive=True))
+        assert 'missing_in_db' not in result.counts
+
+    def test_command(self, transactions, tmp_path):
+        """Test the management command writes a report file"""
+        settlement = tmp_path / 'settlement.csv'
+        settlement.write_text(SETTLEMENT)
+        output = tmp_path / 'report.csv'
+
+        err = io.StringIO()
+        call_command('reconcile_settlement', str(settlement), output=str(output),
+                     shop='test.myshopify.com', stderr=err)
+
+        assert '1 matched' in err.getvalue()
+        assert 'amount_mismatch: 1' in err.getvalue()
+        assert output.read_text().startswith('kind,transaction_id')
@@ -0,0 +1,126 @@
+import pytest
+from datetime import timedelta
+from django.test import Client
+from django.utils import timezone
+from terminal.maintenance import TableArchiveWriter, archive_transactions, sweep_stale_transactions
+from terminal.models import DailyTransactionStat, TerminalLinks, Transaction
+from terminal.rollups import rebuild_rollups, record_transition, shop_stats
+from terminal.services import apply_status_update
+
+
+@pytest.fixture
+def terminal():
+    return TerminalLinks.objects.create(
+        shop_domain='test.myshopify.com',
+        terminal_id='50303253',
+        api_key='test-api-key'
+    )
+
+
+def start(transaction_id, terminal, amount=1000, age=None):
+    transaction = Transaction.objects.create(
+        transaction_id=transaction_id,
+        terminal_link=terminal,
+        amount=amount,
+        status='started',
+        shop_domain='test.myshopify.com'
+    )
+    if age:
+        Transaction.objects.filter(pk=transaction.pk).update(created_at=timezone.now() - age)
+        transaction.refresh_from_db()
+    record_transition(transaction, None, 'started')
+    return transaction
+
+
+def buckets():
+    return {
+        stat.status: (stat.count, stat.amount_total)
+        for stat in DailyTransactionStat.objects.filter(count__gt=0)
+    }
+
+
+@pytest.mark.django_db
+class TestRollups:
+    """Test incremental rollup maintenance"""
+
+    def test_transitions_move_between_buckets(self, terminal):
+        """Test a status transition moves count and amount to the new status"""
+        first = start('txn-1', terminal, amount=1000)
+        start('txn-2', terminal, amount=500)
+        assert buckets() == {'started': (2, 1500)}
+
+        apply_status_update(first, 'success', receipt='Receipt data...')
+        assert buckets() == {'started': (1, 500), 'success': (1, 1000)}
+
+        apply_status_update(first, 'success')
+        assert buckets() == {'started': (1, 500), 'success': (1, 1000)}
+
+    def test_sweeper_updates_rollups(self, terminal):
+        """Test bulk timeouts are reflected in the rollups"""
+        start('txn-1', terminal, age=timedelta(hours=1))
+
+        sweep_stale_transactions(older_than=timedelta(minutes=15))
+
+        assert buckets() == {'timeout': (1, 1000)}
+
+    def test_rebuild_matches_incremental(self, terminal):
+        """Test rebuilding from Transaction gives the same rollups"""
+        apply_status_update(start('txn-1', terminal), 'success')
+        apply_status_update(start('txn-2', terminal), 'failed')
+        start('txn-3', terminal)
+        incremental = buckets()
+
+        DailyTransactionStat.objects.all().delete()
+        today = timezone.localdate()
+        rebuild_rollups(today, today)
+
+        assert buckets() == incremental
+
+    def test_rebuild_keeps_archived_days(self, terminal):
+        """Test rebuilding a day whose rows were archived keeps its totals"""
+        old = start('txn-1', terminal, amount=1000, age=timedelta(days=400))
+        apply_status_update(old, 'success')
+        start('txn-2', terminal, amount=500, age=timedelta(days=400))
+        before = buckets()
+
+        assert archive_transactions(timedelta(days=365), TableArchiveWriter()) == 2
+        day = timezone.localdate(old.created_at)
+        rebuild_rollups(day, day)
+
+        assert buckets() == before
+        assert set(DailyTransactionStat.objects.values_list('terminal_id', flat=True)) == {'50303253'}
+
+    def test_shop_stats(self, terminal):
+        """Test dashboard aggregates"""
+        apply_status_update(start('txn-1', terminal, amount=1000), 'success')
+        apply_status_update(start('txn-2', terminal, amount=700), 'failed')
+        start('txn-3', terminal, amount=300)
+
+        stats = shop_stats('test.myshopify.com', days=7)
+
+        assert stats['totals']['count'] == 3
+        assert stats['totals']['revenue'] == 1000
+        assert stats['totals']['success_rate'] == 0.5
+        assert stats['terminals'] == [{'terminal_id': '50303253', 'count': 3, 'revenue': 1000}]
+        assert stats['days'][0]['day'] == timezone.localdate().isoformat()
+
+
+@pytest.mark.django_db
+class TestStatsView:
+    """Test get_stats view"""
+
+    def test_stats(self, terminal):
+        """Test stats endpoint returns rollup aggregates"""
+        apply_status_update(start('txn-1', terminal), 'success')
+
+        response = Client().get('/api/terminal/stats', {'shop': 'test.myshopify.com', 'days': 30})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data['success'] is True
+        assert data['totals']['success_count'] == 1
+
+    def test_stats_invalid_days(self):
+        """Test days must be in range"""
+        response = Client().get('/api/terminal/stats', {'shop': 'test.myshopify.com', 'days': 0})
+        assert response.status_code == 400
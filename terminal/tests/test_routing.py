@@ -0,0 +1,153 @@
+import json
+
+import pytest
+import requests
+import responses
+from django.test import Client
+
+from terminal.health import UpstreamErrorTracker, rank_by_health, tracker
+from terminal.models import TerminalLinks, Transaction
+from terminal.occupancy import claim_terminal, is_busy
+from terminal.services import find_terminal_candidates
+
+
+START_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/start'
+STATUS_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/status'
+
+
+@pytest.fixture(autouse=True)
+def clear_tracker():
+    tracker.clear()
+    yield
+    tracker.clear()
+
+
+@pytest.fixture
+def terminals():
+    TerminalLinks.objects.create(
+        shop_domain='test.myshopify.com', location_id='999', terminal_id='other', api_key='key-other'
+    )
+    return [
+        TerminalLinks.objects.create(
+            shop_domain='test.myshopify.com', location_id='123', terminal_id=terminal_id, api_key=f'key-{terminal_id}'
+        ) for terminal_id in ('first', 'second')
+    ]
+
+
+def start():
+    return Client().post(
+        '/api/terminal/start',
+        data=json.dumps({'shopDomain': 'test.myshopify.com', 'locationId': '123', 'amount': 1250}),
+        content_type='application/json'
+    )
+
+
+def started_on(call):
+    return call.request.headers['X-API-KEY']
+
+
+class TestUpstreamErrorTracker:
+    """Test UpstreamErrorTracker"""
+
+    def test_unhealthy_after_threshold(self):
+        """Test a terminal turns unhealthy after enough failures and recovers on success"""
+        errors = UpstreamErrorTracker(threshold=2, window=60)
+        errors.record_failure(1)
+        assert errors.is_healthy(1)
+        errors.record_failure(1)
+        assert not errors.is_healthy(1)
+
+        errors.record_success(1)
+        assert errors.is_healthy(1)
+
+    def test_failures_expire(self):
+        """Test failures outside the window are forgotten"""
+        errors = UpstreamErrorTracker(threshold=1, window=0)
+        errors.record_failure(1)
+        assert errors.is_healthy(1)
+        assert len(errors) == 0
+
+
+@pytest.mark.django_db
+class TestFindTerminalCandidates:
+    """Test find_terminal_candidates"""
+
+    def test_all_terminals_at_location(self, terminals):
+        """Test every terminal at the location is returned in routing order"""
+        candidates = find_terminal_candidates(shop_domain='test.myshopify.com', location_id='123')
+        assert candidates == terminals
+
+    def test_unhealthy_terminal_ranked_last(self, terminals):
+        """Test a terminal with recent errors is tried after healthy ones"""
+        for _ in range(tracker.threshold):
+            tracker.record_failure(terminals[0].pk)
+        assert rank_by_health(terminals) == [terminals[1], terminals[0]]
+
+
+@pytest.mark.django_db
+class TestStartFailover:
+    """Test start_transaction routing across terminals at a location"""
+
+    @responses.activate
+    def test_busy_terminal_is_skipped(self, terminals):
+        """Test a start goes to the idle terminal when the first one is busy"""
+        claim_terminal(terminals[0])
+        responses.add(responses.POST, START_URL, json={'transaction_id': '2405102'})
+
+        response = start()
+
+        assert response.status_code == 200
+        assert started_on(responses.calls[0]) == 'key-second'
+        assert Transaction.objects.get(transaction_id='2405102').terminal_link == terminals[1]
+
+    @responses.activate
+    def test_all_busy_returns_409(self, terminals):
+        """Test a start fails fast when every terminal at the location is busy"""
+        for terminal in terminals:
+            claim_terminal(terminal)
+
+        response = start()
+
+        assert response.status_code == 409
+        assert len(responses.calls) == 0
+
+    @responses.activate
+    def test_fails_over_on_connection_error(self, terminals):
+        """Test an unreachable terminal fails over to the next one"""
+        responses.add(responses.POST, START_URL, body=requests.ConnectionError('offline'))
+        responses.add(responses.POST, START_URL, json={'transaction_id': '2405102'})
+
+        response = start()
+
+        assert response.status_code == 200
+        assert [started_on(call) for call in responses.calls] == ['key-first', 'key-second']
+        assert not is_busy(terminals[0])
+        assert tracker.recent_failures(terminals[0].pk) == 1
+
+    @responses.activate
+    def test_no_failover_after_timeout(self, terminals):
+        """Test a timed out start is not retried elsewhere, the payment may be running"""
+        responses.add(responses.POST, START_URL, body=requests.Timeout('timed out'))
+
+        response = start()
+
+        assert response.status_code == 502
+        assert len(responses.calls) == 1
+        assert is_busy(terminals[0])
+
+    @responses.activate
+    def test_status_polls_the_starting_terminal(self, terminals):
+        """Test status is asked from the terminal that started the payment"""
+        Transaction.objects.create(
+            transaction_id='2405102', terminal_link=terminals[1], amount=1250,
+            status='started', shop_domain='test.myshopify.com', location_id='123'
+        )
+        responses.add(responses.POST, STATUS_URL, json={'transaction': {'status': 'unknown'}})
+
+        Client().post(
+            '/api/terminal/status',
+            data=json.dumps({'shopDomain': 'test.myshopify.com', 'locationId': '123', 'transaction_id': '2405102'}),
+            content_type='application/json'
+        )
+
+        assert started_on(responses.calls[0]) == 'key-second'
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+import responses
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from terminal.models import TerminalLinks, Transaction
+from terminal.services import terminal_links
+from terminal.tokens import check_status_token, make_status_token
+
+
+START_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/start'
+STATUS_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/status'
+
+
+@pytest.fixture
+def terminal():
+    return TerminalLinks.objects.create(
+        shop_domain='test.myshopify.com', location_id='123', terminal_id='50303253', api_key='test-api-key'
+    )
+
+
+def poll(body):
+    return Client().post('/api/terminal/status', data=json.dumps(body), content_type='application/json')
+
+
+class TestStatusToken:
+    """Test status token signing"""
+
+    def test_round_trip(self):
+        token = make_status_token(7, '50303253', '2405102', 'test.myshopify.com')
+        assert check_status_token(token) == {
+            'terminal_link_id': 7,
+            'terminal_id': '50303253',
+            'transaction_id': '2405102',
+            'shop_domain': 'test.myshopify.com',
+        }
+
+    def test_tampered(self):
+        token = make_status_token(7, '50303253', '2405102', 'test.myshopify.com')
+        assert check_status_token(token[:-2] + 'xx') is None
+
+    def test_expired(self, settings):
+        token = make_status_token(7, '50303253', '2405102', 'test.myshopify.com')
+        settings.TERMINAL_STATUS_TOKEN_MAX_AGE = -1
+        assert check_status_token(token) is None
+
+
+@pytest.mark.django_db
+class TestStatusWithToken:
+    """Test get_transaction_status with a status token"""
+
+    @responses.activate
+    def test_start_token_skips_routing(self, terminal):
+        """Test a poll with only the token reaches upstream without a TerminalLinks query"""
+        responses.add(responses.POST, START_URL, json={'transaction_id': '2405102'})
+        responses.add(responses.POST, STATUS_URL, json={'transaction': {'status': 'success'}})
+        token = Client().post(
+            '/api/terminal/start',
+            data=json.dumps({'shopDomain': 'test.myshopify.com', 'locationId': '123', 'amount': 1250}),
+            content_type='application/json'
+        ).json()['status_token']
+        terminal_links.get(terminal.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = poll({'status_token': token})
+
+        assert response.status_code == 200
+        assert response.json()['status'] == 'success'
+        assert responses.calls[1].request.headers['X-API-KEY'] == 'test-api-key'
+        assert not [q for q in queries if 'FROM "terminal_terminallinks"' in q['sql']]
+        assert Transaction.objects.get(transaction_id='2405102').status == 'success'
+
+    def test_invalid_token(self):
+        response = poll({'status_token': 'garbage'})
+        assert response.status_code == 401
+
+    @pytest.mark.parametrize('token', [12345, ['a'], {'a': 1}])
+    def test_non_string_token(self, token):
+        response = poll({'status_token': token})
+        assert response.status_code == 401
+
+    def test_link_changes_are_picked_up(self, terminal):
+        """Test saving a link evicts it from the cache"""
+        assert terminal_links.get(terminal.pk).api_key == 'test-api-key'
+        terminal.api_key = 'rotated-key'
+        terminal.save()
+        assert terminal_links.get(terminal.pk).api_key == 'rotated-key'
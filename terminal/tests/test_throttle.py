@@ -0,0 +1,153 @@
+import json
+import multiprocessing
+
+import pytest
+import responses
+from django.test import Client
+
+from terminal import metrics
+from terminal.models import TerminalLinks, Transaction
+from terminal.sharedmem import SharedTable, key_hash
+from terminal.throttle import check_poll, take
+from terminal.tokens import make_diagnostics_token
+
+
+STATUS_URL = 'https://rest-api.pinvandaag.com/V2/instore/transactions/status'
+SHOP = 'test.myshopify.com'
+
+
+def poll(transaction_id='2405102', device_id=None):
+    headers = {'HTTP_X_DEVICE_ID': device_id} if device_id else {}
+    return Client().post(
+        '/api/terminal/status',
+        data=json.dumps({'shopDomain': 'test.myshopify.com', 'transaction_id': transaction_id}),
+        content_type='application/json',
+        **headers
+    )
+
+
+def _increment_many(path, count):
+    table = SharedTable(path, slots=16, value_format='q')
+    for _ in range(count):
+        table.update('counter', lambda stored: (((stored[0] if stored else 0) + 1,), None))
+
+
+class TestSharedTable:
+    """Test SharedTable"""
+
+    def test_updates_are_shared_across_processes(self, tmp_path):
+        """Test concurrent read-modify-writes from several processes are not lost"""
+        path = str(tmp_path / 'table.bin')
+        workers = [multiprocessing.Process(target=_increment_many, args=(path, 200)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        assert SharedTable(path, slots=16, value_format='q').get('counter') == (800,)
+
+    def test_collisions_probe_to_free_slot(self, tmp_path):
+        """Test keys sharing a home slot keep separate records"""
+        table = SharedTable(str(tmp_path / 'table.bin'), slots=8, value_format='q', max_probe=2)
+        first = 'key-0'
+        second = next(f'key-{i}' for i in range(1, 1000) if key_hash(f'key-{i}') % 8 == key_hash(first) % 8)
+        table.update(first, lambda stored: ((1,), None))
+        table.update(second, lambda stored: ((2,), None))
+        assert table.get(first) == (1,)
+        assert table.get(second) == (2,)
+
+
+class TestTokenBucket:
+    """Test take"""
+
+    def test_burst_then_refill(self):
+        """Test a full bucket allows a burst and refills at the rate"""
+        assert take('k', rate=1, burst=2, now=100)[0]
+        assert take('k', rate=1, burst=2, now=100)[0]
+        allowed, retry_after = take('k', rate=1, burst=2, now=100)
+        assert not allowed
+        assert retry_after == pytest.approx(1)
+
+        assert take('k', rate=1, burst=2, now=101)[0]
+
+    def test_device_limit(self, settings):
+        """Test one device polling many transactions is limited"""
+        settings.TERMINAL_DEVICE_POLL_BURST = 2
+        assert check_poll('tx-1', SHOP, 'device-1')[0]
+        assert check_poll('tx-2', SHOP, 'device-1')[0]
+        allowed, _, scope = check_poll('tx-3', SHOP, 'device-1')
+        assert not allowed
+        assert scope == 'device'
+
+    def test_throttled_transaction_keeps_device_budget(self, settings):
+        """Test polls rejected for their transaction do not use up the device's tokens"""
+        settings.TERMINAL_POLL_BURST = 1
+        settings.TERMINAL_DEVICE_POLL_BURST = 2
+        assert check_poll('tx-1', SHOP, 'device-1')[0]
+        for _ in range(3):
+            assert check_poll('tx-1', SHOP, 'device-1')[2] == 'transaction'
+        assert check_poll('tx-2', SHOP, 'device-1')[0]
+
+    def test_transaction_bucket_is_per_shop(self, settings):
+        """Test another shop polling the same transaction id has its own bucket"""
+        settings.TERMINAL_POLL_BURST = 1
+        assert check_poll('tx-1', SHOP)[0]
+        assert not check_poll('tx-1', SHOP)[0]
+        assert check_poll('tx-1', 'other.myshopify.com')[0]
+
+
+@pytest.mark.django_db
+class TestThrottledStatus:
+    """Test throttled status polls"""
+
+    @responses.activate
+    def test_fast_polls_get_stored_status(self, settings):
+        """Test polls beyond the burst are answered from the database with Retry-After"""
+        settings.TERMINAL_POLL_BURST = 1
+        terminal = TerminalLinks.objects.create(
+            shop_domain='test.myshopify.com', terminal_id='50303253', api_key='test-api-key'
+        )
+        Transaction.objects.create(
+            transaction_id='2405102', terminal_link=terminal, amount=1250,
+            status='started', shop_domain='test.myshopify.com'
+        )
+        responses.add(responses.POST, STATUS_URL, json={'transaction': {'status': 'unknown'}})
+        throttled_before = metrics.get('terminal_poll_throttle_total', scope='transaction', decision='throttled')
+
+        first = poll()
+        second = poll()
+
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert second.json()['status'] == 'started'
+        assert second.json()['throttled'] is True
+        assert second['Retry-After'] == '1'
+        assert len(responses.calls) == 1
+        assert metrics.get(
+            'terminal_poll_throttle_total', scope='transaction', decision='throttled'
+        ) == throttled_before + 1
+
+    def test_unknown_transaction_gets_429(self, settings):
+        """Test a throttled poll for an unknown transaction is rejected"""
+        settings.TERMINAL_POLL_BURST = 0
+        response = poll('unknown')
+        assert response.status_code == 429
+        assert response['Retry-After']
+
+
+class TestMetricsEndpoint:
+    """Test the metrics diagnostics endpoint"""
+
+    def test_requires_token(self):
+        assert Client().get('/api/terminal/diagnostics/metrics').status_code == 401
+
+    def test_prometheus_output(self):
+        metrics.increment('terminal_test_total', kind='a')
+        response = Client().get(
+            '/api/terminal/diagnostics/metrics',
+            HTTP_X_TERMINAL_DIAGNOSTICS=make_diagnostics_token('metrics')
+        )
+        body = response.content.decode()
+        assert response.status_code == 200
+        assert '# TYPE terminal_test_total counter' in body
+        assert 'terminal_test_total{kind="a"}' in body
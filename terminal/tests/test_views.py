@@ -207,7 +207,9 @@ class TestGetTransactionStatusView:
         data = response.json()
         assert data['success'] is True
         assert data['status'] == 'success'
-        assert data['receipt'] == 'Receipt data...'
+        digest = Transaction.objects.get(transaction_id='2405102').receipt_record.digest
+        assert data['receipt_url'] == f'/api/terminal/receipt/2405102?shop=test.myshopify.com&v={digest[:16]}'
+        assert 'receipt' not in data
 
         # Verify transaction was updated in database
         transaction.refresh_from_db()
@@ -394,3 +396,91 @@ class TestGetTransactionStatusView:
         data = response.json()
         assert data['success'] is True
         assert data['status'] == 'success'
+
+    @responses.activate
+    def test_get_status_leaves_other_shops_row_alone(self, client, terminal):
+        """Test a poll never updates another shop's transaction with the same id"""
+        other = TerminalLinks.objects.create(
+            shop_domain='other.myshopify.com', terminal_id='60000000', api_key='other-api-key'
+        )
+        Transaction.objects.create(
+            transaction_id='2405102', terminal_link=other, amount=500,
+            status='started', shop_domain='other.myshopify.com'
+        )
+        responses.add(
+            responses.POST,
+            'https://rest-api.pinvandaag.com/V2/instore/transactions/status',
+            json={'transaction': {'status': 'failed'}},
+            status=200
+        )
+
+        response = client.post(
+            '/api/terminal/status',
+            data=json.dumps({'shopDomain': 'test.myshopify.com', 'transaction_id': '2405102'}),
+            content_type='application/json'
+        )
+
+        assert response.json()['status'] == 'failed'
+        assert responses.calls[0].request.headers['X-API-KEY'] == 'test-api-key'
+        assert Transaction.objects.get(shop_domain='other.myshopify.com').status == 'started'
+
+
+@pytest.mark.django_db
+class TestGetReceiptView:
+    """Test get_receipt view"""
+
+    @pytest.fixture
+    def transaction(self, terminal):
+        transaction = Transaction.objects.create(
+            transaction_id='2405102',
+            terminal_link=terminal,
+            amount=1250,
+            status='success',
+            shop_domain='test.myshopify.com'
+        )
+        transaction.receipt = 'Receipt data...'
+        transaction.save()
+        return transaction
+
+    def test_get_receipt(self, client, transaction):
+        """Test the versioned receipt URL is served with a strong ETag and immutable caching"""
+        digest = transaction.receipt_record.digest
+        response = client.get('/api/terminal/receipt/2405102', {'shop': 'test.myshopify.com', 'v': digest[:16]})
+
+        assert response.status_code == 200
+        assert response.content.decode() == 'Receipt data...'
+        assert response['ETag'] == f'"{digest}"'
+        assert 'immutable' in response['Cache-Control']
+
+    def test_replaced_receipt_revalidates(self, client, transaction):
+        """Test a URL of an older receipt version is not cached"""
+        old_version = transaction.receipt_record.digest[:16]
+        transaction.receipt = 'Final receipt'
+        transaction.save()
+
+        response = client.get('/api/terminal/receipt/2405102', {'shop': 'test.myshopify.com', 'v': old_version})
+
+        assert response.content.decode() == 'Final receipt'
+        assert response['Cache-Control'] == 'private, no-cache'
+
+    def test_get_receipt_not_modified(self, client, transaction):
+        """Test revalidation with a matching ETag returns 304"""
+        etag = f'"{transaction.receipt_record.digest}"'
+        response = client.get(
+            '/api/terminal/receipt/2405102',
+            {'shop': 'test.myshopify.com'},
+            HTTP_IF_NONE_MATCH=etag
+        )
+
+        assert response.status_code == 304
+        assert response['ETag'] == etag
+
+    def test_get_receipt_other_shop(self, client, transaction):
+        """Test receipts are not served to another shop"""
+        response = client.get('/api/terminal/receipt/2405102', {'shop': 'other.myshopify.com'})
+        assert response.status_code == 404
+
+    def test_get_receipt_missing_shop(self, client, transaction):
+        """Test shop parameter is required"""
+        response = client.get('/api/terminal/receipt/2405102')
+        assert response.status_code == 400
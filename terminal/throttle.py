@@ -0,0 +1,98 @@
+"""
+Token-bucket throttling of status polls
+
+Each transaction and each POS device has a bucket that refills at a fixed
+rate. Buckets live in a SharedTable, so the limit holds across all workers
+on a host without an external service. A poll that finds its bucket empty
+is answered from the database (the last known status) instead of asking
+Pin Vandaag and writing the row again.
+"""
+import os
+import time
+
+from django.conf import settings
+
+from terminal import metrics
+from terminal.sharedmem import SharedTable
+
+ALLOWED = 'allowed'
+THROTTLED = 'throttled'
+
+_buckets = SharedTable(
+    os.path.join(settings.TERMINAL_SHARED_MEMORY_DIR, 'throttle.bin'),
+    slots=settings.TERMINAL_THROTTLE_SLOTS,
+    value_format='dd',
+)
+
+
+def take(key, rate, burst, now=None):
+    """
+    Take one token from the bucket of `key`
+
+    Args:
+        key: Bucket key
+        rate: Tokens added per second
+        burst: Bucket capacity
+        now: Current time (seconds since the epoch), for tests
+
+    Returns:
+        tuple: (allowed, retry_after_seconds)
+    """
+    now = time.time() if now is None else now
+
+    def refill(stored):
+        tokens, updated_at = stored if stored else (burst, now)
+        tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+        if tokens >= 1:
+            return (tokens - 1, now), (True, 0.0)
+        return (tokens, now), (False, (1 - tokens) / rate)
+
+    return _buckets.update(key, refill)
+
+
+def give_back(key, burst):
+    """Return a token taken from the bucket of `key`"""
+    _buckets.update(key, lambda stored: ((min(burst, stored[0] + 1), stored[1]), None) if stored
+                    else ((burst, time.time()), None))
+
+
+def check_poll(transaction_id, shop_domain, device_id=None):
+    """
+    Decide whether a status poll may reach Pin Vandaag
+
+    A poll either takes a token from every bucket or from none, so polls
+    throttled for their transaction do not use up the device's budget.
+
+    Args:
+        transaction_id: Transaction being polled
+        shop_domain: Shop polling; transaction ids are not unique across shops
+        device_id: POS device polling (optional)
+
+    Returns:
+        tuple: (allowed, retry_after_seconds, scope) where scope names the
+        bucket that ran out ('device' or 'transaction'), or None
+    """
+    if not settings.TERMINAL_THROTTLE_ENABLED:
+        return True, 0.0, None
+
+    checks = [('transaction', f'tx:{shop_domain}:{transaction_id}',
+               1 / settings.TERMINAL_POLL_INTERVAL_SECONDS, settings.TERMINAL_POLL_BURST)]
+    if device_id:
+        checks.insert(0, ('device', f'device:{device_id}',
+                          settings.TERMINAL_DEVICE_POLLS_PER_SECOND, settings.TERMINAL_DEVICE_POLL_BURST))
+
+    taken = []
+    for scope, key, rate, burst in checks:
+        allowed, retry_after = take(key, rate, burst)
+        if not allowed:
+            for taken_key, taken_burst in taken:
+                give_back(taken_key, taken_burst)
+            metrics.increment('terminal_poll_throttle_total', scope=scope, decision=THROTTLED)
+            return False, retry_after, scope
+        taken.append((key, burst))
+    metrics.increment('terminal_poll_throttle_total', scope='all', decision=ALLOWED)
+    return True, 0.0, None
+
+
+def reset():
+    _buckets.clear()
@@ -0,0 +1,74 @@
+"""Signed tokens: operator-only diagnostics (profiling, memory reports) and POS status tokens"""
+from django.conf import settings
+from django.core import signing
+
+DIAGNOSTICS_SALT = 'terminal.diagnostics'
+
+
+def make_diagnostics_token(purpose):
+    """
+    Create a time-limited token that unlocks a diagnostics feature
+
+    Args:
+        purpose: Feature the token is valid for (e.g. 'profile')
+
+    Returns:
+        str: Signed token, valid for TERMINAL_DIAGNOSTICS_TOKEN_MAX_AGE seconds
+    """
+    return signing.TimestampSigner(salt=DIAGNOSTICS_SALT).sign(purpose)
+
+
+def check_diagnostics_token(token, purpose):
+    """
+    Verify a diagnostics token
+
+    Returns:
+        bool: True if the token is validly signed, unexpired and for this purpose
+    """
+    if not token:
+        return False
+    try:
+        value = signing.TimestampSigner(salt=DIAGNOSTICS_SALT).unsign(
+            token, max_age=settings.TERMINAL_DIAGNOSTICS_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return value == purpose
+
+
+STATUS_SALT = 'terminal.status'
+
+
+def make_status_token(terminal_link_id, terminal_id, transaction_id, shop_domain):
+    """
+    Create a compact signed token that identifies a running payment
+
+    The POS sends it back with every status poll, so the server needs no
+    routing lookup. It is signed, not encrypted: it holds no credentials.
+
+    Returns:
+        str: Token valid for TERMINAL_STATUS_TOKEN_MAX_AGE seconds
+    """
+    return signing.dumps(
+        [terminal_link_id, terminal_id, transaction_id, shop_domain],
+        salt=STATUS_SALT, compress=True
+    )
+
+
+def check_status_token(token):
+    """
+    Verify a status token
+
+    Returns:
+        dict: terminal_link_id, terminal_id, transaction_id and shop_domain,
+        or None if the token is invalid or expired
+    """
+    if not isinstance(token, str):
+        return None
+    try:
+        values = signing.loads(token, salt=STATUS_SALT, max_age=settings.TERMINAL_STATUS_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if not isinstance(values, list) or len(values) != 4:
+        return None
+    return dict(zip(('terminal_link_id', 'terminal_id', 'transaction_id', 'shop_domain'), values))
@@ -1,16 +1,29 @@
 from django.urls import path
 from .mock_views import *
 from .views.shopify_webhook_views import *
-from .views.views import get_transaction_status, start_transaction, app_home, get_transactions
-
-urlpatterns = [
-    # Embedded app UI
-    path('app/', app_home, name='app_home'),
-    path('transactions/', get_transactions, name='get_transactions'),
+from .views.views import get_transaction_status, start_transaction, app_home, get_transactions, get_receipt, export_transactions, get_stats, transaction_callback
+from .views.diagnostics_views import memory_diagnostics, metrics_diagnostics
 
+# Machine-to-machine endpoints, also served by the lean POS pipeline (terminal_connect.pos_urls)
+pos_urlpatterns = [
     # POS extension endpoints
     path('start', start_transaction, name='start_transaction'),
     path('status', get_transaction_status, name='get_transaction_status'),
+    path('receipt/<str:transaction_id>', get_receipt, name='get_receipt'),
+
+    # Pushed results from Pin Vandaag (signed)
+    path('callback', transaction_callback, name='transaction_callback'),
+
+    # Shopify webhooks
+    path('webhooks', shopify_webhook, name='shopify_webhook'),
+]
+
+urlpatterns = pos_urlpatterns + [
+    # Embedded app UI
+    path('app/', app_home, name='app_home'),
+    path('transactions/', get_transactions, name='get_transactions'),
+    path('transactions/export', export_transactions, name='export_transactions'),
+    path('stats', get_stats, name='get_stats'),
 
     # Mock endpoints for testing
     path('mock/start', mock_start_transaction),
@@ -18,6 +31,7 @@ urlpatterns = [
     path('mock/start-timeout', mock_start_timeout),
     path('mock/status', mock_get_transaction_status),
 
-    # Shopify webhooks
-    path('webhooks', shopify_webhook, name='shopify_webhook'),
+    # Operator diagnostics (token protected)
+    path('diagnostics/memory', memory_diagnostics, name='memory_diagnostics'),
+    path('diagnostics/metrics', metrics_diagnostics, name='metrics_diagnostics'),
 ]
\ No newline at end of file
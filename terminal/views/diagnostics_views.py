@@ -0,0 +1,60 @@
+import logging
+
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
+
+from terminal import metrics
+from terminal.diagnostics import memory_report
+from terminal.tokens import check_diagnostics_token
+
+logger = logging.getLogger(__name__)
+
+DIAGNOSTICS_HEADER = 'X-Terminal-Diagnostics'
+MEMORY_ACTIONS = ('start', 'snapshot', 'diff', 'reset', 'stop')
+
+
+@require_GET
+def memory_diagnostics(request):
+    """
+    Memory report for the worker process serving this request
+
+    GET /api/terminal/diagnostics/memory?action=diff&top=20
+    Header: X-Terminal-Diagnostics: <token from `manage.py diagnostics_token memory`>
+    """
+    token = request.headers.get(DIAGNOSTICS_HEADER) or request.GET.get('_token')
+    if not check_diagnostics_token(token, 'memory'):
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    action = request.GET.get('action', 'snapshot')
+    if action not in MEMORY_ACTIONS:
+        return JsonResponse({
+            'success': False,
+            'error': f"action must be one of {', '.join(MEMORY_ACTIONS)}"
+        }, status=400)
+
+    try:
+        top = int(request.GET.get('top', 20))
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': 'top must be an integer'
+        }, status=400)
+
+    report = memory_report(action=action, top=top)
+    logger.info(f"Memory diagnostics: action={action}, pid={report['pid']}")
+    return JsonResponse({'success': True, 'report': report})
+
+
+@require_GET
+def metrics_diagnostics(request):
+    """
+    Host-wide counters in the Prometheus text format
+
+    GET /api/terminal/diagnostics/metrics
+    Header: X-Terminal-Diagnostics: <token from `manage.py diagnostics_token metrics`>
+    """
+    token = request.headers.get(DIAGNOSTICS_HEADER) or request.GET.get('_token')
+    if not check_diagnostics_token(token, 'metrics'):
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4')
@@ -1,17 +1,42 @@
 import json
 import logging
-from django.http import JsonResponse
+import math
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import reverse
+from django.utils.http import urlencode
 from django.views.decorators.clickjacking import xframe_options_exempt
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods, require_GET
 import requests
 from django.utils import timezone
-from terminal.models import Transaction
-from terminal.services import PinVandaagService, find_terminal
+from terminal.bulkheads import BulkheadFull
+from terminal.callbacks import SIGNATURE_HEADER, TIMESTAMP_HEADER, CallbackError, apply_callback, verify_callback
+from terminal.exports import EXPORT_FORMATS, export_rows, iter_export, parse_day
+from terminal.health import is_offline, rank_by_health, tracker
+from terminal.idempotency import idempotent
+from terminal.models import Transaction, TransactionReceipt
+from terminal.notify import version as notify_version, wait_for_change
+from terminal.occupancy import bind_transaction, claim_terminal, release_terminal
+from terminal.open_transactions import find_open_transaction, remember_transaction
+from terminal.polling import next_poll_ms
+from terminal.rollups import record_transition, shop_stats
+from terminal.services import (
+    PinVandaagService, apply_status_update, find_terminal, find_terminal_candidates, parse_status_response,
+    terminal_links
+)
+from terminal.shards import bind_shop, sharded
+from terminal.throttle import check_poll
+from terminal.tokens import check_status_token, make_status_token
 
 logger = logging.getLogger(__name__)
 
+# Identifies the POS device for per-device poll throttling
+DEVICE_HEADER = 'X-Device-Id'
+# Digest characters in the `v` parameter of receipt URLs
+RECEIPT_VERSION_LENGTH = 16
+
 
 # =============================================================
 # EMBEDDED APP VIEWS (NEW)
@@ -47,8 +72,8 @@ def get_transactions(request):
         }, status=400)
 
     # Get last 50 transactions for this shop
-    transactions = Transaction.objects.filter(
-        shop_domain=shop
+    transactions = Transaction.objects.for_shop(shop).select_related(
+        'location_ref', 'staff_ref'
     ).order_by('-created_at')[:50]
 
     data = [{
@@ -69,17 +94,92 @@ def get_transactions(request):
     })
 
 
+@require_GET
+def export_transactions(request):
+    """
+    Stream all transactions of a shop as CSV or NDJSON
+
+    GET /api/terminal/transactions/export?shop=store.myshopify.com&from=2025-01-01&to=2025-01-31&format=csv
+    """
+    shop = request.GET.get('shop', '')
+    export_format = request.GET.get('format', 'csv')
+
+    if not shop:
+        return JsonResponse({
+            'success': False,
+            'error': 'shop parameter is required'
+        }, status=400)
+
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({
+            'success': False,
+            'error': 'format must be csv or ndjson'
+        }, status=400)
+
+    try:
+        start = parse_day(request.GET['from']) if request.GET.get('from') else None
+        end = parse_day(request.GET['to'], end=True) if request.GET.get('to') else None
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': 'from and to must be dates (YYYY-MM-DD)'
+        }, status=400)
+
+    content_type = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv; charset=utf-8'
+    response = StreamingHttpResponse(
+        iter_export(export_rows(shop, start, end), export_format),
+        content_type=content_type
+    )
+    filename = f"transactions-{shop}-{request.GET.get('from', 'all')}-{request.GET.get('to', 'now')}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@require_GET
+def get_stats(request):
+    """
+    Dashboard aggregates from the daily rollups
+
+    GET /api/terminal/stats?shop=store.myshopify.com&days=30
+    """
+    shop = request.GET.get('shop', '')
+
+    if not shop:
+        return JsonResponse({
+            'success': False,
+            'error': 'shop parameter is required'
+        }, status=400)
+
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 0
+    if not 1 <= days <= 366:
+        return JsonResponse({
+            'success': False,
+            'error': 'days must be an integer between 1 and 366'
+        }, status=400)
+
+    return JsonResponse({
+        'success': True,
+        **shop_stats(shop, days)
+    })
+
+
 # =============================================================
 # POS EXTENSION VIEWS (EXISTING)
 # =============================================================
 
 @csrf_exempt
 # @require_http_methods(["POST"])
+@idempotent
+@sharded
 def start_transaction(request):
     """
     Start a new transaction on Pin Vandaag terminal
 
     POST /api/terminal/start
+    Header (optional): Idempotency-Key: <unique key per payment attempt>
     Body: {
         "shopDomain": "store.myshopify.com",
         "locationId": "123",
@@ -117,6 +217,8 @@ def start_transaction(request):
                 'error': 'amount is required'
             }, status=400)
 
+        bind_shop(shop_domain)
+
         # Validate amount is an integer
         try:
             amount = int(amount)
@@ -134,8 +236,8 @@ def start_transaction(request):
 
         logger.info(f"Starting transaction for shop_domain={shop_domain}, amount={amount}")
 
-        # Find terminal
-        terminal = find_terminal(
+        # Find terminals, best match first
+        candidates = find_terminal_candidates(
             shop_domain=shop_domain,
             location_id=location_id,
             staff_member_id=staff_member_id,
@@ -143,7 +245,7 @@ def start_transaction(request):
             shop_id=shop_id
         )
 
-        if not terminal:
+        if not candidates:
             logger.warning(f"No matching terminal found for shop_domain={shop_domain}")
             return JsonResponse({
                 'success': False,
@@ -151,46 +253,53 @@ def start_transaction(request):
             }, status=404)
 
         # Check if demo mode
-        if terminal.is_demo:
+        if candidates[0].is_demo:
             import time
+            terminal = candidates[0]
             transaction_id = f"demo-{int(time.time())}"
             logger.info(f"Demo mode: generated transaction_id={transaction_id}")
         else:
-            # Call Pin Vandaag API
-            service = PinVandaagService()
-            try:
-                result = service.start_transaction(
-                    terminal_id=terminal.terminal_id,
-                    api_key=terminal.api_key,
-                    amount=amount
-                )
-                transaction_id = result.get('transaction_id')
-                # Log the full response to debug
-                logger.info(f"Pin Vandaag FULL response: {result}")
-                logger.info(f"Response type: {type(result)}")
-                logger.info(f"Response keys: {result.keys() if isinstance(result, dict) else 'not a dict'}")
-
-                # Also try alternative key names
-                if not transaction_id:
-                    transaction_id = result.get('transaction_id') or result.get('TransactionId') or result.get('id')
-                    if transaction_id:
-                        logger.info(f"Found transaction_id using alternative key: {transaction_id}")
-
-                # Validate we got a transaction ID
-                if not transaction_id:
-                    logger.error(f"Pin Vandaag did not return transactionId. Full response: {result}")
-                    error_msg = result.get('error') or result.get('message') or result.get('errorMsg') or 'Terminal did not return transaction ID'
+            # Terminals the prober found offline are not tried at all
+            online = [candidate for candidate in candidates if not is_offline(candidate)]
+            if not online:
+                logger.warning(f"All matching terminals are offline for shop_domain={shop_domain}")
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Payment terminal offline'
+                }, status=503)
+
+            # Take the first idle terminal, healthy ones first; a terminal runs
+            # one payment at a time, so busy ones are skipped instead of queueing
+            terminal = None
+            transaction_id = None
+            error_msg = None
+            active_transaction_id = None
+            for candidate in rank_by_health(online):
+                claimed, active = claim_terminal(candidate)
+                if not claimed:
+                    active_transaction_id = active_transaction_id or active
+                    continue
+                transaction_id, error_msg, failover = _start_upstream(candidate, amount)
+                if transaction_id:
+                    terminal = candidate
+                    break
+                if not failover:
+                    break
+                logger.warning(f"Terminal {candidate} failed to start, trying the next one")
+
+            if not terminal:
+                if error_msg:
                     return JsonResponse({
                         'success': False,
                         'error': error_msg
                     }, status=502)
-
-            except requests.RequestException as e:
-                logger.error(f"Pin Vandaag API error: {e}")
                 return JsonResponse({
                     'success': False,
-                    'error': 'Payment terminal unavailable'
-                }, status=502)
+                    'error': 'Terminal is busy with another payment',
+                    'active_transaction_id': active_transaction_id
+                }, status=409)
+
+            bind_transaction(terminal, transaction_id)
 
         # Create Transaction record
         transaction = Transaction.objects.create(
@@ -202,15 +311,23 @@ def start_transaction(request):
             location_id=location_id,
             staff_member_id=staff_member_id
         )
+        record_transition(transaction, None, 'started')
+        remember_transaction(transaction)
 
         logger.info(f"Transaction created: {transaction.transaction_id}")
 
         return JsonResponse({
             'success': True,
             'transaction_id': transaction.transaction_id,
+            'status_token': make_status_token(
+                terminal.pk, terminal.terminal_id, transaction.transaction_id, shop_domain
+            ),
             'status': 'started'
         }, status=200)
 
+    except BulkheadFull:
+        return bulkhead_full_response()
+
     except Exception as e:
         logger.exception(f"Unexpected error in start_transaction: {e}")
         return JsonResponse({
@@ -219,8 +336,76 @@ def start_transaction(request):
         }, status=500)
 
 
+def bulkhead_full_response():
+    """503 for a shop whose upstream slots are all taken"""
+    response = JsonResponse({
+        'success': False,
+        'error': 'Too many concurrent payment requests for this shop, retry shortly'
+    }, status=503)
+    response['Retry-After'] = str(settings.TERMINAL_BULKHEAD_RETRY_AFTER)
+    return response
+
+
+def _start_upstream(terminal, amount):
+    """
+    Start a payment on a claimed terminal
+
+    Reports the outcome to the health tracker and releases the claim when the
+    payment certainly did not start.
+
+    Returns:
+        tuple: (transaction_id, error_msg, failover); failover is True when
+        another terminal may be tried
+    """
+    service = PinVandaagService(shop_domain=terminal.shop_domain)
+    try:
+        result = service.start_transaction(
+            terminal_id=terminal.terminal_id,
+            api_key=terminal.api_key,
+            amount=amount,
+            callback_url=settings.TERMINAL_CALLBACK_URL or None
+        )
+    except BulkheadFull:
+        # Never reached Pin Vandaag, the terminal is still free
+        release_terminal(terminal.pk)
+        raise
+    except requests.RequestException as e:
+        logger.error(f"Pin Vandaag API error: {e}")
+        tracker.record_failure(terminal.pk)
+        # After a timeout the payment may still be running, so keep the claim
+        # until it expires and do not start a second payment elsewhere
+        if isinstance(e, requests.Timeout):
+            return None, 'Payment terminal unavailable', False
+        release_terminal(terminal.pk)
+        return None, 'Payment terminal unavailable', True
+
+    transaction_id = result.get('transaction_id')
+    # Log the full response to debug
+    logger.info(f"Pin Vandaag FULL response: {result}")
+    logger.info(f"Response type: {type(result)}")
+    logger.info(f"Response keys: {result.keys() if isinstance(result, dict) else 'not a dict'}")
+
+    # Also try alternative key names
+    if not transaction_id:
+        transaction_id = result.get('transaction_id') or result.get('TransactionId') or result.get('id')
+        if transaction_id:
+            logger.info(f"Found transaction_id using alternative key: {transaction_id}")
+
+    # Validate we got a transaction ID
+    if not transaction_id:
+        logger.error(f"Pin Vandaag did not return transactionId. Full response: {result}")
+        error_msg = result.get('error') or result.get('message') or result.get('errorMsg') or 'Terminal did not return transaction ID'
+        tracker.record_failure(terminal.pk)
+        release_terminal(terminal.pk)
+        return None, error_msg, True
+
+    tracker.record_success(terminal.pk)
+    return transaction_id, None, False
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
+@sharded
 def get_transaction_status(request):
     """
     Get status of a transaction
@@ -234,6 +419,7 @@ def get_transaction_status(request):
         "shopId": "012",
         "transaction_id": "2405102"
     }
+    or, skipping routing: {"status_token": "<status_token from /start>"}
     """
     try:
         # Parse request body
@@ -246,6 +432,18 @@ def get_transaction_status(request):
                 'error': 'Invalid JSON'
             }, status=400)
 
+        # A status token from /start identifies shop, terminal and transaction
+        claims = None
+        if data.get('status_token'):
+            claims = check_status_token(data['status_token'])
+            if claims is None:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Invalid or expired status_token'
+                }, status=401)
+            data['shopDomain'] = claims['shop_domain']
+            data['transaction_id'] = claims['transaction_id']
+
         # Validate required fields
         shop_domain = data.get('shopDomain')
         transaction_id = data.get('transaction_id')
@@ -262,22 +460,73 @@ def get_transaction_status(request):
                 'error': 'transaction_id is required'
             }, status=400)
 
+        bind_shop(shop_domain)
+
         # Extract optional fields
         location_id = data.get('locationId')
         staff_member_id = data.get('staffMemberId')
         user_id = data.get('userId')
         shop_id = data.get('shopId')
+        device_id = request.headers.get(DEVICE_HEADER) or data.get('deviceId')
+
+        # Polls faster than the allowed rate get the last known status
+        allowed, retry_after, scope = check_poll(transaction_id, shop_domain, device_id)
+        if not allowed:
+            logger.info(f"Throttled {scope} poll for transaction_id={transaction_id}")
+            return throttled_status_response(transaction_id, shop_domain, retry_after)
+
+        try:
+            wait_seconds = min(float(data.get('waitMs') or 0) / 1000, settings.TERMINAL_STATUS_MAX_WAIT_SECONDS)
+        except (TypeError, ValueError):
+            return JsonResponse({
+                'success': False,
+                'error': 'waitMs must be a number'
+            }, status=400)
 
         logger.info(f"Getting status for transaction_id={transaction_id}")
 
-        # Find terminal
-        terminal = find_terminal(
-            shop_domain=shop_domain,
-            location_id=location_id,
-            staff_member_id=staff_member_id,
-            user_id=user_id,
-            shop_id=shop_id
-        )
+        # Read the version before the row, so a push in between still wakes us
+        seen_version = notify_version(transaction_id)
+
+        # Running payments are found in shared memory; the row is only read
+        # once Pin Vandaag reports a change
+        if not wait_seconds:
+            open_transaction, terminal = lookup_open_transaction(transaction_id, shop_domain, claims)
+            if open_transaction:
+                return poll_open_transaction(open_transaction, terminal, transaction_id, shop_domain)
+
+        # Only the polling shop's row: another shop's row must never be updated from this poll
+        transaction = lookup_transaction(transaction_id, shop_domain, claims)
+
+        # With callbacks configured the client may wait for the pushed result
+        if (transaction and wait_seconds > 0 and settings.TERMINAL_CALLBACK_URL
+                and transaction.status not in Transaction.FINAL_STATUSES):
+            if wait_for_change(transaction_id, seen_version, wait_seconds):
+                transaction.refresh_from_db()
+
+        # Final or pushed results are authoritative, Pin Vandaag is not asked again
+        if transaction and (transaction.status in Transaction.FINAL_STATUSES or transaction.pushed_at):
+            return JsonResponse(stored_status(transaction, shop_domain), status=200)
+
+        # Poll the terminal that started the payment; routing may have picked
+        # another terminal at the location than find_terminal would now
+        if claims:
+            terminal = terminal_links.get(claims['terminal_link_id'])
+            if terminal and transaction and transaction.terminal_link_id == terminal.pk:
+                transaction.terminal_link = terminal
+            if terminal:
+                # The payment runs where it was started, even if the link was re-pointed since
+                terminal.terminal_id = claims['terminal_id']
+        elif transaction and transaction.terminal_link:
+            terminal = transaction.terminal_link
+        else:
+            terminal = find_terminal(
+                shop_domain=shop_domain,
+                location_id=location_id,
+                staff_member_id=staff_member_id,
+                user_id=user_id,
+                shop_id=shop_id
+            )
 
         if not terminal:
             logger.warning(f"No matching terminal found for shop_domain={shop_domain}")
@@ -286,94 +535,305 @@ def get_transaction_status(request):
                 'error': 'No matching terminal found'
             }, status=404)
 
-        # Call Pin Vandaag API
         # Check if demo mode
         if terminal.is_demo:
             # Demo: return success after transaction exists for 3+ seconds
-            try:
-                tx = Transaction.objects.get(transaction_id=transaction_id)
-                elapsed = (timezone.now() - tx.created_at).total_seconds()
-                if elapsed < 3:
-                    return JsonResponse({
-                        'success': True,
-                        'status': 'waiting'
-                    })
-                else:
-                    tx.status = 'success'
-                    tx.save()
-                    return JsonResponse({
-                        'success': True,
-                        'status': 'success'
-                    })
-            except Transaction.DoesNotExist:
+            if not transaction:
                 return JsonResponse({
                     'success': False,
                     'error': 'Transaction not found'
                 }, status=404)
-        else:
-            # Call Pin Vandaag API
-            service = PinVandaagService()
-            try:
-                result = service.get_status(
-                    terminal_id=terminal.terminal_id,
-                    api_key=terminal.api_key,
-                    transaction_id=transaction_id
-                )
-            except requests.RequestException as e:
-                logger.error(f"Pin Vandaag API error: {e}")
+            elapsed = (timezone.now() - transaction.created_at).total_seconds()
+            if elapsed < 3:
                 return JsonResponse({
-                    'success': False,
-                    'error': 'Payment terminal unavailable'
-                }, status=502)
-
-        # Extract the actual payment status from nested response
-        # Pin Vandaag returns: {'status': 'success', 'transaction': {'status': 'unknown/success/failed', ...}}
-        # The top-level 'status' means "API call succeeded", not payment status
-        payment_status = 'started'
-        error_msg = None
-        receipt = None
-
-        if 'transaction' in result:
-            tx_data = result['transaction']
-            payment_status = tx_data.get('status', 'started')
-            error_msg = tx_data.get('error_msg') or tx_data.get('errorMsg')
-            receipt = tx_data.get('receipt')
-            logger.info(f"Extracted payment status from transaction: {payment_status}")
-        elif 'worldline' in result:
-            wl_data = result['worldline']
-            payment_status = wl_data.get('status', 'started')
-            logger.info(f"Extracted payment status from worldline: {payment_status}")
-        else:
-            # Fallback to old behavior for backwards compatibility
-            payment_status = result.get('status', 'started')
-            error_msg = result.get('errorMsg')
-            receipt = result.get('receipt')
+                    'success': True,
+                    'status': 'waiting'
+                })
+            apply_status_update(transaction, 'success')
+            return JsonResponse({
+                'success': True,
+                'status': 'success'
+            })
 
-        # Map 'unknown' status to 'started' (still waiting)
-        if payment_status == 'unknown':
-            payment_status = 'started'
+        # Call Pin Vandaag API
+        fetched = fetch_upstream_status(terminal, shop_domain, transaction_id)
+        if fetched is None:
+            return terminal_unavailable_response()
+        payment_status, error_msg, receipt = fetched
 
         # Update Transaction record
-        try:
-            transaction = Transaction.objects.get(transaction_id=transaction_id)
-            transaction.status = payment_status
-            transaction.error_msg = error_msg
-            transaction.receipt = receipt
-            transaction.save()
+        receipt_url = None
+        if transaction:
+            apply_status_update(transaction, payment_status, error_msg, receipt)
+            if receipt is not None:
+                receipt_url = receipt_url_for(transaction_id, shop_domain, TransactionReceipt.digest_of(receipt))
             logger.info(f"Transaction updated: {transaction_id} -> {payment_status}")
-        except Transaction.DoesNotExist:
+        else:
             logger.warning(f"Transaction {transaction_id} not found in database")
 
+        # The receipt itself is served by get_receipt, polls only carry a reference
         return JsonResponse({
             'success': True,
             'status': payment_status,
             'error_msg': error_msg,
-            'receipt': receipt
+            'receipt_url': receipt_url,
+            'next_poll_ms': poll_hint(
+                payment_status,
+                transaction.terminal_link_id if transaction else terminal.pk,
+                transaction.created_at if transaction else None
+            )
         }, status=200)
 
+    except BulkheadFull:
+        return bulkhead_full_response()
+
     except Exception as e:
         logger.exception(f"Unexpected error in get_transaction_status: {e}")
         return JsonResponse({
             'success': False,
             'error': 'Internal server error'
         }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def transaction_callback(request):
+    """
+    Pushed transaction result from Pin Vandaag
+
+    POST /api/terminal/callback
+    Headers: X-Callback-Timestamp, X-Callback-Signature (see terminal/callbacks.py)
+    Body: {
+        "transactionId": "2405102",
+        "status": "success",
+        "terminal": "50303253",
+        "errorMsg": null,
+        "receipt": "..."
+    }
+    """
+    if not verify_callback(request.body, request.headers.get(TIMESTAMP_HEADER),
+                           request.headers.get(SIGNATURE_HEADER)):
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=401)
+
+    try:
+        payload = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON'
+        }, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({
+            'success': False,
+            'error': 'Callback body must be an object'
+        }, status=400)
+
+    try:
+        transaction, applied = apply_callback(payload)
+    except CallbackError as e:
+        logger.warning(f"Callback rejected: {e}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+
+    return JsonResponse({
+        'success': True,
+        'status': transaction.status,
+        'applied': applied
+    }, status=200)
+
+
+def fetch_upstream_status(terminal, shop_domain, transaction_id):
+    """
+    Ask Pin Vandaag for the status of a transaction on `terminal`
+
+    Returns:
+        tuple: (payment_status, error_msg, receipt), or None if the terminal
+        could not be reached (reported to the health tracker)
+    """
+    service = PinVandaagService(shop_domain=shop_domain)
+    try:
+        result = service.get_status(
+            terminal_id=terminal.terminal_id,
+            api_key=terminal.api_key,
+            transaction_id=transaction_id
+        )
+    except requests.RequestException as e:
+        logger.error(f"Pin Vandaag API error: {e}")
+        tracker.record_failure(terminal.pk)
+        return None
+    tracker.record_success(terminal.pk)
+    return parse_status_response(result)
+
+
+def terminal_unavailable_response():
+    return JsonResponse({
+        'success': False,
+        'error': 'Payment terminal unavailable'
+    }, status=502)
+
+
+def poll_open_transaction(open_transaction, terminal, transaction_id, shop_domain):
+    """
+    Status poll of a running payment found in shared memory
+
+    An unchanged 'started' is answered without touching the database; any
+    other result is applied to the row like a regular poll.
+    """
+    fetched = fetch_upstream_status(terminal, shop_domain, transaction_id)
+    if fetched is None:
+        return terminal_unavailable_response()
+    payment_status, error_msg, receipt = fetched
+
+    receipt_url = None
+    if payment_status != 'started' or error_msg or receipt is not None:
+        transaction = Transaction.objects.filter(pk=open_transaction.pk).first()
+        if transaction:
+            if transaction.terminal_link_id == terminal.pk:
+                transaction.terminal_link = terminal
+            apply_status_update(transaction, payment_status, error_msg, receipt)
+            if receipt is not None:
+                receipt_url = receipt_url_for(transaction_id, shop_domain, TransactionReceipt.digest_of(receipt))
+            logger.info(f"Transaction updated: {transaction_id} -> {payment_status}")
+
+    return JsonResponse({
+        'success': True,
+        'status': payment_status,
+        'error_msg': error_msg,
+        'receipt_url': receipt_url,
+        'next_poll_ms': poll_hint(payment_status, open_transaction.terminal_link_id, open_transaction.created_at)
+    }, status=200)
+
+
+def lookup_open_transaction(transaction_id, shop_domain, claims=None):
+    """
+    A running payment and its terminal, from shared memory and the link cache
+
+    Args:
+        transaction_id: Polled transaction
+        shop_domain: Polling shop
+        claims: Verified status token claims, if the poll carried one
+
+    Returns:
+        tuple: (OpenTransaction, TerminalLinks), or (None, None) if the row must be read
+    """
+    open_transaction = find_open_transaction(transaction_id, shop_domain)
+    if open_transaction:
+        terminal = terminal_links.get(open_transaction.terminal_link_id)
+        if terminal and not terminal.is_demo:
+            if claims:
+                terminal.terminal_id = claims['terminal_id']
+            return open_transaction, terminal
+    return None, None
+
+
+def lookup_transaction(transaction_id, shop_domain, claims=None):
+    """Shop's transaction row of a status poll; the terminal link is joined unless a status token names it"""
+    transactions = Transaction.objects.filter(transaction_id=transaction_id, shop_domain=shop_domain)
+    if not claims:
+        transactions = transactions.select_related('terminal_link')
+    return transactions.first()
+
+
+def poll_hint(status, terminal_link_id, created_at):
+    """Milliseconds until the POS should poll again, None once the status is final"""
+    if status in Transaction.FINAL_STATUSES:
+        return None
+    elapsed_ms = (timezone.now() - created_at).total_seconds() * 1000 if created_at else 0
+    return next_poll_ms(terminal_link_id, elapsed_ms)
+
+
+def stored_status(transaction, shop_domain):
+    """Status response body from the stored row"""
+    receipt_digest = TransactionReceipt.objects.filter(pk=transaction.pk).values_list('digest', flat=True).first()
+    return {
+        'success': True,
+        'status': transaction.status,
+        'error_msg': transaction.error_msg,
+        'receipt_url': receipt_url_for(transaction.transaction_id, shop_domain, receipt_digest) if receipt_digest else None,
+        'next_poll_ms': poll_hint(transaction.status, transaction.terminal_link_id, transaction.created_at)
+    }
+
+
+def throttled_status_response(transaction_id, shop_domain, retry_after):
+    """Last stored status of a transaction, without asking Pin Vandaag"""
+    open_transaction = find_open_transaction(transaction_id, shop_domain)
+    if open_transaction:
+        stored = ('started', None, None, open_transaction.terminal_link_id, open_transaction.created_at)
+    else:
+        stored = Transaction.objects.filter(
+            transaction_id=transaction_id, shop_domain=shop_domain
+        ).values_list('status', 'error_msg', 'receipt_record__digest', 'terminal_link_id', 'created_at').first()
+
+    if stored is None:
+        response = JsonResponse({
+            'success': False,
+            'error': 'Polling too fast'
+        }, status=429)
+    else:
+        status, error_msg, receipt_digest, terminal_link_id, created_at = stored
+        hint = poll_hint(status, terminal_link_id, created_at)
+        response = JsonResponse({
+            'success': True,
+            'status': status,
+            'error_msg': error_msg,
+            'receipt_url': receipt_url_for(transaction_id, shop_domain, receipt_digest) if receipt_digest else None,
+            'next_poll_ms': max(hint, int(retry_after * 1000)) if hint is not None else None,
+            'throttled': True
+        }, status=200)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def receipt_url_for(transaction_id, shop_domain, digest):
+    """URL of a receipt, versioned by its digest so a replaced receipt gets a new URL"""
+    query = urlencode({'shop': shop_domain, 'v': digest[:RECEIPT_VERSION_LENGTH]})
+    return f"{reverse('get_receipt', args=[transaction_id])}?{query}"
+
+
+@require_GET
+@sharded
+def get_receipt(request, transaction_id):
+    """
+    Serve the receipt of a transaction
+
+    GET /api/terminal/receipt/<transaction_id>?shop=store.myshopify.com
+
+    The response carries a strong ETag (sha256 of the text). A receipt can
+    still be replaced by a later status, so only the URL versioned with the
+    current digest (`v`, see receipt_url_for) may be cached forever; other
+    requests must revalidate.
+    """
+    shop = request.GET.get('shop', '')
+
+    if not shop:
+        return JsonResponse({
+            'success': False,
+            'error': 'shop parameter is required'
+        }, status=400)
+
+    bind_shop(shop)
+    receipts = TransactionReceipt.objects.filter(
+        transaction__transaction_id=transaction_id,
+        transaction__shop_domain=shop
+    ).order_by('-pk')
+
+    # Answer revalidations from the digest alone, without loading the blob
+    digest = receipts.values_list('digest', flat=True).first()
+    if digest is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Receipt not found'
+        }, status=404)
+
+    etag = f'"{digest}"'
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        receipt = receipts.only('data').first()
+        response = HttpResponse(receipt.text, content_type='text/plain; charset=utf-8')
+
+    response['ETag'] = etag
+    if request.GET.get('v') == digest[:RECEIPT_VERSION_LENGTH]:
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
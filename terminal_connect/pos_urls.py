@@ -0,0 +1,13 @@
+"""
+URL configuration of the lean POS pipeline (see POS_MIDDLEWARE)
+
+Only the machine-to-machine endpoints live here; everything else is served
+by ROOT_URLCONF with the full middleware stack.
+"""
+from django.urls import include, path
+
+from terminal.urls import pos_urlpatterns
+
+urlpatterns = [
+    path('api/terminal/', include(pos_urlpatterns)),
+]
@@ -6,6 +6,7 @@ from pathlib import Path
 import os
 from dotenv import load_dotenv
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 # Load environment variables
 load_dotenv()
@@ -35,6 +36,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'terminal.middleware.AdmissionMiddleware',
+    'terminal.middleware.ReplicaRoutingMiddleware',
+    'terminal.middleware.ProfilingMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -47,6 +51,19 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'terminal_connect.urls'
 
+# Lean pipeline for the machine-to-machine endpoints (POS, callbacks, webhooks):
+# no sessions, auth, messages, CSRF or clickjacking middleware. Used by the
+# WSGI application in terminal_connect/wsgi.py for paths POS_URLCONF resolves.
+TERMINAL_LEAN_POS_PIPELINE = os.getenv('TERMINAL_LEAN_POS_PIPELINE', 'True') == 'True'
+POS_URLCONF = 'terminal_connect.pos_urls'
+POS_MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'terminal.middleware.AdmissionMiddleware',
+    'terminal.middleware.TimingMiddleware',
+    'terminal.middleware.ProfilingMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -72,6 +89,39 @@ DATABASES = {
     )
 }
 
+# 'single': everything on DATABASES['default']. 'replica': read-only dashboard,
+# export, stats and admin requests read from DATABASE_REPLICA_URL (see
+# terminal/db_routers.py); clients that just wrote stay on the primary for
+# TERMINAL_REPLICA_STICKY_SECONDS.
+TERMINAL_DATABASE_MODE = os.getenv('TERMINAL_DATABASE_MODE', 'single')
+TERMINAL_REPLICA_STICKY_SECONDS = int(os.getenv('TERMINAL_REPLICA_STICKY_SECONDS', '10'))
+DATABASE_ROUTERS = []
+if TERMINAL_DATABASE_MODE == 'replica':
+    DATABASES['replica'] = dj_database_url.parse(os.environ['DATABASE_REPLICA_URL'], conn_max_age=600)
+    DATABASE_ROUTERS.append('terminal.db_routers.ReplicaRouter')
+
+# Shop-hash sharding (see terminal/shards.py): comma-separated URLs of extra
+# databases. Each shop's terminal links, transactions and derived rows live
+# on 'default' or one of 'shard_1'..'shard_N', picked by a hash of the shop
+# domain; run `manage.py migrate --database shard_N` for each and
+# `manage.py rebalance_shards` after changing the list.
+TERMINAL_SHARD_URLS = [url.strip() for url in os.getenv('TERMINAL_SHARD_URLS', '').split(',') if url.strip()]
+TERMINAL_SHARD_ALIASES = ['default']
+for index, url in enumerate(TERMINAL_SHARD_URLS, start=1):
+    DATABASES[f'shard_{index}'] = dj_database_url.parse(url, conn_max_age=600)
+    TERMINAL_SHARD_ALIASES.append(f'shard_{index}')
+if TERMINAL_SHARD_URLS:
+    if TERMINAL_DATABASE_MODE == 'replica':
+        raise ImproperlyConfigured('TERMINAL_SHARD_URLS cannot be combined with TERMINAL_DATABASE_MODE=replica')
+    # Id ranges are reserved through the SQLite/PostgreSQL sequences (terminal.shards.reserve_id_ranges)
+    for alias in TERMINAL_SHARD_ALIASES:
+        engine = DATABASES[alias]['ENGINE']
+        if engine.rsplit('.', 1)[-1] not in ('sqlite3', 'postgresql', 'postgis'):
+            raise ImproperlyConfigured(f'Sharding supports SQLite and PostgreSQL databases, {alias} uses {engine}')
+    DATABASE_ROUTERS.insert(0, 'terminal.shards.ShardRouter')
+# Shard N hands out primary keys from N * spacing, keeping ids unique across shards
+TERMINAL_SHARD_ID_SPACING = int(os.getenv('TERMINAL_SHARD_ID_SPACING', str(2 ** 40)))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -98,9 +148,132 @@ CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_METHODS = ['GET', 'POST', 'OPTIONS']
 CORS_ALLOW_HEADERS = ['*']
 
+# Django cache, used when TERMINAL_CACHE_BACKEND is 'django'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
 # Pin Vandaag API Configuration
 PIN_VANDAAG_BASE_URL = os.getenv('PIN_VANDAAG_BASE_URL', 'https://rest-api.pinvandaag.com/V2')
 
+# Idempotency-Key replay store for /start, kept in TERMINAL_CACHE_BACKEND; only
+# 'sqlite' or 'django' dedupe retries that reach another worker
+TERMINAL_IDEMPOTENCY_MAX_ENTRIES = int(os.getenv('TERMINAL_IDEMPOTENCY_MAX_ENTRIES', '10000'))
+TERMINAL_IDEMPOTENCY_TTL = int(os.getenv('TERMINAL_IDEMPOTENCY_TTL', '3600'))
+# How long a duplicate waits for the in-flight original (upstream timeout is 30s)
+TERMINAL_IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('TERMINAL_IDEMPOTENCY_WAIT_SECONDS', '35'))
+# Worker processes per host (gunicorn reads the same variable)
+TERMINAL_WEB_WORKERS = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+# A terminal claimed by a start is considered free again after this many seconds
+TERMINAL_OCCUPANCY_TTL = int(os.getenv('TERMINAL_OCCUPANCY_TTL', '300'))
+
+# A terminal with this many Pin Vandaag errors within the window is tried last
+TERMINAL_UNHEALTHY_ERRORS = int(os.getenv('TERMINAL_UNHEALTHY_ERRORS', '3'))
+TERMINAL_ERROR_WINDOW_SECONDS = int(os.getenv('TERMINAL_ERROR_WINDOW_SECONDS', '120'))
+
+# Health probes (`manage.py probe_terminals`): a terminal whose latest check
+# within TERMINAL_HEALTH_MAX_AGE_SECONDS failed is offline and not routed to
+TERMINAL_PROBE_TIMEOUT = float(os.getenv('TERMINAL_PROBE_TIMEOUT', '5'))
+TERMINAL_HEALTH_MAX_AGE_SECONDS = int(os.getenv('TERMINAL_HEALTH_MAX_AGE_SECONDS', '120'))
+TERMINAL_HEALTH_CACHE_SECONDS = int(os.getenv('TERMINAL_HEALTH_CACHE_SECONDS', '10'))
+TERMINAL_HEALTH_CACHE_MAX_ENTRIES = int(os.getenv('TERMINAL_HEALTH_CACHE_MAX_ENTRIES', '10000'))
+TERMINAL_HEALTH_RETENTION_DAYS = int(os.getenv('TERMINAL_HEALTH_RETENTION_DAYS', '7'))
+
+# Upstream bulkheads: concurrent Pin Vandaag calls per shop and per API key,
+# shared by all workers on a host through lock files in TERMINAL_BULKHEAD_DIR
+TERMINAL_BULKHEAD_ENABLED = os.getenv('TERMINAL_BULKHEAD_ENABLED', 'True') == 'True'
+TERMINAL_BULKHEAD_SHOP_SLOTS = int(os.getenv('TERMINAL_BULKHEAD_SHOP_SLOTS', '4'))
+TERMINAL_BULKHEAD_KEY_SLOTS = int(os.getenv('TERMINAL_BULKHEAD_KEY_SLOTS', '4'))
+# Health probes use slots of their own per shop, never the payment slots above
+TERMINAL_BULKHEAD_PROBE_SLOTS = int(os.getenv('TERMINAL_BULKHEAD_PROBE_SLOTS', '2'))
+# How long a request waits for a free slot before it gets a 503
+TERMINAL_BULKHEAD_QUEUE_SECONDS = float(os.getenv('TERMINAL_BULKHEAD_QUEUE_SECONDS', '2'))
+TERMINAL_BULKHEAD_RETRY_AFTER = int(os.getenv('TERMINAL_BULKHEAD_RETRY_AFTER', '2'))
+TERMINAL_BULKHEAD_DIR = os.getenv('TERMINAL_BULKHEAD_DIR', '/tmp/terminal-bulkheads')
+
+# Host-local shared memory (throttle buckets, metrics), shared by all workers
+TERMINAL_SHARED_MEMORY_DIR = os.getenv('TERMINAL_SHARED_MEMORY_DIR', '/tmp/terminal-shm')
+
+# Cache for routing, terminal links and idempotency (terminal/cache.py):
+# 'local' (per process), 'sqlite' (file shared by the host's workers) or
+# 'django' (CACHES[TERMINAL_CACHE_ALIAS], e.g. Redis via REDIS_URL)
+TERMINAL_CACHE_BACKEND = os.getenv('TERMINAL_CACHE_BACKEND', 'local')
+TERMINAL_CACHE_PATH = os.getenv('TERMINAL_CACHE_PATH', os.path.join(TERMINAL_SHARED_MEMORY_DIR, 'cache.sqlite3'))
+TERMINAL_CACHE_ALIAS = os.getenv('TERMINAL_CACHE_ALIAS', 'default')
+# How long one worker may hold a key's recompute lock
+TERMINAL_CACHE_LOCK_SECONDS = float(os.getenv('TERMINAL_CACHE_LOCK_SECONDS', '5'))
+# Terminal links per shop used by /start routing
+TERMINAL_ROUTING_CACHE_SECONDS = int(os.getenv('TERMINAL_ROUTING_CACHE_SECONDS', '60'))
+
+# Status poll throttling: per transaction one poll per interval (with a burst),
+# per POS device a rate in polls per second
+TERMINAL_THROTTLE_ENABLED = os.getenv('TERMINAL_THROTTLE_ENABLED', 'True') == 'True'
+TERMINAL_THROTTLE_SLOTS = int(os.getenv('TERMINAL_THROTTLE_SLOTS', '65536'))
+TERMINAL_POLL_INTERVAL_SECONDS = float(os.getenv('TERMINAL_POLL_INTERVAL_SECONDS', '1'))
+TERMINAL_POLL_BURST = int(os.getenv('TERMINAL_POLL_BURST', '3'))
+TERMINAL_DEVICE_POLLS_PER_SECOND = float(os.getenv('TERMINAL_DEVICE_POLLS_PER_SECOND', '4'))
+TERMINAL_DEVICE_POLL_BURST = int(os.getenv('TERMINAL_DEVICE_POLL_BURST', '10'))
+
+# Open transactions kept in shared memory for status polls (terminal/open_transactions.py)
+TERMINAL_OPEN_TRANSACTION_SLOTS = int(os.getenv('TERMINAL_OPEN_TRANSACTION_SLOTS', '16384'))
+
+# Next-poll hints: per-terminal completion-time sketches decay with this
+# half-life; hints never exceed TERMINAL_POLL_MAX_MS
+TERMINAL_COMPLETION_SKETCH_SLOTS = int(os.getenv('TERMINAL_COMPLETION_SKETCH_SLOTS', '16384'))
+TERMINAL_COMPLETION_HALF_LIFE_HOURS = float(os.getenv('TERMINAL_COMPLETION_HALF_LIFE_HOURS', '24'))
+TERMINAL_POLL_MAX_MS = int(os.getenv('TERMINAL_POLL_MAX_MS', '5000'))
+
+# Pushed results: start requests send TERMINAL_CALLBACK_URL as CallbackUrl, and
+# callbacks must be signed with TERMINAL_CALLBACK_SECRET (see terminal/callbacks.py)
+TERMINAL_CALLBACK_URL = os.getenv('TERMINAL_CALLBACK_URL', '')
+TERMINAL_CALLBACK_SECRET = os.getenv('TERMINAL_CALLBACK_SECRET', '')
+TERMINAL_CALLBACK_MAX_SKEW_SECONDS = int(os.getenv('TERMINAL_CALLBACK_MAX_SKEW_SECONDS', '300'))
+# Upper bound for a status request waiting for a pushed result (`waitMs`)
+TERMINAL_STATUS_MAX_WAIT_SECONDS = float(os.getenv('TERMINAL_STATUS_MAX_WAIT_SECONDS', '20'))
+# Records of the shared version table that wakes waiting requests (terminal/notify.py)
+TERMINAL_NOTIFY_SLOTS = int(os.getenv('TERMINAL_NOTIFY_SLOTS', '65536'))
+
+# Status tokens returned by /start stay valid this long; terminal links they
+# point at are cached per process for TERMINAL_LINK_CACHE_SECONDS
+TERMINAL_STATUS_TOKEN_MAX_AGE = int(os.getenv('TERMINAL_STATUS_TOKEN_MAX_AGE', '3600'))
+TERMINAL_LINK_CACHE_SECONDS = int(os.getenv('TERMINAL_LINK_CACHE_SECONDS', '60'))
+TERMINAL_LINK_CACHE_MAX_ENTRIES = int(os.getenv('TERMINAL_LINK_CACHE_MAX_ENTRIES', '10000'))
+
+# Admission control: in-flight requests on the host are counted per priority;
+# dashboard/admin/exports are shed (503) once the total reaches LOW_SHARE of the
+# capacity, other non-payment traffic at NORMAL_SHARE, payments never. Set the
+# capacity to workers x threads.
+TERMINAL_ADMISSION_ENABLED = os.getenv('TERMINAL_ADMISSION_ENABLED', 'True') == 'True'
+TERMINAL_ADMISSION_CAPACITY = int(os.getenv('TERMINAL_ADMISSION_CAPACITY', '16'))
+TERMINAL_ADMISSION_LOW_SHARE = float(os.getenv('TERMINAL_ADMISSION_LOW_SHARE', '0.5'))
+TERMINAL_ADMISSION_NORMAL_SHARE = float(os.getenv('TERMINAL_ADMISSION_NORMAL_SHARE', '0.8'))
+TERMINAL_ADMISSION_RETRY_AFTER = int(os.getenv('TERMINAL_ADMISSION_RETRY_AFTER', '5'))
+TERMINAL_ADMISSION_MAX_WORKERS = int(os.getenv('TERMINAL_ADMISSION_MAX_WORKERS', '256'))
+
+# Transactions still 'started' after this many seconds are swept to 'timeout'
+TERMINAL_STALE_TRANSACTION_SECONDS = int(os.getenv('TERMINAL_STALE_TRANSACTION_SECONDS', '900'))
+
+# Transactions older than this are moved out by `manage.py archive_transactions`
+TERMINAL_TRANSACTION_RETENTION_DAYS = int(os.getenv('TERMINAL_TRANSACTION_RETENTION_DAYS', '365'))
+
+# Diagnostics
+# Tokens minted by `manage.py diagnostics_token` expire after this many seconds
+TERMINAL_DIAGNOSTICS_TOKEN_MAX_AGE = int(os.getenv('TERMINAL_DIAGNOSTICS_TOKEN_MAX_AGE', '3600'))
+
+# On-demand request profiling (see terminal.middleware.ProfilingMiddleware)
+TERMINAL_PROFILING_ENABLED = os.getenv('TERMINAL_PROFILING_ENABLED', 'False') == 'True'
+TERMINAL_PROFILE_DIR = os.getenv('TERMINAL_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+# 'auto' uses pyinstrument (sampling) when installed, cProfile otherwise
+TERMINAL_PROFILER = os.getenv('TERMINAL_PROFILER', 'auto')
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
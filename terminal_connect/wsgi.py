@@ -2,6 +2,7 @@
 WSGI config for terminal_connect project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+POS endpoints get a lean middleware stack, see terminal/handlers.py.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/wsgi/
@@ -9,8 +10,8 @@ https://docs.djangoproject.com/en/6.0/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'terminal_connect.settings')
 
+from terminal.handlers import get_wsgi_application  # noqa: E402
+
 application = get_wsgi_application()